@@ -1,30 +1,74 @@
 # Blueprint Generator - Enhanced Context & Features (v5 - Deployment Target Added)
 # Left: Tabs (Setup, Modules, Preview/Gen) | Right: Options (Design, AI, Gen)
 
+import time
+_IMPORT_STARTED = time.perf_counter() # Start of module import, reported by `profile-startup`
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox, scrolledtext
 import os
+import sys
 import json
+import copy
+import csv
+import io
+import argparse
+import contextlib
 import threading
 import importlib.util
 import subprocess
+import hashlib
+import tempfile
+import math
+import random
+import itertools
+import queue
+import logging
+import re
+import stat
+import bisect
+import zipfile
 from abc import ABC, abstractmethod
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait as wait_futures
 # import uuid # Keep integer IDs for simplicity with Treeview iid
 
 # --- AI Library Imports & Checks ---
-openai_available = importlib.util.find_spec("openai") is not None
-gemini_available = importlib.util.find_spec("google.generativeai") is not None
+# The SDKs are heavy, so only their presence is checked here; _load_openai() / _load_gemini() import them on first use.
+STARTUP_TIMINGS = {"stdlib_imports": time.perf_counter() - _IMPORT_STARTED}
 
-if openai_available:
-    from openai import OpenAI, AuthenticationError, APIConnectionError, NotFoundError
-else:
-    OpenAI, AuthenticationError, APIConnectionError, NotFoundError = None, Exception, Exception, Exception
+def _sdk_installed(name: str) -> bool:
+    try: return importlib.util.find_spec(name) is not None
+    except (ImportError, ValueError): return False # e.g. parent package 'google' missing
 
-if gemini_available:
-    import google.generativeai as genai
-    from google.api_core import exceptions as google_exceptions
-else:
-    genai, google_exceptions = None, None
+openai_available = _sdk_installed("openai")
+gemini_available = _sdk_installed("google.generativeai")
+
+class _SdkNotLoaded(Exception):
+    """Placeholder for SDK exception classes until the SDK is imported (never raised, so it matches nothing)."""
+
+OpenAI, AuthenticationError, APIConnectionError, NotFoundError, OpenAIRateLimitError = None, _SdkNotLoaded, _SdkNotLoaded, _SdkNotLoaded, _SdkNotLoaded
+genai, google_exceptions = None, None
+_sdk_lock = threading.Lock()
+
+def _load_openai():
+    global OpenAI, AuthenticationError, APIConnectionError, NotFoundError, OpenAIRateLimitError
+    if OpenAI is not None: return
+    with _sdk_lock:
+        if OpenAI is not None: return
+        started = time.perf_counter()
+        from openai import AuthenticationError, APIConnectionError, NotFoundError, RateLimitError as OpenAIRateLimitError
+        from openai import OpenAI as client_class
+        OpenAI = client_class; STARTUP_TIMINGS["openai_sdk_import"] = time.perf_counter() - started
+
+def _load_gemini():
+    global genai, google_exceptions
+    if genai is not None: return
+    with _sdk_lock:
+        if genai is not None: return
+        started = time.perf_counter()
+        from google.api_core import exceptions as google_exceptions
+        import google.generativeai as sdk
+        genai = sdk; STARTUP_TIMINGS["gemini_sdk_import"] = time.perf_counter() - started
 
 
 # --- Configuration Data ---
@@ -37,109 +81,1481 @@ UI_LIBS = { "javascript": ["React", "Vue", "Angular", "Svelte", "SolidJS", "Prea
 STATE_MANAGEMENT = { "javascript": ["Redux", "Zustand", "Jotai", "Valtio", "Recoil", "Pinia (Vue)", "NgRx (Angular)", "Context API (React)", "None"], "typescript": ["Redux", "Zustand", "Jotai", "Valtio", "Recoil", "Pinia (Vue)", "NgRx (Angular)", "Context API (React)", "None"], "dart": ["Provider", "Riverpod", "Bloc/Cubit", "GetX", "None"], "rust": ["Sycamore Signals", "Leptos Signals", "Dioxus Signals", "Shared State Libs", "None"]}
 DATABASES = sorted(["PostgreSQL", "MySQL", "SQLite", "SQL Server", "Oracle", "MongoDB", "Redis", "Cassandra", "Elasticsearch", "DynamoDB", "Firebase Realtime/Firestore", "Supabase (Postgres)", "None"])
 
+GEN_TEMPERATURE = 0.35 # Temperature of the blueprint file generations (part of every response-cache key)
+APP_DATA_DIR = os.path.join(os.path.expanduser("~"), ".blueprint_generator") # Caches and other per-user state
+
+# --- File Helpers ---
+_UMASK = os.umask(0); os.umask(_UMASK) # Read once at import; os.umask() can only be read by setting it, which is not thread-safe
+
+def replace_file(tmp: str, path: str):
+    """os.replace()s tmp over path, giving it path's current permissions, or the umask default (like open()) for a new file."""
+    try: mode = stat.S_IMODE(os.stat(path).st_mode)
+    except FileNotFoundError: mode = 0o666 & ~_UMASK
+    with contextlib.suppress(OSError): os.chmod(tmp, mode) # mkstemp creates 0600 files
+    os.replace(tmp, path)
+
+@contextlib.contextmanager
+def atomic_open(path: str, mode: str = "w"):
+    """Opens a temp file in the same folder and replace_file()s it over path on success, so readers never see a half-written file."""
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path) or ".", prefix=f".{os.path.basename(path)}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, mode, **({} if "b" in mode else {"encoding": "utf-8"})) as f: yield f
+        replace_file(tmp, path)
+    except BaseException:
+        with contextlib.suppress(OSError): os.remove(tmp)
+        raise
+
+def atomic_write_text(path: str, text: str):
+    with atomic_open(path) as f: f.write(text)
+
+
+# --- Project Files ---
+PROJECT_ARCHIVE_EXT = ".bpgz"
+PROJECT_ARCHIVE_VERSION = 1
+PROJECT_ARCHIVE_HEADER = "header.json"
+PROJECT_FILE_TYPES = [("BPG", "*.bpgproj"), ("Compressed BPG", f"*{PROJECT_ARCHIVE_EXT}"), ("JSON", "*.json")]
+
+def save_project_file(path: str, data: dict, compact: bool | None = None):
+    """Saves a project as plain JSON (.bpgproj) or, when compact (default: the .bpgz extension), as a zip archive:
+    header.json holds every field except module descriptions plus a module index (id, parent_id, nama, chars),
+    and each description is its own deflated modules/<id>.txt entry, written one at a time."""
+    if compact is None: compact = path.lower().endswith(PROJECT_ARCHIVE_EXT)
+    if not compact: atomic_write_text(path, json.dumps(data, indent=2, ensure_ascii=False)); return
+    modules = data.get("modules") or []
+    header = {"version": PROJECT_ARCHIVE_VERSION, "project": {k: v for k, v in data.items() if k != "modules"},
+              "modules": [{"id": m['id'], "parent_id": m.get('parent_id'), "nama": m['nama'], "chars": len(m.get('deskripsi') or "")} for m in modules]}
+    with atomic_open(path, "wb") as f, zipfile.ZipFile(f, "w", zipfile.ZIP_DEFLATED) as zf:
+        zf.writestr(PROJECT_ARCHIVE_HEADER, json.dumps(header, ensure_ascii=False))
+        for m in modules: zf.writestr(f"modules/{m['id']}.txt", m.get('deskripsi') or "")
+
+class ProjectArchive:
+    """Reads a compact project file. Only the header is decoded on open; module descriptions are inflated on request."""
+    def __init__(self, path: str):
+        self._zf = zipfile.ZipFile(path)
+        try:
+            header = json.loads(self._zf.read(PROJECT_ARCHIVE_HEADER).decode("utf-8"))
+            if header.get("version", 0) > PROJECT_ARCHIVE_VERSION: raise ValueError(f"Project archive version {header.get('version')} is newer than this app supports")
+        except BaseException: self._zf.close(); raise
+        self.project: dict = header.get("project", {}); self.index: list[dict] = header.get("modules", [])
+    def description(self, module_id: int) -> str: return self._zf.read(f"modules/{module_id}.txt").decode("utf-8")
+    def iter_modules(self):
+        """Yields full module dicts in saved order, inflating one description at a time."""
+        for entry in self.index: yield {'id': entry['id'], 'parent_id': entry.get('parent_id'), 'nama': entry['nama'], 'deskripsi': self.description(entry['id'])}
+    def to_dict(self) -> dict: return {**self.project, "modules": list(self.iter_modules())}
+    def close(self): self._zf.close()
+    def __enter__(self): return self
+    def __exit__(self, *exc): self.close()
+
+def is_project_archive(path: str) -> bool: return zipfile.is_zipfile(path) # Sniffs the content, so renamed files still load
+
+def read_project_file(path: str) -> dict:
+    """Loads a .bpgproj (JSON) or .bpgz (archive) project as saved, whatever its extension."""
+    if is_project_archive(path):
+        with ProjectArchive(path) as archive: return archive.to_dict()
+    with open(path, 'r', encoding='utf-8') as f: return json.load(f)
+
+def read_project_header(path: str) -> dict:
+    """Project fields plus the module index (no 'deskripsi'). Archives decode only their header; JSON files are parsed in full."""
+    if is_project_archive(path):
+        with ProjectArchive(path) as archive: return {**archive.project, "modules": archive.index}
+    data = read_project_file(path)
+    return {**data, "modules": [{"id": m['id'], "parent_id": m.get('parent_id'), "nama": m['nama'], "chars": len(m.get('deskripsi') or "")} for m in data.get("modules") or []]}
+
+
+# --- Cancellation ---
+class GenerationCancelled(Exception):
+    """Raised inside a generation run once its CancelToken has been cancelled."""
+
+class CancelToken:
+    """Cooperative cancellation for one generation run. Workers poll it between steps, waits use sleep() so they wake
+    up immediately, and in-flight HTTP streams register a closer via closing() that runs the moment cancel() is called."""
+    def __init__(self): self._event = threading.Event(); self._closers = {}; self._lock = threading.Lock(); self._next_id = 0
+    @property
+    def cancelled(self) -> bool: return self._event.is_set()
+    def cancel(self):
+        with self._lock: self._event.set(); closers = list(self._closers.values()); self._closers.clear()
+        for close in closers:
+            with contextlib.suppress(Exception): close()
+    def raise_if_cancelled(self):
+        if self._event.is_set(): raise GenerationCancelled("Generation cancelled.")
+    def sleep(self, seconds: float):
+        if self._event.wait(max(0.0, seconds)): raise GenerationCancelled("Generation cancelled.")
+    @contextlib.contextmanager
+    def closing(self, close):
+        """Calls close() if the token is cancelled while the block runs (e.g. to abort a response stream)."""
+        with self._lock:
+            cancelled = self._event.is_set()
+            if not cancelled: self._next_id += 1; handle = self._next_id; self._closers[handle] = close
+        if cancelled:
+            with contextlib.suppress(Exception): close()
+            raise GenerationCancelled("Generation cancelled.")
+        try: yield
+        finally:
+            with self._lock: self._closers.pop(handle, None)
+
+def _closing_on_cancel(cancel: CancelToken | None, close):
+    return cancel.closing(close) if cancel is not None else contextlib.nullcontext()
+
+
+# --- Run Instrumentation ---
+RUN_REPORT_JSON = ".blueprint_run_report.json"
+RUN_REPORT_CSV = ".blueprint_run_report.csv"
+RUN_REPORT_FIELDS = ("file", "status", "cached", "hedge_winner", "continuations", "queue_wait", "ttft", "generation", "write", "total", "estimated_prompt_tokens", "prompt_tokens", "completion_tokens")
+_current_call = threading.local() # Metrics record of the file the current worker thread is generating
+log = logging.getLogger("blueprint_generator") # Pipeline diagnostics (scheduler, cache, hedging, jobs); silent unless $BLUEPRINT_DEBUG is set
+
+def note_call(**values):
+    """Sets values on this thread's current call record (no-op outside RunMetrics.track)."""
+    rec = getattr(_current_call, "record", None)
+    if rec is not None: rec.update(values)
+
+def add_call(**amounts):
+    """Adds amounts to this thread's current call record, so retries and multi-part calls accumulate."""
+    rec = getattr(_current_call, "record", None)
+    if rec is not None:
+        for k, v in amounts.items(): rec[k] = round(rec.get(k, 0) + v, 4) if isinstance(v, float) else rec.get(k, 0) + v
+
+def mark_first_token(started: float):
+    """Records time-to-first-token once per call, measured from when the request left the scheduler (or from started)."""
+    rec = getattr(_current_call, "record", None)
+    if rec is not None and "ttft" not in rec: rec["ttft"] = round(time.perf_counter() - rec.get("_sent", started), 4)
+
+class RunMetrics:
+    """Phase timings and per-file call metrics (queue wait, TTFT, generation, write, provider token usage) for one run.
+    Thread-safe; write_report() saves it as JSON and CSV in the output folder."""
+    def __init__(self, provider: str = "", model: str = ""):
+        self.provider, self.model = provider, model; self.started = time.time(); self.phases = {}; self.files = {}; self._lock = threading.Lock()
+    def add_phase(self, name: str, seconds: float):
+        with self._lock: self.phases[name] = round(self.phases.get(name, 0.0) + seconds, 4)
+    @contextlib.contextmanager
+    def phase(self, name: str):
+        started = time.perf_counter()
+        try: yield
+        finally: self.add_phase(name, time.perf_counter() - started)
+    @contextlib.contextmanager
+    def track(self, filename: str, prompt: str = ""):
+        """Makes filename's record the target of note_call/add_call on this thread while the block runs, and times it."""
+        rec = {"file": filename, "status": "ok", "estimated_prompt_tokens": estimate_tokens(prompt) if prompt else 0}
+        with self._lock: self.files[filename] = rec
+        previous = getattr(_current_call, "record", None); _current_call.record = rec; started = time.perf_counter()
+        try: yield rec
+        finally: rec["total"] = round(time.perf_counter() - started, 4); _current_call.record = previous
+    def totals(self) -> dict:
+        with self._lock: files = list(self.files.values())
+        sent = [f for f in files if not f.get("cached")]
+        return {"wall_seconds": round(time.time() - self.started, 3), "files": len(files), "cached": len(files) - len(sent),
+                "prompt_tokens": sum(f.get("prompt_tokens", 0) for f in files), "completion_tokens": sum(f.get("completion_tokens", 0) for f in files),
+                "estimated_prompt_tokens": sum(f.get("estimated_prompt_tokens", 0) for f in sent), "queue_wait": round(sum(f.get("queue_wait", 0) for f in files), 3)}
+    def to_dict(self) -> dict:
+        with self._lock: phases, files = dict(self.phases), [{k: v for k, v in f.items() if not k.startswith("_")} for f in self.files.values()]
+        return {"provider": self.provider, "model": self.model, "started": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(self.started)), "phases": phases, "totals": self.totals(), "files": sorted(files, key=lambda f: f["file"])}
+    def write_report(self, folder: str) -> dict:
+        report = self.to_dict()
+        atomic_write_text(os.path.join(folder, RUN_REPORT_JSON), json.dumps(report, indent=2))
+        buf = io.StringIO(); writer = csv.DictWriter(buf, fieldnames=RUN_REPORT_FIELDS, extrasaction="ignore", lineterminator="\n")
+        writer.writeheader(); writer.writerows(report["files"]); atomic_write_text(os.path.join(folder, RUN_REPORT_CSV), buf.getvalue())
+        return report
+
 
 # --- AI Service Abstraction & Implementations ---
+class TransientConnectionError(ConnectionError):
+    """Dropped connection or timeout on the way to the provider; worth retrying (unlike auth, model or quota errors)."""
+
+class RateLimitError(ConnectionError):
+    """Provider rejected the request for rate/quota reasons (HTTP 429). retry_after is the provider's hint in seconds, if any."""
+    def __init__(self, message: str, retry_after: float | None = None): super().__init__(message); self.retry_after = retry_after
+
+class OutputTruncated(RuntimeError):
+    """The model stopped at its output-token limit. partial is the text returned so far (empty for streams, whose
+    chunks were already yielded). Not retryable as-is; ContinuingAIService asks the model to carry on instead."""
+    def __init__(self, message: str, partial: str = ""): super().__init__(message); self.partial = partial
+
+def _retry_after_from(e: Exception) -> float | None:
+    """Reads a retry hint from a Retry-After header or a 'retry in 12s' / 'retry_delay { seconds: 12 }' message."""
+    headers = getattr(getattr(e, "response", None), "headers", None)
+    try:
+        if headers and headers.get("retry-after"): return float(headers.get("retry-after"))
+    except (TypeError, ValueError): pass
+    m = re.search(r"retry(?:[ _]in|_delay\s*\{\s*seconds:)\s*([0-9.]+)", str(e), re.IGNORECASE)
+    return float(m.group(1)) if m else None
+
 class AIService(ABC):
     @abstractmethod
     def list_models(self, api_key: str) -> list[str]: pass
     @abstractmethod
-    def generate_text(self, api_key: str, model: str, prompt: str, temperature: float = 0.3) -> str: pass
+    def generate_text(self, api_key: str, model: str, prompt: str, temperature: float = 0.3) -> str:
+        """Returns the whole completion. Surrounding whitespace is kept (a continuation may start with a space or a
+        newline); whoever writes the final output strips it."""
+    def generate_text_stream(self, api_key: str, model: str, prompt: str, temperature: float = 0.3, cancel: CancelToken | None = None):
+        """Yields the completion in chunks as the provider produces them. Services without streaming yield it in one piece.
+        Once cancel is cancelled the stream is closed and GenerationCancelled is raised."""
+        if cancel is not None: cancel.raise_if_cancelled()
+        try: yield self.generate_text(api_key, model, prompt, temperature=temperature)
+        except OutputTruncated as e: yield e.partial; raise OutputTruncated(str(e)) from e
 
 class OpenAIService(AIService):
     # ... (Implementasi OpenAIService tetap sama) ...
+    def __init__(self):
+        # One long-lived client per API key; the SDK client is thread-safe and keeps its HTTP connection pool warm
+        self._clients = {}; self._clients_lock = threading.Lock()
+    def _client(self, api_key: str):
+        with self._clients_lock:
+            client = self._clients.get(api_key)
+            if client is None: client = self._clients[api_key] = OpenAI(api_key=api_key)
+            return client
     def list_models(self, api_key: str) -> list[str]:
         if not openai_available: raise ImportError("OpenAI package not installed.")
         if not api_key: raise ValueError("OpenAI API Key required.")
+        _load_openai()
         try:
-            client=OpenAI(api_key=api_key); models=client.models.list()
+            client=self._client(api_key); models=client.models.list()
             gpt_models=sorted([m.id for m in models.data if'gpt'in m.id and m.id.find('instruct')==-1 and m.id.find('vision')==-1 and m.id.find('embedding')==-1 and m.id.find('audio')==-1 and m.id.find('tts')==-1 and m.id.find('whisper')==-1 and m.id.find('dall-e')==-1 and not m.id.endswith(('-0301','-0314','-0613'))])
             priority=['gpt-4o','gpt-4-turbo','gpt-4','gpt-3.5-turbo']; ordered=[p for p in priority if p in gpt_models]; ordered.extend([m for m in gpt_models if m not in priority]); return ordered
         except AuthenticationError: raise ValueError("Invalid OpenAI API Key.")
         except APIConnectionError as e: raise ConnectionError(f"OpenAI Connection Error: {e}")
         except Exception as e: raise RuntimeError(f"OpenAI Model List Error: {e}")
-    def generate_text(self, api_key: str, model: str, prompt: str, temperature: float = 0.3) -> str:
+    def _check_generate_args(self, api_key: str, model: str):
         if not openai_available: raise ImportError("OpenAI package not installed.")
         if not api_key or not model: raise ValueError("OpenAI API Key/Model required.")
+        _load_openai()
+    def _map_generate_error(self, e: Exception, model: str) -> Exception:
+        if isinstance(e, OutputTruncated): return e
+        if isinstance(e, AuthenticationError): return ValueError("Invalid OpenAI API Key.")
+        if isinstance(e, OpenAIRateLimitError) and "insufficient_quota" not in str(e): return RateLimitError(f"OpenAI rate limit: {e}", _retry_after_from(e))
+        if isinstance(e, OpenAIRateLimitError): return ValueError(f"OpenAI quota exceeded: {e}") # Billing problem; retrying cannot help
+        if isinstance(e, APIConnectionError): return TransientConnectionError(f"OpenAI Connection Error: {e}") # Includes timeouts
+        if isinstance(e, NotFoundError) or "does not exist" in str(e): return ValueError(f"OpenAI Model '{model}' not found.")
+        return RuntimeError(f"OpenAI Generation Error: {e}")
+    def generate_text(self, api_key: str, model: str, prompt: str, temperature: float = 0.3) -> str:
+        self._check_generate_args(api_key, model)
         try:
-            client=OpenAI(api_key=api_key); response=client.chat.completions.create(model=model, messages=[{"role": "user", "content": prompt}], temperature=temperature)
-            if response.choices and response.choices[0].message: return response.choices[0].message.content.strip()
-            else: raise RuntimeError("Invalid OpenAI response.")
-        except AuthenticationError: raise ValueError("Invalid OpenAI API Key.")
-        except APIConnectionError as e: raise ConnectionError(f"OpenAI Connection Error: {e}")
-        except NotFoundError: raise ValueError(f"OpenAI Model '{model}' not found.")
+            client=self._client(api_key); response=client.chat.completions.create(model=model, messages=[{"role": "user", "content": prompt}], temperature=temperature)
+            if getattr(response, "usage", None): add_call(prompt_tokens=response.usage.prompt_tokens, completion_tokens=response.usage.completion_tokens)
+            if not response.choices or not response.choices[0].message: raise RuntimeError("Invalid OpenAI response.")
+            text = response.choices[0].message.content or ""
+            if response.choices[0].finish_reason == "length": raise OutputTruncated("OpenAI output hit the token limit.", partial=text)
+            return text
+        except Exception as e: raise self._map_generate_error(e, model)
+    def generate_text_stream(self, api_key: str, model: str, prompt: str, temperature: float = 0.3, cancel: CancelToken | None = None):
+        self._check_generate_args(api_key, model)
+        try:
+            client=self._client(api_key); stream=client.chat.completions.create(model=model, messages=[{"role": "user", "content": prompt}], temperature=temperature, stream=True, stream_options={"include_usage": True})
+            finish = None
+            with _closing_on_cancel(cancel, stream.close): # Closing the stream drops the HTTP connection mid-response
+                for chunk in stream:
+                    if cancel is not None: cancel.raise_if_cancelled()
+                    if getattr(chunk, "usage", None): add_call(prompt_tokens=chunk.usage.prompt_tokens, completion_tokens=chunk.usage.completion_tokens) # Final chunk, no choices
+                    if chunk.choices and chunk.choices[0].finish_reason: finish = chunk.choices[0].finish_reason
+                    if chunk.choices and chunk.choices[0].delta and chunk.choices[0].delta.content: yield chunk.choices[0].delta.content
+            if cancel is not None: cancel.raise_if_cancelled()
+            if finish == "length": raise OutputTruncated("OpenAI output hit the token limit.")
         except Exception as e:
-            if "does not exist" in str(e): raise ValueError(f"OpenAI Model '{model}' not found.")
-            raise RuntimeError(f"OpenAI Generation Error: {e}")
+            if cancel is not None and cancel.cancelled: raise GenerationCancelled("Generation cancelled.") from e
+            raise self._map_generate_error(e, model)
 
 class GeminiService(AIService):
     # ... (Implementasi GeminiService tetap sama dengan perbaikan try-except terakhir) ...
+    SAFETY_SETTINGS = [{"category": c, "threshold": "BLOCK_NONE"} for c in ["HARM_CATEGORY_HARASSMENT","HARM_CATEGORY_HATE_SPEECH","HARM_CATEGORY_SEXUALLY_EXPLICIT","HARM_CATEGORY_DANGEROUS_CONTENT"]]
+    def __init__(self):
+        # GenerativeModel objects are reused per (API key, model). The SDK holds one process-wide API key and a model only
+        # picks up the client for the configured key when its first call starts, so every call that reads the global key
+        # (list_models and each model's first generate_content) runs under _configure_lock with its own key configured.
+        # Calls on a model that already has its client run without the lock.
+        self._models = {}; self._bound = set(); self._configured_key = None; self._models_lock = threading.Lock(); self._configure_lock = threading.Lock()
+    def _configure(self, api_key: str):
+        """Caller holds _configure_lock."""
+        if self._configured_key != api_key: genai.configure(api_key=api_key); self._configured_key = api_key
+    def _model(self, api_key: str, model: str):
+        model_id=f"models/{model}" if not model.startswith("models/") else model
+        with self._models_lock:
+            gemini = self._models.get((api_key, model_id))
+            if gemini is None: gemini = self._models[(api_key, model_id)] = genai.GenerativeModel(model_id)
+            return gemini
     def list_models(self, api_key: str) -> list[str]:
         if not gemini_available: raise ImportError("Gemini package not installed.")
         if not api_key: raise ValueError("Gemini API Key required.")
+        _load_gemini()
         try:
-            genai.configure(api_key=api_key)
-            models_list=[m.name.replace("models/", "") for m in genai.list_models() if 'generateContent' in m.supported_generation_methods and 'gemini' in m.name]
+            with self._configure_lock: self._configure(api_key); models_list=[m.name.replace("models/", "") for m in genai.list_models() if 'generateContent' in m.supported_generation_methods and 'gemini' in m.name]
             common=['gemini-1.5-pro-latest','gemini-1.5-flash-latest','gemini-pro']; [models_list.append(cm) for cm in common if not any(m.startswith(cm.split('-latest')[0]) for m in models_list)]
             priority=['gemini-1.5-pro-latest','gemini-1.5-flash-latest','gemini-pro']; ordered=[p for p in priority if p in models_list]; ordered.extend(sorted([m for m in models_list if m not in priority])); return list(dict.fromkeys(ordered))
         except (google_exceptions.PermissionDenied, google_exceptions.Unauthenticated): raise ValueError("Invalid Gemini API Key/permission.")
         except Exception as e:
             if "API key not valid" in str(e): raise ValueError("Invalid Gemini API Key.")
             raise RuntimeError(f"Gemini Model List Error: {e}")
-    def generate_text(self, api_key: str, model: str, prompt: str, temperature: float = 0.3) -> str:
+    def _check_generate_args(self, api_key: str, model: str):
         if not gemini_available: raise ImportError("Gemini package not installed.")
         if not api_key or not model: raise ValueError("Gemini API Key/Model required.")
+        _load_gemini()
+    def _start_generation(self, api_key: str, model: str, prompt: str, temperature: float, stream: bool = False):
+        gemini=self._model(api_key, model); config=genai.types.GenerationConfig(temperature=temperature)
+        if id(gemini) in self._bound: return gemini.generate_content(prompt, generation_config=config, safety_settings=self.SAFETY_SETTINGS, stream=stream)
+        with self._configure_lock: # First call: the model takes the client of whichever key is configured right now
+            self._configure(api_key); response = gemini.generate_content(prompt, generation_config=config, safety_settings=self.SAFETY_SETTINGS, stream=stream)
+            self._bound.add(id(gemini)); return response
+    @staticmethod
+    def _record_usage(response):
+        usage = getattr(response, "usage_metadata", None)
+        if usage: add_call(prompt_tokens=usage.prompt_token_count or 0, completion_tokens=usage.candidates_token_count or 0)
+    def _map_generate_error(self, e: Exception, model: str) -> Exception:
+        if isinstance(e, (google_exceptions.PermissionDenied, google_exceptions.Unauthenticated)): return ValueError("Invalid Gemini API Key/permission.")
+        if isinstance(e, (google_exceptions.ServiceUnavailable, google_exceptions.DeadlineExceeded)) or (isinstance(e, ConnectionError) and not isinstance(e, (RateLimitError, TransientConnectionError))): return TransientConnectionError(f"Gemini Connection Error: {e}")
+        if isinstance(e, (ValueError, RuntimeError, ConnectionError)): return e
+        if "API key not valid" in str(e): return ValueError("Invalid Gemini API Key.")
+        if "404" in str(e) or "not found" in str(e).lower() or ("model" in str(e).lower() and "does not exist" in str(e).lower()): return ValueError(f"Gemini Model '{model}' not found.")
+        if "model" in str(e).lower() and "cannot be accessed" in str(e).lower(): return ValueError(f"Gemini Model '{model}' cannot be accessed.")
+        if "429" in str(e) or "resource exhausted" in str(e).lower(): return RateLimitError("Gemini quota/rate limit.", _retry_after_from(e))
+        if "SAFETY" in str(e).upper(): return ValueError(f"Gemini blocked by safety: {e}")
+        return RuntimeError(f"Gemini text gen error: {e}")
+    def generate_text(self, api_key: str, model: str, prompt: str, temperature: float = 0.3) -> str:
+        self._check_generate_args(api_key, model)
         try:
-            genai.configure(api_key=api_key); model_id=f"models/{model}" if not model.startswith("models/") else model
-            config=genai.types.GenerationConfig(temperature=temperature)
-            safety=[{"category": c, "threshold": "BLOCK_NONE"} for c in ["HARM_CATEGORY_HARASSMENT","HARM_CATEGORY_HATE_SPEECH","HARM_CATEGORY_SEXUALLY_EXPLICIT","HARM_CATEGORY_DANGEROUS_CONTENT"]]
-            gemini=genai.GenerativeModel(model_id); response=gemini.generate_content(prompt, generation_config=config, safety_settings=safety)
+            response=self._start_generation(api_key, model, prompt, temperature); self._record_usage(response)
             if response.prompt_feedback and response.prompt_feedback.block_reason: raise ValueError(f"Gemini prompt blocked: {response.prompt_feedback.block_reason.name}.")
-            if hasattr(response, 'text'): return response.text.strip()
+            if response.candidates and response.candidates[0].finish_reason.name == "MAX_TOKENS": # Partial text is still in the parts
+                c = response.candidates[0]; raise OutputTruncated("Gemini output hit the token limit.", partial="".join(p.text for p in c.content.parts) if c.content else "")
+            if hasattr(response, 'text'): return response.text
             elif hasattr(response, 'candidates') and response.candidates:
                 try:
                     c = response.candidates[0];
                     if c.finish_reason.name != "STOP": raise RuntimeError(f"Gemini stopped: {c.finish_reason.name}.")
-                    return c.content.parts[0].text.strip() if c.content and c.content.parts else ""
+                    return c.content.parts[0].text if c.content and c.content.parts else ""
                 except (AttributeError, IndexError, TypeError) as e: raise RuntimeError(f"Gemini candidate error: {e}.")
             else: raise RuntimeError("Unknown Gemini response.")
-        except (google_exceptions.PermissionDenied, google_exceptions.Unauthenticated): raise ValueError("Invalid Gemini API Key/permission.")
-        except ValueError as ve: raise ve
-        except RuntimeError as rt: raise rt
-        except ConnectionError as ce: raise ce
+        except Exception as e: raise self._map_generate_error(e, model)
+    def generate_text_stream(self, api_key: str, model: str, prompt: str, temperature: float = 0.3, cancel: CancelToken | None = None):
+        self._check_generate_args(api_key, model)
+        last = None; finish = None
+        try:
+            for chunk in self._start_generation(api_key, model, prompt, temperature, stream=True):
+                if cancel is not None: cancel.raise_if_cancelled() # The SDK has no public close; stop reading instead
+                last = chunk # Usage metadata is cumulative; the last chunk carries the totals
+                if chunk.prompt_feedback and chunk.prompt_feedback.block_reason: raise ValueError(f"Gemini prompt blocked: {chunk.prompt_feedback.block_reason.name}.")
+                c = chunk.candidates[0] if chunk.candidates else None
+                if c is not None and c.finish_reason.name not in ("STOP", "FINISH_REASON_UNSPECIFIED"): finish = c.finish_reason.name
+                try: text = chunk.text
+                except ValueError: # Chunk without text parts (e.g. final chunk carrying only the finish reason)
+                    if finish and finish != "MAX_TOKENS": raise RuntimeError(f"Gemini stopped: {finish}.")
+                    continue
+                if text: yield text
+            if last is not None: self._record_usage(last)
+            if finish == "MAX_TOKENS": raise OutputTruncated("Gemini output hit the token limit.")
         except Exception as e:
-            if "API key not valid" in str(e): raise ValueError("Invalid Gemini API Key.")
-            if "404" in str(e) or "not found" in str(e).lower() or ("model" in str(e).lower() and "does not exist" in str(e).lower()): raise ValueError(f"Gemini Model '{model}' not found.")
-            if "model" in str(e).lower() and "cannot be accessed" in str(e).lower(): raise ValueError(f"Gemini Model '{model}' cannot be accessed.")
-            if "429" in str(e) or "resource exhausted" in str(e).lower(): raise ConnectionError("Gemini quota/rate limit.")
-            if "SAFETY" in str(e).upper(): raise ValueError(f"Gemini blocked by safety: {e}")
-            raise RuntimeError(f"Gemini text gen error: {e}")
+            if cancel is not None and cancel.cancelled: raise GenerationCancelled("Generation cancelled.") from e
+            raise self._map_generate_error(e, model)
+
+def create_ai_services() -> dict[str, AIService]:
+    services = {}
+    if openai_available: services["OpenAI"] = OpenAIService()
+    if gemini_available: services["Gemini"] = GeminiService()
+    return services
+
+
+# --- Request Scheduler (Rate Limits & Retries) ---
+PROVIDER_RATE_LIMITS = { # Requests/min, tokens/min and concurrent requests per provider, shared by every generation in this process
+    "OpenAI": {"rpm": 500, "tpm": 200_000, "max_in_flight": 8},
+    "Gemini": {"rpm": 60, "tpm": 1_000_000, "max_in_flight": 4},
+}
+DEFAULT_RATE_LIMITS = {"rpm": 60, "tpm": 100_000, "max_in_flight": 4}
+OUTPUT_TOKEN_ESTIMATE = 2000 # Completion size assumed when reserving token budget
+
+def estimate_tokens(text: str) -> int: return len(text) // 4 + 1 # ~4 characters per token for English/markdown
+
+class TokenBucket:
+    """Thread-safe token bucket. reserve() takes tokens up front (the balance may go negative) and returns how long
+    the caller has to wait, so concurrent callers queue in arrival order without polling."""
+    def __init__(self, rate_per_sec: float, capacity: float):
+        self.rate, self.capacity = rate_per_sec, capacity; self.tokens = capacity; self.updated = time.monotonic(); self._lock = threading.Lock()
+    def reserve(self, amount: float) -> float:
+        with self._lock:
+            now = time.monotonic(); self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate); self.updated = now
+            self.tokens -= min(amount, self.capacity)
+            return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+class RequestScheduler:
+    """Queues provider calls behind per-provider request/token budgets and a concurrency cap, and retries rate-limit and
+    connection errors with jittered exponential backoff that honours retry-after hints. A 429 pauses the whole provider."""
+    RETRYABLE = (RateLimitError, TransientConnectionError) # Auth, model and quota errors are ValueErrors and fail fast
+    def __init__(self, limits: dict | None = None, max_retries: int = 5, base_delay: float = 1.0, max_delay: float = 60.0, sleep=time.sleep):
+        self.limits = {k: dict(v) for k, v in {**PROVIDER_RATE_LIMITS, **(limits or {})}.items()}
+        self.max_retries, self.base_delay, self.max_delay, self._sleep = max_retries, base_delay, max_delay, sleep
+        self._providers = {}; self._lock = threading.Lock(); self.retries = 0
+    def configure(self, provider: str, **limits):
+        with self._lock: self.limits.setdefault(provider, dict(DEFAULT_RATE_LIMITS)).update({k: v for k, v in limits.items() if v}); self._providers.pop(provider, None)
+    def _state(self, provider: str) -> dict:
+        with self._lock:
+            st = self._providers.get(provider)
+            if st is None:
+                lim = {**DEFAULT_RATE_LIMITS, **self.limits.get(provider, {})}
+                st = self._providers[provider] = {"requests": TokenBucket(lim["rpm"] / 60, max(1, lim["rpm"] / 6)), "tokens": TokenBucket(lim["tpm"] / 60, max(1, lim["tpm"] / 6)), "slots": threading.BoundedSemaphore(lim["max_in_flight"]), "paused_until": 0.0}
+            return st
+    def _wait(self, seconds: float, cancel: CancelToken | None):
+        if cancel is not None: cancel.sleep(seconds)
+        else: self._sleep(seconds)
+    @contextlib.contextmanager
+    def slot(self, provider: str, prompt: str, cancel: CancelToken | None = None):
+        """Holds one in-flight slot for the provider once its request and token budgets allow the call."""
+        st = self._state(provider); queued = time.perf_counter()
+        while not st["slots"].acquire(timeout=0.2 if cancel is not None else None): cancel.raise_if_cancelled()
+        try:
+            if cancel is not None: cancel.raise_if_cancelled()
+            wait = max(st["requests"].reserve(1), st["tokens"].reserve(estimate_tokens(prompt) + OUTPUT_TOKEN_ESTIMATE), st["paused_until"] - time.monotonic())
+            if wait > 0: log.debug(f"Scheduler - {provider} budget wait {wait:.1f}s"); self._wait(wait, cancel)
+            sent = time.perf_counter(); add_call(queue_wait=round(sent - queued, 4)); note_call(_sent=sent)
+            yield
+        finally: st["slots"].release()
+    def backoff(self, provider: str, attempt: int, error: Exception, cancel: CancelToken | None = None):
+        """Sleeps before retry number attempt+1, or re-raises error once retries are exhausted."""
+        if attempt >= self.max_retries: raise error
+        delay = min(self.max_delay, self.base_delay * 2 ** attempt) * random.uniform(0.5, 1.0)
+        if isinstance(error, RateLimitError):
+            if error.retry_after: delay = max(delay, error.retry_after)
+            st = self._state(provider); st["paused_until"] = max(st["paused_until"], time.monotonic() + delay) # Everyone queued behind waits too
+        self.retries += 1; log.debug(f"Scheduler - {provider} {type(error).__name__}, retry {attempt + 1}/{self.max_retries} in {delay:.1f}s")
+        self._wait(delay, cancel)
+    def run(self, provider: str, prompt: str, fn, cancel: CancelToken | None = None):
+        attempt = 0
+        while True:
+            try:
+                with self.slot(provider, prompt, cancel): return fn()
+            except self.RETRYABLE as e: self.backoff(provider, attempt, e, cancel); attempt += 1
+
+REQUEST_SCHEDULER = RequestScheduler() # Shared by the GUI and all batch jobs in this process
+
+class ScheduledAIService(AIService):
+    """Routes another AIService's calls through a RequestScheduler. Budget and backoff waits end early once cancel is cancelled."""
+    def __init__(self, inner: AIService, provider: str, scheduler: RequestScheduler, cancel: CancelToken | None = None):
+        self.inner, self.provider, self.scheduler, self.cancel = inner, provider, scheduler, cancel
+    def list_models(self, api_key: str) -> list[str]: return self.inner.list_models(api_key)
+    def generate_text(self, api_key: str, model: str, prompt: str, temperature: float = 0.3) -> str:
+        return self.scheduler.run(self.provider, prompt, lambda: self.inner.generate_text(api_key, model, prompt, temperature=temperature), self.cancel)
+    def generate_text_stream(self, api_key: str, model: str, prompt: str, temperature: float = 0.3, cancel: CancelToken | None = None):
+        attempt = 0; cancel = cancel or self.cancel
+        while True:
+            yielded = False
+            try:
+                with self.scheduler.slot(self.provider, prompt, cancel):
+                    for chunk in self.inner.generate_text_stream(api_key, model, prompt, temperature=temperature, cancel=cancel): yielded = True; yield chunk
+                return
+            except self.scheduler.RETRYABLE as e:
+                if yielded: raise # Output already went out; a retry would duplicate it
+                self.scheduler.backoff(self.provider, attempt, e, cancel); attempt += 1
+
+
+# --- Hedged Requests ---
+HEDGE_PERCENTILE = 95 # A call with no output after this percentile of recent first-token latencies gets a backup request
+HEDGE_MIN_SAMPLES = 10 # Below this, HEDGE_DEFAULT_DELAY is used instead of the percentile
+HEDGE_DEFAULT_DELAY = 30.0 # Seconds; override with config_data['hedge_delay'] / --hedge-delay
+HEDGE_MIN_DELAY = 2.0 # Never hedge sooner than this, however fast the provider has been
+LATENCY_SAMPLES_PATH = os.path.join(APP_DATA_DIR, "cache", "latency.json")
+
+def _percentile(values: list[float], q: float) -> float:
+    """Nearest-rank percentile (q in 0..100) of values; 0.0 if empty."""
+    if not values: return 0.0
+    ordered = sorted(values); return ordered[min(len(ordered) - 1, max(0, math.ceil(q / 100 * len(ordered)) - 1))]
+
+def parse_hedge_target(value: str) -> tuple[str, str] | None:
+    """'Provider:model' -> (provider, model); None for an empty or malformed value."""
+    provider, sep, model = (value or "").partition(":")
+    return (provider.strip(), model.strip()) if sep and provider.strip() and model.strip() else None
+
+class LatencyTracker:
+    """Recent time-to-first-output samples per (provider, model), shared by every run in this process. With a path, the
+    samples of earlier runs are loaded on first use and save() writes them back, so a run of a few calls still has a history."""
+    def __init__(self, window: int = 200, path: str | None = None): self.window, self.path = window, path; self._samples = None; self._lock = threading.Lock()
+    def _loaded(self) -> dict:
+        """Caller holds _lock."""
+        if self._samples is None:
+            self._samples = {}
+            if not self.path: return self._samples
+            try:
+                with open(self.path, "r", encoding="utf-8") as f: data = json.load(f)
+                for name, values in (data.items() if isinstance(data, dict) else ()):
+                    provider, _, model = name.partition(":")
+                    if isinstance(values, list): self._samples[(provider, model)] = deque((float(v) for v in values if isinstance(v, (int, float))), maxlen=self.window)
+            except FileNotFoundError: pass
+            except (OSError, TypeError, ValueError) as e: print(f"Warn: Latency samples unreadable, starting fresh: {e}")
+        return self._samples
+    def add(self, provider: str, model: str, seconds: float):
+        with self._lock: self._loaded().setdefault((provider, model), deque(maxlen=self.window)).append(seconds)
+    def threshold(self, provider: str, model: str, percentile: float, default: float = HEDGE_DEFAULT_DELAY) -> float:
+        with self._lock: samples = list(self._loaded().get((provider, model), ()))
+        return default if len(samples) < HEDGE_MIN_SAMPLES else max(HEDGE_MIN_DELAY, _percentile(samples, percentile))
+    def save(self):
+        if not self.path: return
+        with self._lock:
+            if self._samples is None: return # Nothing loaded or added
+            data = {f"{provider}:{model}": [round(v, 4) for v in samples] for (provider, model), samples in self._samples.items()}
+        try: os.makedirs(os.path.dirname(self.path), exist_ok=True); atomic_write_text(self.path, json.dumps(data))
+        except OSError as e: print(f"Warn: Latency samples write failed: {e}")
+
+LATENCY_TRACKER = LatencyTracker(path=LATENCY_SAMPLES_PATH)
+
+class HedgedAIService(AIService):
+    """Races a backup provider/model against slow calls. If the primary has produced no output once the primary's
+    percentile latency has passed, the same prompt goes to the backup; whichever starts answering first wins and the
+    other call is cancelled (its stream closed). Both calls run as streams so the loser can actually be stopped."""
+    def __init__(self, primary: AIService, provider: str, backup: AIService, backup_provider: str, backup_key: str, backup_model: str, percentile: float = HEDGE_PERCENTILE, tracker: LatencyTracker = LATENCY_TRACKER, cancel: CancelToken | None = None, default_delay: float = HEDGE_DEFAULT_DELAY):
+        self.primary, self.provider, self.backup, self.backup_provider, self.backup_key, self.backup_model = primary, provider, backup, backup_provider, backup_key, backup_model
+        self.percentile, self.tracker, self.cancel, self.default_delay = percentile, tracker, cancel, default_delay; self.hedged = 0; self.backup_wins = 0
+    def list_models(self, api_key: str) -> list[str]: return self.primary.list_models(api_key)
+    def generate_text(self, api_key: str, model: str, prompt: str, temperature: float = 0.3) -> str:
+        parts = []
+        try:
+            for chunk in self.generate_text_stream(api_key, model, prompt, temperature=temperature): parts.append(chunk)
+        except OutputTruncated as e: raise OutputTruncated(str(e), partial="".join(parts)) from e # The stream's partial is empty; hand back what arrived
+        return "".join(parts)
+    def generate_text_stream(self, api_key: str, model: str, prompt: str, temperature: float = 0.3, cancel: CancelToken | None = None):
+        targets = [(self.primary, api_key, model), (self.backup, self.backup_key, self.backup_model)]; cancel = cancel or self.cancel
+        events = queue.Queue(); tokens = []; failed = {}; winner = None; record = getattr(_current_call, "record", None); started = time.perf_counter()
+        def attempt(idx, token):
+            _current_call.record = record # Usage of both calls is billed, so both count towards the file's metrics
+            svc, key, mdl = targets[idx]
+            try:
+                for chunk in svc.generate_text_stream(key, mdl, prompt, temperature=temperature, cancel=token): events.put((idx, "chunk", chunk))
+                events.put((idx, "done", None))
+            except BaseException as e: events.put((idx, "error", e))
+        def start(idx):
+            tokens.append(CancelToken()); threading.Thread(target=attempt, args=(idx, tokens[idx]), name=f"bpg-hedge-{idx}", daemon=True).start()
+        delay = self.tracker.threshold(self.provider, model, self.percentile, self.default_delay)
+        with _closing_on_cancel(cancel, lambda: [t.cancel() for t in list(tokens)]):
+            start(0)
+            try:
+                while winner is None:
+                    try: idx, kind, payload = events.get(timeout=max(0.0, delay - (time.perf_counter() - started)) if len(tokens) == 1 else None)
+                    except queue.Empty:
+                        log.debug(f"Hedge - no output from {self.provider}/{model} after {delay:.1f}s, trying {self.backup_provider}/{self.backup_model}")
+                        self.hedged += 1; note_call(hedged=True); start(1); continue
+                    if kind == "error":
+                        failed[idx] = payload
+                        if len(failed) == len(tokens): raise failed.get(0, payload) # Nothing left to wait for
+                        continue
+                    winner = idx; elapsed = time.perf_counter() - started
+                    self.tracker.add(self.provider, model, elapsed if idx == 0 else max(delay, elapsed)) # A losing primary was at least this slow
+                    if len(tokens) > 1:
+                        tokens[1 - idx].cancel()
+                        if idx: self.backup_wins += 1; note_call(hedge_winner="backup"); _current_call.backup_answer = f"{self.backup_provider}/{self.backup_model}" # Read by CachedAIService
+                        elif (record or {}).get("hedge_winner") != "backup": note_call(hedge_winner="primary") # One backup answer marks the whole file
+                    if kind == "done": return
+                    yield payload
+                while True:
+                    idx, kind, payload = events.get()
+                    if idx != winner: continue
+                    if kind == "done": return
+                    if kind == "error": raise payload
+                    yield payload
+            finally: [t.cancel() for t in tokens] # Stops the loser, or both if the consumer stopped early
+
+
+# --- Truncated Output Continuation ---
+DEFAULT_MAX_CONTINUATIONS = 3 # Follow-up calls per output that hits the model's token limit; 0 = report truncation as an error
+CONTINUATION_TAIL_CHARS = 2000 # End of the cut-off output quoted back to the model
+CONTINUATION_OVERLAP_CHARS = 300 # Start of a continuation checked for text repeated from the cut-off output
+CONTINUATION_MIN_OVERLAP = 20 # Shorter repeats are left alone (could be a coincidental newline or word)
+CONTINUATION_PROMPT = ("{prompt}\n\n---\nYour previous answer to the task above was cut off by the output length limit. It ended with:\n\n"
+                       "<<<\n{tail}\n>>>\n\nContinue exactly where it stopped. Do not repeat any earlier text and do not add a preamble or closing remarks.")
+
+def continuation_prompt(prompt: str, partial: str) -> str: return CONTINUATION_PROMPT.format(prompt=prompt, tail=partial[-CONTINUATION_TAIL_CHARS:])
+
+def strip_overlap(text: str, continuation: str) -> str:
+    """Drops the start of continuation if it repeats the end of text (models often restate the last line)."""
+    for k in range(min(len(text), len(continuation), CONTINUATION_OVERLAP_CHARS), CONTINUATION_MIN_OVERLAP - 1, -1):
+        if text.endswith(continuation[:k]): return continuation[k:]
+    return continuation
+
+class ContinuingAIService(AIService):
+    """Completes outputs cut off at the model's output-token limit. When the inner service raises OutputTruncated, the
+    original prompt plus the tail of the partial output is sent as a continuation request and the answer appended, up to
+    max_continuations times; still truncated after that raises OutputTruncated. Streams yield continuations as they arrive."""
+    def __init__(self, inner: AIService, max_continuations: int = DEFAULT_MAX_CONTINUATIONS):
+        self.inner, self.max_continuations = inner, max_continuations
+        self._lock = threading.Lock(); self.continuations = 0
+    def list_models(self, api_key: str) -> list[str]: return self.inner.list_models(api_key)
+    def _continuing(self, model: str, text: str):
+        with self._lock: self.continuations += 1
+        add_call(continuations=1); log.debug(f"{model} output truncated at {len(text)} chars, requesting a continuation")
+    def _gave_up(self, text: str) -> OutputTruncated:
+        return OutputTruncated(f"Output still truncated after {self.max_continuations} continuation request(s) ({len(text)} chars); raise the continuation limit or shorten the prompt.", partial=text)
+    def generate_text(self, api_key: str, model: str, prompt: str, temperature: float = 0.3) -> str:
+        text = ""
+        for n in range(self.max_continuations + 1):
+            try: part = self.inner.generate_text(api_key, model, continuation_prompt(prompt, text) if n else prompt, temperature=temperature); truncated = False
+            except OutputTruncated as e: part = e.partial; truncated = True
+            text += strip_overlap(text, part)
+            if not truncated: return text
+            if n < self.max_continuations: self._continuing(model, text)
+        raise self._gave_up(text)
+    def generate_text_stream(self, api_key: str, model: str, prompt: str, temperature: float = 0.3, cancel: CancelToken | None = None):
+        text = ""
+        for n in range(self.max_continuations + 1):
+            pending = "" if n else None # A continuation's first chunks are held back until repeated text can be dropped
+            try:
+                for chunk in self.inner.generate_text_stream(api_key, model, continuation_prompt(prompt, text) if n else prompt, temperature=temperature, cancel=cancel):
+                    if pending is not None:
+                        pending += chunk
+                        if len(pending) < CONTINUATION_OVERLAP_CHARS: continue
+                        chunk, pending = strip_overlap(text, pending), None
+                    text += chunk; yield chunk
+                truncated = False
+            except OutputTruncated: truncated = True
+            if pending: chunk = strip_overlap(text, pending); text += chunk; yield chunk
+            if not truncated: return
+            if n < self.max_continuations: self._continuing(model, text)
+        raise self._gave_up(text)
+
+
+# --- Response Cache ---
+RESPONSE_CACHE_DIR = os.path.join(APP_DATA_DIR, "cache", "responses")
+RESPONSE_CACHE_MAX_BYTES = 50 * 1024 * 1024
+RESPONSE_CACHE_MAX_AGE = 30 * 24 * 3600 # Seconds
+RESPONSE_CACHE_SWEEP_INTERVAL = 3600 # Seconds between full directory sweeps for expired entries
+RESPONSE_CACHE_PRUNE_TO = 0.9 # An over-size cache is trimmed to this share of max_bytes, so the next puts don't sweep again
+
+class ResponseCache:
+    """Content-addressed on-disk store of LLM outputs, one JSON file per (provider, model, temperature, prompt) hash.
+    Entries older than max_age are ignored and pruned; the least recently used ones go first when over max_bytes.
+    put() keeps a running size total and only walks the directory when that total is over max_bytes or the last sweep is
+    older than sweep_interval (the first put of a process always sweeps, which also picks up other processes' writes)."""
+    def __init__(self, directory: str = RESPONSE_CACHE_DIR, max_bytes: int = RESPONSE_CACHE_MAX_BYTES, max_age: float = RESPONSE_CACHE_MAX_AGE, sweep_interval: float = RESPONSE_CACHE_SWEEP_INTERVAL):
+        self.directory, self.max_bytes, self.max_age, self.sweep_interval = directory, max_bytes, max_age, sweep_interval
+        self._lock = threading.Lock(); self._total = None; self._swept = 0.0 # Bytes in the cache as of the last sweep plus later puts
+    @staticmethod
+    def make_key(provider: str, model: str, temperature: float, prompt: str) -> str:
+        return hashlib.sha256(json.dumps([provider, model, round(float(temperature), 4), prompt], ensure_ascii=False).encode("utf-8")).hexdigest()
+    def _path(self, key: str) -> str: return os.path.join(self.directory, key[:2], f"{key}.json")
+    def get(self, key: str) -> str | None:
+        path = self._path(key)
+        try:
+            if time.time() - os.path.getmtime(path) > self.max_age: return None
+            with open(path, "r", encoding="utf-8") as f: text = json.load(f)["text"]
+            os.utime(path) # Mark as recently used for LRU eviction
+            return text
+        except (OSError, ValueError, KeyError, TypeError): return None
+    def put(self, key: str, text: str, **meta):
+        path = self._path(key); data = json.dumps({**meta, "created": time.time(), "text": text}, ensure_ascii=False)
+        try: replaced = os.path.getsize(path)
+        except OSError: replaced = 0
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            atomic_write_text(path, data)
+        except OSError as e: print(f"Warn: Response cache write failed: {e}"); return
+        with self._lock:
+            if self._total is not None: self._total += len(data.encode("utf-8")) - replaced
+            due = self._total is None or self._total > self.max_bytes or time.time() - self._swept > self.sweep_interval
+        if due: self.prune()
+    def prune(self):
+        """Drops expired entries, then, if the cache is over max_bytes, the least recently used ones until it is under
+        RESPONSE_CACHE_PRUNE_TO of max_bytes."""
+        with self._lock:
+            entries, total, now = [], 0, time.time()
+            for root, _, files in os.walk(self.directory):
+                for name in files:
+                    path = os.path.join(root, name)
+                    try: st = os.stat(path)
+                    except OSError: continue
+                    if now - st.st_mtime > self.max_age or (name.endswith(".tmp") and now - st.st_mtime > 3600):
+                        try: os.remove(path)
+                        except OSError: pass
+                        continue
+                    entries.append((st.st_mtime, st.st_size, path)); total += st.st_size
+            target = self.max_bytes * RESPONSE_CACHE_PRUNE_TO if total > self.max_bytes else self.max_bytes
+            for _, size, path in sorted(entries):
+                if total <= target: break
+                try: os.remove(path); total -= size
+                except OSError: pass
+            self._total, self._swept = total, now
+    def clear(self):
+        with self._lock:
+            self._total, self._swept = 0, time.time()
+            for root, _, files in os.walk(self.directory):
+                for name in files:
+                    try: os.remove(os.path.join(root, name))
+                    except OSError: pass
+
+MODEL_LIST_CACHE_PATH = os.path.join(APP_DATA_DIR, "cache", "models.json")
+MODEL_LIST_TTL = 24 * 3600 # Seconds
+
+class ModelListCache:
+    """Per-provider model lists persisted in one JSON file, keyed by a hash of the API key (the key itself is never stored)."""
+    def __init__(self, path: str = MODEL_LIST_CACHE_PATH, ttl: float = MODEL_LIST_TTL):
+        self.path, self.ttl = path, ttl; self._lock = threading.Lock()
+        try:
+            with open(path, "r", encoding="utf-8") as f: self._data = json.load(f)
+            if not isinstance(self._data, dict): self._data = {}
+        except (OSError, ValueError): self._data = {}
+    @staticmethod
+    def _key_hash(provider: str, api_key: str) -> str: return hashlib.sha256(f"{provider}\0{api_key}".encode("utf-8")).hexdigest()
+    def get(self, provider: str, api_key: str):
+        """Returns (models, is_fresh), or None if nothing is cached for this provider and key."""
+        with self._lock: entry = self._data.get(self._key_hash(provider, api_key))
+        if not entry or not entry.get("models"): return None
+        return list(entry["models"]), time.time() - entry.get("fetched", 0) <= self.ttl
+    def put(self, provider: str, api_key: str, models: list[str]):
+        with self._lock:
+            self._data[self._key_hash(provider, api_key)] = {"provider": provider, "models": list(models), "fetched": time.time()}
+            try:
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                atomic_write_text(self.path, json.dumps(self._data, indent=2))
+            except OSError as e: print(f"Warn: Model list cache write failed: {e}")
+
+class CachedAIService(AIService):
+    """Wraps another AIService and serves repeated prompts from a ResponseCache.
+    With read_cache=False the cache is bypassed for lookups but still refreshed with the new output."""
+    def __init__(self, inner: AIService, provider: str, cache: ResponseCache, read_cache: bool = True):
+        self.inner, self.provider, self.cache, self.read_cache = inner, provider, cache, read_cache
+        self.hits = 0
+    def list_models(self, api_key: str) -> list[str]: return self.inner.list_models(api_key)
+    def _store(self, key: str, text: str, model: str, temperature: float):
+        backup = getattr(_current_call, "backup_answer", None)
+        if backup: log.debug(f"Response cache - not caching {key[:12]}, answered by hedge backup {backup}"); return # Would be served later as the primary model's output
+        self.cache.put(key, text, provider=self.provider, model=model, temperature=temperature)
+    def generate_text(self, api_key: str, model: str, prompt: str, temperature: float = 0.3) -> str:
+        key = ResponseCache.make_key(self.provider, model, temperature, prompt)
+        if self.read_cache:
+            cached = self.cache.get(key)
+            if cached is not None: self.hits += 1; note_call(cached=True); log.debug(f"Response cache hit {key[:12]}"); return cached
+        _current_call.backup_answer = None
+        text = self.inner.generate_text(api_key, model, prompt, temperature=temperature).strip()
+        self._store(key, text, model, temperature); return text
+    def generate_text_stream(self, api_key: str, model: str, prompt: str, temperature: float = 0.3, cancel: CancelToken | None = None):
+        key = ResponseCache.make_key(self.provider, model, temperature, prompt)
+        if self.read_cache:
+            cached = self.cache.get(key)
+            if cached is not None: self.hits += 1; note_call(cached=True); log.debug(f"Response cache hit {key[:12]}"); yield cached; return
+        parts = []; _current_call.backup_answer = None
+        for chunk in self.inner.generate_text_stream(api_key, model, prompt, temperature=temperature, cancel=cancel): parts.append(chunk); yield chunk
+        self._store(key, "".join(parts).strip(), model, temperature) # Only complete streams are cached
+
+
+# --- Incremental Regeneration Manifest ---
+MANIFEST_FILENAME = ".blueprint_manifest.json"
+
+def prompt_fingerprint(filename: str, prompt: str, provider: str, model: str, chunked: bool = False) -> str:
+    """Each prompt is built only from the project fields its file depends on, so hashing it fingerprints those inputs.
+    chunked (the chunked_docs setting) only counts for CHUNKED_FILES, whose output it changes without changing the prompt."""
+    return hashlib.sha256(json.dumps([filename, provider, model, prompt] + (["chunked"] if chunked and filename in CHUNKED_FILES else []), ensure_ascii=False).encode("utf-8")).hexdigest()
+
+def load_manifest(folder: str) -> dict:
+    try:
+        with open(os.path.join(folder, MANIFEST_FILENAME), "r", encoding="utf-8") as f: manifest = json.load(f)
+        return manifest if isinstance(manifest, dict) and isinstance(manifest.get("files"), dict) else {"version": 1, "files": {}}
+    except (OSError, ValueError): return {"version": 1, "files": {}}
+
+def save_manifest(folder: str, manifest: dict):
+    try: atomic_write_text(os.path.join(folder, MANIFEST_FILENAME), json.dumps(manifest, indent=2, ensure_ascii=False))
+    except OSError as e: print(f"Warn: Could not write manifest: {e}")
+
+def split_unchanged_prompts(prompts: dict[str, str], folder: str, provider: str, model: str, chunked: bool = False):
+    """Returns (prompts_to_generate, unchanged_results): files whose fingerprint matches the manifest and that still exist are read back from disk."""
+    recorded = load_manifest(folder)["files"]; to_generate, unchanged = {}, {}
+    for filename, prompt in prompts.items():
+        entry = recorded.get(filename) or {}; path = os.path.join(folder, filename)
+        if entry.get("fingerprint") == prompt_fingerprint(filename, prompt, provider, model, chunked) and not entry.get("hedge_backup") and os.path.isfile(path):
+            try:
+                with open(path, "r", encoding="utf-8") as f: unchanged[filename] = f.read()
+                continue
+            except OSError: pass
+        to_generate[filename] = prompt
+    return to_generate, unchanged
+
+def record_manifest(folder: str, prompts: dict[str, str], results: dict[str, str], provider: str, model: str, backup_answered: dict[str, str] | None = None, chunked: bool = False):
+    """backup_answered maps files written (partly) by a hedge backup to its 'provider/model'; they are flagged so changed-only runs regenerate them."""
+    manifest = load_manifest(folder); backup_answered = backup_answered or {}
+    for filename in results:
+        if filename in prompts:
+            manifest["files"][filename] = {"fingerprint": prompt_fingerprint(filename, prompts[filename], provider, model, chunked), "provider": provider, "model": model, "generated": time.time()}
+            if filename in backup_answered: manifest["files"][filename]["hedge_backup"] = backup_answered[filename]
+    save_manifest(folder, manifest)
+
+
+# --- Resumable Generation Checkpoint ---
+CHECKPOINT_FILENAME = ".blueprint_checkpoint.json"
+
+class GenerationCheckpoint:
+    """Records each file of the current run (fingerprint + output) in the output folder as soon as it is written, so an
+    interrupted run can be resumed. The file is removed once a run finishes without errors."""
+    def __init__(self, folder: str, resume: bool = False):
+        self.path = os.path.join(folder, CHECKPOINT_FILENAME); self._lock = threading.Lock(); self.files = {}
+        if resume:
+            try:
+                with open(self.path, "r", encoding="utf-8") as f: self.files = json.load(f).get("files", {})
+            except (OSError, ValueError, AttributeError): self.files = {}
+    def restore(self, prompts: dict[str, str], provider: str, model: str, chunked: bool = False):
+        """Returns (remaining_prompts, restored_results). Checkpointed files whose fingerprint still matches are re-written
+        to disk from the checkpoint, so missing or half-written files are repaired without a new request."""
+        remaining, restored = {}, {}
+        for filename, prompt in prompts.items():
+            entry = self.files.get(filename) or {}
+            if entry.get("fingerprint") == prompt_fingerprint(filename, prompt, provider, model, chunked) and isinstance(entry.get("output"), str):
+                try: atomic_write_text(os.path.join(os.path.dirname(self.path), filename), entry["output"]); restored[filename] = entry["output"]; continue
+                except OSError as e: print(f"Warn: Could not restore {filename} from checkpoint: {e}")
+            remaining[filename] = prompt
+        return remaining, restored
+    def record(self, filename: str, fingerprint: str, output: str):
+        with self._lock:
+            self.files[filename] = {"fingerprint": fingerprint, "output": output, "written": time.time()}
+            try: atomic_write_text(self.path, json.dumps({"version": 1, "files": self.files}, ensure_ascii=False))
+            except OSError as e: print(f"Warn: Could not write checkpoint: {e}")
+    def clear(self):
+        with self._lock, contextlib.suppress(OSError): os.remove(self.path)
+
+
+# --- Module Tree Model ---
+class ModuleSearchIndex:
+    """Inverted index from lower-cased word tokens to module ids. Every query term must match the start of a token
+    (AND of prefixes), so partial words work for type-ahead. Prefix lookups bisect a sorted vocabulary."""
+    TOKEN_RE = re.compile(r"\w+")
+    def __init__(self): self._postings: dict[str, set[int]] = {}; self._vocab: list[str] = []; self._tokens: dict[int, set[str]] = {}
+    @classmethod
+    def tokenize(cls, text: str) -> set[str]: return set(cls.TOKEN_RE.findall(text.lower()))
+    def clear(self): self._postings.clear(); self._vocab.clear(); self._tokens.clear()
+    def __len__(self) -> int: return len(self._tokens)
+    def load(self, entries):
+        """Bulk rebuild from (module_id, *texts) tuples; sorts the vocabulary once instead of per token."""
+        self.clear()
+        for module_id, *texts in entries:
+            tokens = self._tokens[module_id] = set().union(*(self.tokenize(t) for t in texts if t))
+            for tok in tokens: self._postings.setdefault(tok, set()).add(module_id)
+        self._vocab = sorted(self._postings)
+    def add(self, module_id: int, *texts: str):
+        self.remove(module_id); tokens = self._tokens[module_id] = set().union(*(self.tokenize(t) for t in texts if t))
+        for tok in tokens:
+            ids = self._postings.get(tok)
+            if ids is None: ids = self._postings[tok] = set(); bisect.insort(self._vocab, tok)
+            ids.add(module_id)
+    def remove(self, module_id: int):
+        for tok in self._tokens.pop(module_id, ()):
+            ids = self._postings.get(tok)
+            if ids is None: continue
+            ids.discard(module_id)
+            if not ids: del self._postings[tok]; del self._vocab[bisect.bisect_left(self._vocab, tok)]
+    def _prefix_ids(self, prefix: str) -> set[int]:
+        ids, i = set(), bisect.bisect_left(self._vocab, prefix)
+        while i < len(self._vocab) and self._vocab[i].startswith(prefix): ids |= self._postings[self._vocab[i]]; i += 1
+        return ids
+    def search(self, query: str) -> set[int]:
+        result = None
+        for term in sorted(self.tokenize(query), key=len, reverse=True): # Longest terms first: usually the fewest candidates
+            ids = self._prefix_ids(term); result = ids if result is None else result & ids
+            if not result: break
+        return result or set()
+
+class ModuleTree:
+    """Module hierarchy with id, children, display-path and search indexes kept up to date on add, remove and load.
+    Modules are the same dicts stored in .bpgproj files: {'id', 'parent_id', 'nama', 'deskripsi'}. Loaded with a describe
+    callback (e.g. ProjectArchive.description), modules may lack 'deskripsi' until description(), search() or to_list() fetches it."""
+    PATH_SEP = " :: "
+    def __init__(self, modules: list[dict] | None = None):
+        self._by_id: dict[int, dict] = {}; self._children: dict[int | None, list[int]] = {}
+        self._paths: dict[int, str] = {}; self._by_path: dict[str, int] = {}; self._search = ModuleSearchIndex(); self._describe = None
+        if modules: self.load(modules)
+    def load(self, modules: list[dict], describe=None):
+        self.clear(); self._describe = describe
+        for mod in modules: self._by_id[mod['id']] = mod; self._children.setdefault(mod.get('parent_id'), []).append(mod['id'])
+        for mod_id in self._by_id: self._by_path.setdefault(self.display_path(mod_id), mod_id)
+        self._index_all()
+    def _index_all(self): self._search.load((mod_id, mod['nama'], mod.get('deskripsi') or "", self.display_path(mod_id)) for mod_id, mod in self._by_id.items())
+    def clear(self): self._by_id.clear(); self._children.clear(); self._paths.clear(); self._by_path.clear(); self._search.clear(); self._describe = None
+    def __len__(self) -> int: return len(self._by_id)
+    def __contains__(self, module_id) -> bool: return module_id in self._by_id
+    def description(self, module_id: int) -> str:
+        """The module's description, fetched through the describe callback (and kept) the first time it is asked for."""
+        mod = self._by_id.get(module_id)
+        if mod is None: return ""
+        if 'deskripsi' not in mod: mod['deskripsi'] = self._describe(module_id) if self._describe else ""
+        return mod['deskripsi']
+    def fetch_descriptions(self):
+        """Fetches every missing description, indexes them for search and drops the describe callback."""
+        if self._describe is None: return
+        for mod_id in self._by_id: self.description(mod_id)
+        self._describe = None; self._index_all()
+    def to_list(self) -> list[dict]: self.fetch_descriptions(); return list(self._by_id.values()) # Insertion order, as saved before
+    def get(self, module_id: int) -> dict | None: return self._by_id.get(module_id)
+    def children_ids(self, parent_id: int | None) -> list[int]: return list(self._children.get(parent_id, ()))
+    def sorted_children_ids(self, parent_id: int | None) -> list[int]: return sorted(self._children.get(parent_id, ()), key=lambda c: self._by_id[c]['nama'])
+    def descendant_ids(self, module_id: int) -> list[int]:
+        """All descendants in pre-order (children before grandchildren of the next sibling)."""
+        desc, stack = [], list(reversed(self._children.get(module_id, ())))
+        while stack:
+            child = stack.pop(); desc.append(child); stack.extend(reversed(self._children.get(child, ())))
+        return desc
+    def ancestor_ids(self, module_id: int) -> list[int]:
+        """Ancestors from the top level down to the direct parent."""
+        chain, mod = [], self._by_id.get(module_id)
+        while mod is not None and mod.get('parent_id') is not None and mod['parent_id'] not in chain:
+            chain.append(mod['parent_id']); mod = self._by_id.get(mod['parent_id'])
+        return chain[::-1]
+    def display_path(self, module_id: int) -> str:
+        """'Parent :: Child' path, cached per module. Costs O(depth) the first time."""
+        path = self._paths.get(module_id)
+        if path is not None: return path
+        mod = self._by_id.get(module_id)
+        if not mod: return "Unknown"
+        parent_id = mod.get('parent_id')
+        path = mod['nama'] if parent_id is None else f"{self.display_path(parent_id)}{self.PATH_SEP}{mod['nama']}"
+        self._paths[module_id] = path; return path
+    def id_for_path(self, path: str) -> int | None: return self._by_path.get(path)
+    def has_child_named(self, parent_id: int | None, name: str) -> bool: return any(self._by_id[c]['nama'].lower() == name.lower() for c in self._children.get(parent_id, ()))
+    def add(self, mod: dict):
+        self._by_id[mod['id']] = mod; self._children.setdefault(mod.get('parent_id'), []).append(mod['id'])
+        path = self.display_path(mod['id']); self._by_path.setdefault(path, mod['id']); self._search.add(mod['id'], mod['nama'], mod.get('deskripsi') or "", path)
+    def remove_subtree(self, module_id: int) -> list[int]:
+        """Removes a module and all its descendants. Returns the removed ids (the module first)."""
+        if module_id not in self._by_id: return []
+        removed = [module_id] + self.descendant_ids(module_id)
+        siblings = self._children.get(self._by_id[module_id].get('parent_id'))
+        if siblings and module_id in siblings: siblings.remove(module_id)
+        for mod_id in removed:
+            self._by_id.pop(mod_id, None); self._children.pop(mod_id, None); self._search.remove(mod_id); path = self._paths.pop(mod_id, None)
+            if path is not None and self._by_path.get(path) == mod_id: del self._by_path[path]
+        return removed
+    def search(self, query: str, limit: int | None = None) -> list[int]:
+        """Ids of modules whose name, description or display path contains a word starting with each query term, in path order."""
+        self.fetch_descriptions(); return sorted(self._search.search(query), key=self.display_path)[:limit]
+
+
+# --- Prompt Building ---
+def format_modules_hierarchical(modules: list[dict], descriptions: bool = True) -> str:
+    """Renders the flat module list as an indented markdown outline, children sorted by name."""
+    children = {}
+    for mod in modules: children.setdefault(mod.get('parent_id'), []).append(mod)
+    lines = []
+    def add_rec(parent_id, indent):
+        for mod in sorted(children.get(parent_id, []), key=lambda m: m['nama']):
+            lines.append(f"{'    ' * indent}- **{mod['nama']}:** {mod['deskripsi']}\n" if descriptions else f"{'    ' * indent}- **{mod['nama']}**\n"); add_rec(mod['id'], indent + 1)
+    add_rec(None, 0); return "".join(lines)
+
+def _tech_summary(d: dict) -> str:
+    tech = f"- Langs: {d['language']}"+(f"\n- WebFw: {d['web_framework']}" if d.get('web_framework') else "")+(f"\n- UI Lib: {d['ui_lib']}" if d.get('ui_lib') else "")+(f"\n- State: {d['state_mgmt']}" if d.get('state_mgmt') else "")+(f"\n- DB: {d['database']}" if d.get('database') else "")+(f"\n- Libs: {d['key_libs']}" if d.get('key_libs') else "")
+    # --- FIX: Include deployment_target in tech summary ---
+    if d.get('deployment_target'): tech += f"\n- **Deployment:** {d['deployment_target']}"
+    return tech
+
+PROMPT_TOKEN_BUDGETS = { # Input tokens per prompt by model-name prefix (context window minus room for the answer); longest prefix wins
+    "gpt-4o": 100_000, "gpt-4.1": 100_000, "gpt-4-turbo": 100_000, "gpt-4-32k": 24_000, "gpt-4": 5_000, "gpt-3.5-turbo": 12_000,
+    "gemini-1.5": 500_000, "gemini-2": 500_000, "gemini-pro": 24_000,
+}
+DEFAULT_PROMPT_TOKEN_BUDGET = 12_000 # Unknown models
+CONTEXT_TRIM_ORDER = ("Notes", "Principles", "NFRs", "WF", "Users", "Data", "Modules", "Features") # Trimmed first to last; Goal/Type/Stack never
+CONTEXT_TRIM_MARKER = "[trimmed]"
+
+def prompt_token_budget(model: str | None, override: int | None = None) -> int | None:
+    """Input budget for model, or None (no limit) when neither a model nor an override is given."""
+    if override: return int(override)
+    if not model: return None
+    name = model.removeprefix("models/"); match = max((p for p in PROMPT_TOKEN_BUDGETS if name.startswith(p)), key=len, default=None)
+    return PROMPT_TOKEN_BUDGETS[match] if match else DEFAULT_PROMPT_TOKEN_BUDGET
+
+def build_project_context(d: dict, budget: int | None = None) -> tuple[str, list[str]]:
+    """Renders the project context shared by every document prompt, always in the same field order so the prompts share
+    one byte-identical prefix (provider-side prompt caching). If it exceeds budget tokens, fields are shortened in
+    CONTEXT_TRIM_ORDER (module descriptions are dropped before the module outline is cut). Returns (context, trimmed fields)."""
+    modules = d.get('modules', []); mods = format_modules_hierarchical(modules)
+    fields = {"Goal": d['purpose'], "Type": d['project_type'], "Stack": _tech_summary(d), "Deployment Target": d.get('deployment_target') or 'Not specified',
+              "Testing": "Include `tests/`." if d['tests_enabled'] else "Disabled.", "Users": d['target_users'] or 'N/A', "WF": d['main_workflow'] or 'N/A',
+              "Data": d['data_entities'] or 'N/A', "Principles": d['design_principles'] or 'N/A', "NFRs": d['nfrs'] or 'N/A', "Notes": d['notes'] or 'N/A',
+              "Features": d.get('features_manual') or 'N/A', "Modules": f"\n{mods}" if mods else 'N/A'}
+    render = lambda: f"Project '{d['name']}'. Context:\n" + "\n".join(f"{k}:{v}" for k, v in fields.items()).rstrip()
+    trimmed = []
+    for label in (CONTEXT_TRIM_ORDER if budget else ()):
+        excess = estimate_tokens(render()) - budget
+        if excess <= 0: break
+        if len(fields[label]) <= 40: continue # Nothing worth trimming (e.g. 'N/A')
+        trimmed.append(label)
+        if label == "Modules":
+            fields[label] = f"\n{format_modules_hierarchical(modules, descriptions=False)}{CONTEXT_TRIM_MARKER} descriptions omitted\n"; excess = estimate_tokens(render()) - budget
+            if excess <= 0: break
+        keep = len(fields[label]) - excess * 4 - len(CONTEXT_TRIM_MARKER) - 1
+        fields[label] = f"{fields[label][:keep].rstrip()} {CONTEXT_TRIM_MARKER}" if keep > 0 else CONTEXT_TRIM_MARKER
+    return render(), trimmed
+
+def prepare_prompts(d: dict, model: str | None = None) -> dict[str, str]:
+    """Builds the per-file prompts from a project dict (as produced by ambil_input_data / saved in .bpgproj).
+    The document prompts are the shared project context plus a per-file task; with a model (or d['prompt_budget']) the
+    context is trimmed so the largest prompt fits that model's input budget."""
+    prompts = {}; test_md = "**Testing:** Incl tests." if d['tests_enabled'] else "**Testing:** Disabled."
+    test_ctx, test_rules = ("\n- Testing: Include `tests/`.", "MUST have tests.") if d['tests_enabled'] else ("\n- Testing: Disabled.", "NO tests.")
+    safety = """Before generating, modifying, deleting, or replacing any code, file, or folder, you MUST FIRST perform a full scan and complete understanding of the ENTIRE codebase. This includes reading all source files, project structure, file contents, configurations, and previously generated outputs. You must never operate on a partial view or act based on assumptions. You are required to detect what parts of the application are already implemented, working as expected, and approved by the user. Do NOT alter any working or finalized component unless explicitly requested. Any modification must be aligned with the existing working structure. When in doubt, stop and ask. Violating this rule will result in corruption of the entire application. This is a MANDATORY FINAL STEP CHECK before every action you perform in this development environment."""
+    tech = _tech_summary(d); target = d.get('deployment_target', 'Not specified')
+    # --- FIX: Include deployment_target in system prompt ---
+    sys_p = f"AI architect for '{d['name']}'. Goal:{d['purpose']}. Users:{d['target_users'] or 'N/A'}. WF:{d['main_workflow'] or 'N/A'}. Data:{d['data_entities'] or 'N/A'}. Type:{d['project_type']}. Stack:\n{tech}\nDeployment Target: {target}. Principles:{d['design_principles'] or 'N/A'}. NFRs:{d['nfrs'] or 'N/A'}. Notes:{d['notes'] or 'N/A'}{test_ctx}\nStrictly adhere to docs/rules. Clean, modular code."
+    rules = [safety.strip(), test_rules, f"Langs:{d['language']}.", f"Type:'{d['project_type']}'.",]+([f"Use '{d[k]}'." for k in ['web_framework','ui_lib','state_mgmt','database'] if d.get(k)])+([f"Apply:{d['design_principles']}."] if d.get('design_principles') else [])
+    prompts[".cursorrules"] = json.dumps({"system": sys_p, "rules": rules}, indent=2)
+    # --- FIX: Include deployment target instruction in the document tasks ---
+    tasks = {"architecture.md": f"Create `arch.md`. Detail: 1.Arch Style. 2.Components. 3.Folders(explain,configs). 4.Responsibilities(hierarchical). 5.Data Model. 6.API Contract. 7.Tech Justification. 8.{test_md} 9.Deployment Strategy(Conceptual): **Describe strategy suitable for '{target}'. Avoid complex setups if 'Simple Web Server' chosen.**",
+             "project_plan.md": f"Create `plan.md`. Gen plan: 1.Summary. 2.Scope. 3.Phases. 4.Checklist (`- [ ]`) per phase (realistic, scope, order, incl **setup relevant to '{target}'**, link tasks to modules, {test_md}). 5.Tech Summary."}
+    if d['gen_readme']: tasks["README.md"] = f"Create `README.md` titled '# {d['name']}' with sections: ## Desc (goal, users). ## Features (list based on Features/Modules above). ## Stack. ## Setup (steps **appropriate for '{d.get('deployment_target', 'simple server')}'** and {d['language']}/{d.get('web_framework','')}...). ## Running (basic run command **appropriate for '{d.get('deployment_target', 'simple server')}'**...)."
+    budget = prompt_token_budget(model, d.get('prompt_budget'))
+    context_budget = budget - max(estimate_tokens(t) + 2 for t in tasks.values()) if budget else None
+    if context_budget is not None and context_budget < 1: # 0 would disable trimming; trim as far as possible instead
+        print(f"Warn: Prompt budget of {budget} tokens is smaller than the largest task prompt; context is cut to the minimum and prompts will still exceed it."); context_budget = 1
+    context, trimmed = build_project_context(d, context_budget)
+    if trimmed: log.debug(f"Prompt context trimmed to fit {budget} tokens: {trimmed}")
+    for filename, task in tasks.items(): prompts[filename] = f"{context}\n\nTASK:{task}" # Shared prefix first, file-specific task last
+    if d['gen_gitignore']: prompts[".gitignore"] = f"Gen `.gitignore` for: {d['language']},{d.get('web_framework','')},{d.get('ui_lib','')}. Incl OS,IDE,deps,env,logs. RAW ONLY."
+    return prompts
+
+def prompt_size_summary(d: dict, prompts: dict[str, str], model: str | None = None) -> str:
+    """One-line estimate of the input that will be sent to the model (local files and .cursorrules excluded)."""
+    sent = {f: estimate_tokens(p) for f, p in prompts.items() if f != ".cursorrules" and f not in render_local_files(d, prompts)}
+    if not sent: return "Est. input: no AI calls needed"
+    budget = prompt_token_budget(model, d.get('prompt_budget')); largest = max(sent, key=sent.get)
+    trimmed = any(CONTEXT_TRIM_MARKER in prompts[f] for f in sent)
+    return f"Est. input: ~{sum(sent.values()):,} tokens in {len(sent)} prompt(s), largest {largest} ~{sent[largest]:,}" + (f" / budget {budget:,}" if budget else "") + (" (context trimmed)" if trimmed else "")
+
+
+# --- Local .gitignore Templates ---
+# Composed offline from the language/framework/UI choices, so .gitignore needs no LLM call. Any choice not listed here
+# (e.g. a framework typed into a combo box) makes render_local_gitignore() return None and the LLM prompt is used instead.
+GITIGNORE_COMMON = {
+    "OS": [".DS_Store", "._*", "Thumbs.db", "ehthumbs.db", "Desktop.ini", "$RECYCLE.BIN/", "*~"],
+    "IDE": [".idea/", ".vscode/*", "!.vscode/extensions.json", "*.swp", "*.swo", "*.sublime-workspace", ".history/"],
+    "Environment": [".env", ".env.*", "!.env.example", "*.pem"],
+    "Logs": ["logs/", "*.log", "npm-debug.log*", "yarn-debug.log*", "yarn-error.log*"],
+}
+GITIGNORE_LANGUAGES = { # Keys are lower-case language names from PROGRAMMING_LANGUAGES; [] means nothing language-specific
+    "python": ["__pycache__/", "*.py[cod]", "*.egg-info/", ".eggs/", "build/", "dist/", ".venv/", "venv/", "env/", ".pytest_cache/", ".mypy_cache/", ".ruff_cache/", ".tox/", ".coverage", "htmlcov/", ".ipynb_checkpoints/"],
+    "javascript": ["node_modules/", "dist/", "build/", "coverage/", ".npm/", ".eslintcache", "*.tsbuildinfo", ".cache/"],
+    "typescript": ["node_modules/", "dist/", "build/", "coverage/", ".npm/", ".eslintcache", "*.tsbuildinfo", ".cache/"],
+    "java": ["*.class", "*.jar", "*.war", "*.ear", "target/", "build/", ".gradle/", "out/", "hs_err_pid*"],
+    "kotlin": ["*.class", "*.jar", "build/", ".gradle/", "out/", ".kotlin/", "local.properties"],
+    "scala": ["*.class", "target/", "project/target/", "project/project/", ".bsp/", ".metals/", ".bloop/"],
+    "groovy": ["*.class", "build/", ".gradle/", "out/"],
+    "c#": ["bin/", "obj/", "*.user", "*.suo", ".vs/", "*.nupkg", "packages/", "TestResults/"],
+    "c++": ["build/", "cmake-build-*/", "CMakeCache.txt", "CMakeFiles/", "*.o", "*.obj", "*.a", "*.lib", "*.so", "*.dylib", "*.dll", "*.exe", "*.out"],
+    "c": ["build/", "*.o", "*.obj", "*.a", "*.lib", "*.so", "*.dylib", "*.dll", "*.exe", "*.out"],
+    "objective-c": ["build/", "DerivedData/", "xcuserdata/", "*.xcuserstate", "Pods/"],
+    "swift": [".build/", "DerivedData/", "xcuserdata/", "*.xcuserstate", ".swiftpm/", "Pods/"],
+    "go": ["bin/", "*.exe", "*.test", "*.out", "vendor/", "go.work"],
+    "rust": ["target/", "**/*.rs.bk"],
+    "php": ["vendor/", ".phpunit.result.cache", "composer.phar"],
+    "ruby": [".bundle/", "vendor/bundle/", "*.gem", "coverage/", "tmp/", ".byebug_history"],
+    "dart": [".dart_tool/", ".packages", "build/", ".flutter-plugins", ".flutter-plugins-dependencies"],
+    "r": [".Rhistory", ".RData", ".Rproj.user/", "*.Rproj"],
+    "julia": ["*.jl.cov", "*.jl.mem", "Manifest.toml"],
+    "matlab": ["*.asv", "*.mex*", "slprj/"],
+    "perl": ["blib/", "_build/", "Build", "Build.bat", "MYMETA.*", "local/"],
+    "lua": ["luac.out", "*.luac", "lua_modules/"],
+    "gdscript": [".godot/", ".import/", "export.cfg", "export_presets.cfg"],
+    "zig": ["zig-cache/", ".zig-cache/", "zig-out/"],
+    "assembly": ["*.o", "*.obj", "*.bin", "*.lst"],
+    "html": [], "css": [".sass-cache/", "*.css.map"], "sql": [], "bash/shell": [], "powershell": [],
+}
+GITIGNORE_FRAMEWORKS = { # Web frameworks and UI libraries (lower-case names from WEB_FRAMEWORKS / UI_LIBS)
+    "django": ["db.sqlite3", "db.sqlite3-journal", "media/", "staticfiles/", "local_settings.py"], "flask": ["instance/", ".webassets-cache"], "fastapi": [], "pyramid": [],
+    "express": [], "koa": [], "nestjs": ["dist/"], "next.js (react)": [".next/", "out/", "next-env.d.ts", ".vercel/"], "nuxt.js (vue)": [".nuxt/", ".output/", ".nitro/"],
+    "sveltekit": [".svelte-kit/", "build/"], "angular": [".angular/", "dist/"], "spring boot": ["target/", "build/", "HELP.md"], "quarkus": ["target/"], "jakarta ee": ["target/"], "micronaut": ["target/", "build/"],
+    "asp.net core": ["bin/", "obj/", "appsettings.*.local.json"], "ruby on rails": ["/log/*", "/tmp/*", "/storage/*", "/public/assets", "/config/master.key", "/node_modules"], "sinatra": [],
+    "laravel": ["/vendor", "/node_modules", "/public/hot", "/public/storage", "/storage/*.key", ".phpunit.result.cache"], "symfony": ["/var/", "/vendor/", "/public/bundles/"], "codeigniter": ["writable/cache/*", "writable/logs/*", "writable/session/*"],
+    "gin": [], "echo": [], "fiber": [], "net/http": [], "actix web": [], "rocket": [], "axum": [], "warp": [], "ktor": ["build/", ".gradle/"], "vapor": [".build/", "Packages/"], "hummingbird": [".build/"],
+    "react": [], "vue": [], "svelte": [], "solidjs": [], "preact": [], "alpine.js": [], "htmx": [], "htmx (with backend)": [], "streamlit": [".streamlit/secrets.toml"], "dash": [], "nicegui": [".nicegui/"],
+    "flutter": [".dart_tool/", "build/", ".flutter-plugins", ".flutter-plugins-dependencies", "ios/Pods/", "android/.gradle/", "android/local.properties"],
+    "blazor": ["bin/", "obj/"], "maui": ["bin/", "obj/"], "winforms": ["bin/", "obj/"], "wpf": ["bin/", "obj/"], "uno platform": ["bin/", "obj/"], "avalonia ui": ["bin/", "obj/"],
+    "swiftui": [], "uikit": [], "jetpack compose (android/desktop)": [".gradle/", "build/", "local.properties", "*.apk", "*.aab", ".cxx/"], "javafx": [], "swing": [],
+    "leptos": ["target/", "pkg/"], "dioxus": ["target/", "dist/"], "yew": ["target/", "dist/"], "iced": ["target/"],
+}
+
+def render_local_gitignore(d: dict) -> str | None:
+    """Composes .gitignore from the templates above, or returns None if any chosen language/framework/UI lib is unknown."""
+    langs = d.get('language_list') or [l.strip() for l in (d.get('language') or "").split(",") if l.strip()]
+    extras = [v for v in (d.get('web_framework'), d.get('ui_lib')) if v and v.lower() != "none"]
+    if not langs or any(l.lower() not in GITIGNORE_LANGUAGES for l in langs) or any(x.lower() not in GITIGNORE_FRAMEWORKS for x in extras): return None
+    seen, blocks = set(), []
+    for title, lines in [*GITIGNORE_COMMON.items(), *[(l, GITIGNORE_LANGUAGES[l.lower()]) for l in langs], *[(x, GITIGNORE_FRAMEWORKS[x.lower()]) for x in extras]]:
+        new = [ln for ln in lines if ln not in seen]; seen.update(new)
+        if new: blocks.append(f"# {title}\n" + "\n".join(new))
+    return "\n\n".join(blocks) + "\n"
+
+def render_local_files(d: dict, prompts: dict[str, str]) -> dict[str, str]:
+    """Files among prompts that can be produced without the LLM, mapped to their content."""
+    local = {}
+    if ".gitignore" in prompts and (text := render_local_gitignore(d)) is not None: local[".gitignore"] = text
+    return local
+
+
+# --- Chunked (Map-Reduce) Documents ---
+CHUNKED_FILES = ("architecture.md", "project_plan.md")
+CHUNKED_MIN_TOP_MODULES = 2 # Fewer top-level modules than this gain nothing from chunking
+MODULE_SECTIONS_MARKER = "<<MODULE_SECTIONS>>"
+
+def prepare_chunked_prompts(d: dict, filename: str):
+    """Splits architecture.md / project_plan.md into one section prompt per top-level module (map) and a skeleton prompt
+    for the cross-cutting parts that only names the modules (reduce). Returns (section_prompts, skeleton_prompt) or None
+    when the project is too small to chunk. Each section prompt depends only on its own subtree, so the response cache
+    keeps unchanged sections."""
+    tree = ModuleTree(d.get('modules', [])); tops = tree.sorted_children_ids(None)
+    if filename not in CHUNKED_FILES or len(tops) < CHUNKED_MIN_TOP_MODULES: return None
+    test_md = "**Testing:** Incl tests." if d['tests_enabled'] else "**Testing:** Disabled."
+    ctx = f"Goal:{d['purpose']}\nType:{d['project_type']}\nStack:{_tech_summary(d)}\nUsers:{d['target_users'] or 'N/A'}\nData:{d['data_entities'] or 'N/A'}\nPrinciples:{d['design_principles'] or 'N/A'}\nNFRs:{d['nfrs'] or 'N/A'}"
+    sections = {}
+    for top_id in tops:
+        mod = tree.get(top_id); subtree = format_modules_hierarchical([{**mod, 'parent_id': None}] + [tree.get(i) for i in tree.descendant_ids(top_id)])
+        if filename == "architecture.md": task = f"TASK:Write ONLY the `arch.md` section for module '{mod['nama']}', starting with the heading `## Module: {mod['nama']}`. Detail: 1.Responsibilities(hierarchical). 2.Components. 3.Folders/files. 4.Data Model. 5.API Contract. 6.{test_md} No preamble."
+        else: task = f"TASK:Write ONLY the `plan.md` tasks for module '{mod['nama']}', starting with the heading `## Module: {mod['nama']}`. Checklist (`- [ ]`) grouped by phase (realistic, scope, order, {test_md}). No preamble."
+        sections[f"{filename}#{mod['nama']}"] = f"Project '{d['name']}'. Context:\n{ctx}\nModule:\n{subtree}\n{task}"
+    stubs = [{'id': tree.get(t)['id'], 'parent_id': None, 'nama': tree.get(t)['nama'], 'deskripsi': "(detailed in its own section)"} for t in tops]
+    skeleton = prepare_prompts({**d, 'modules': stubs, 'gen_readme': False, 'gen_gitignore': False})[filename]
+    skeleton += f"\n\nIMPORTANT: Per-module details are written separately. Do not detail individual modules; put the line {MODULE_SECTIONS_MARKER} on its own line exactly once where they belong."
+    return sections, skeleton
+
+def _compose_chunked(skeleton_text: str, section_texts: list[str]) -> str:
+    body = "\n\n".join(t.strip() for t in section_texts)
+    return skeleton_text.replace(MODULE_SECTIONS_MARKER, body, 1) if MODULE_SECTIONS_MARKER in skeleton_text else f"{skeleton_text.rstrip()}\n\n{body}"
+
+def expand_chunked_prompts(prompts: dict[str, str], d: dict, svc: AIService, key: str, mdl: str, max_workers: int, on_progress=None, temperature: float = GEN_TEMPERATURE, cancel: CancelToken | None = None, metrics: RunMetrics | None = None):
+    """Map step: generates the module sections of every chunked file in parallel. Returns (prompts, compose, errors, critical)
+    where prompts has the chunked files replaced by their skeleton prompts and compose[filename] merges the skeleton output with its sections."""
+    plans = {f: plan for f in prompts if (plan := prepare_chunked_prompts(d, f))}
+    if not plans: return prompts, {}, [], False
+    section_prompts = {name: p for sections, _ in plans.values() for name, p in sections.items()}
+    texts, errors, critical = generate_texts(svc, key, mdl, section_prompts, max_workers, on_progress, temperature, cancel, metrics)
+    out, compose = dict(prompts), {}
+    for filename, (sections, skeleton) in plans.items():
+        missing = [n.split("#", 1)[1] for n in sections if n not in texts]
+        if missing: # A document with silently missing sections would look complete, so drop it instead
+            del out[filename]; errors.append(f"Gen fail {filename}: section(s) failed: {', '.join(missing)}"); continue
+        out[filename] = skeleton; compose[filename] = (lambda parts: lambda text: _compose_chunked(text, parts))([texts[n] for n in sections])
+    if critical: out = {}
+    return out, compose, errors, critical
+
+
+# --- Generation Pipeline ---
+DEFAULT_GEN_CONCURRENCY = 4
+MAX_GEN_CONCURRENCY = 8
+CRITICAL_GEN_ERRORS = (ValueError, ConnectionError, ImportError) # These cancel the remaining files
+
+def _is_critical_gen_error(e: Exception) -> bool: return isinstance(e, CRITICAL_GEN_ERRORS) or "quota" in str(e).lower()
+
+def _run_bounded(names, work, max_workers: int, stop: threading.Event, cancel: CancelToken | None = None):
+    """Runs work(name) for every name on a bounded pool; once stop is set, queued work is cancelled (in-flight calls finish).
+    Once cancel is cancelled it returns right away: queued work is dropped and in-flight calls are abandoned (work must
+    check the token before publishing a result)."""
+    names = list(names); workers = max(1, min(int(max_workers or 1), MAX_GEN_CONCURRENCY, len(names) or 1))
+    pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bpg-gen"); pending = {pool.submit(work, name) for name in names}
+    try:
+        while pending:
+            _, pending = wait_futures(pending, timeout=0.1 if cancel is not None else None, return_when=FIRST_COMPLETED)
+            if stop.is_set() or (cancel is not None and cancel.cancelled): [f.cancel() for f in pending]
+            if cancel is not None and cancel.cancelled: return
+    finally: pool.shutdown(wait=not (cancel is not None and cancel.cancelled), cancel_futures=True)
+
+def generate_texts(svc: AIService, key: str, mdl: str, prompts: dict[str, str], max_workers: int = DEFAULT_GEN_CONCURRENCY, on_progress=None, temperature: float = GEN_TEMPERATURE, cancel: CancelToken | None = None, metrics: RunMetrics | None = None):
+    """In-memory counterpart of generate_files (nothing is written). Returns (texts, errors, critical)."""
+    texts, errors = {}, []; lock = threading.Lock(); stop = threading.Event(); report = on_progress or (lambda msg: None)
+    def gen_one(name):
+        if stop.is_set() or (cancel is not None and cancel.cancelled): return
+        report(f"Generating {name}...")
+        with (metrics.track(name, prompts[name]) if metrics else contextlib.nullcontext()):
+            try:
+                started = time.perf_counter(); text = svc.generate_text(key, mdl, prompts[name], temperature=temperature).strip(); note_call(generation=round(time.perf_counter() - started, 4))
+                if cancel is not None: cancel.raise_if_cancelled() # Late results of a cancelled run are dropped
+                with lock: texts[name] = text
+            except GenerationCancelled: note_call(status="cancelled")
+            except Exception as e:
+                note_call(status="failed")
+                with lock: errors.append(f"Gen fail {name}: {e}")
+                print(f"ERROR: Worker - Gen fail {name}: {e}")
+                if _is_critical_gen_error(e): stop.set()
+    _run_bounded(prompts, gen_one, max_workers, stop, cancel)
+    with lock: return dict(texts), list(errors), stop.is_set()
+
+def _stream_into_file(svc: AIService, key: str, mdl: str, prompt: str, path: str, temperature: float, on_text, cancel: CancelToken | None = None) -> str:
+    """Streams one completion to disk chunk by chunk (into path + '.partial') and renames it into place once complete.
+    Returns the stripped text; a failed or cancelled stream leaves no file behind."""
+    parts = []; partial = path + ".partial"; started = time.perf_counter()
+    try:
+        with open(partial, "w", encoding="utf-8") as f:
+            for chunk in svc.generate_text_stream(key, mdl, prompt, temperature=temperature, cancel=cancel):
+                if not parts: chunk = chunk.lstrip(); mark_first_token(started) # Match generate_text(), which strips the output
+                if not chunk: continue
+                parts.append(chunk); f.write(chunk); f.flush(); on_text(chunk)
+        if cancel is not None: cancel.raise_if_cancelled()
+    except BaseException as e:
+        with contextlib.suppress(OSError): os.remove(partial)
+        if cancel is not None and cancel.cancelled and not isinstance(e, GenerationCancelled): raise GenerationCancelled("Generation cancelled.") from e # Closed stream
+        raise
+    text = "".join(parts).rstrip()
+    if len(text) != sum(len(p) for p in parts):
+        with open(partial, "w", encoding="utf-8") as f: f.write(text)
+    replace_file(partial, path); return text
+
+def generate_files(svc: AIService, key: str, mdl: str, prompts: dict[str, str], folder: str, max_workers: int = DEFAULT_GEN_CONCURRENCY, on_progress=None, temperature: float = GEN_TEMPERATURE, on_chunk=None, compose=None, on_written=None, cancel: CancelToken | None = None, metrics: RunMetrics | None = None):
+    """Generates every prompt on a bounded worker pool and writes each file into folder.
+    With on_chunk(filename, text) the output is streamed and written progressively.
+    compose maps a filename to a function applied to its generated text before the final write (chunked documents).
+    Files are replaced atomically; on_written(filename, text) runs after each successful write. metrics gets a record per file.
+    Returns (results, errors, critical). A critical error stops files that have not started yet; cancelling cancel stops
+    everything at once and only files completed before that are returned (nothing is written afterwards)."""
+    results, errors = {}, []; lock = threading.Lock(); stop = threading.Event(); total = len(prompts); done = [0]
+    report = on_progress or (lambda msg: None)
+
+    def gen_one(filename):
+        with (metrics.track(filename, prompts[filename] if filename != ".cursorrules" else "") if metrics else contextlib.nullcontext()): generate_one(filename)
+
+    def generate_one(filename):
+        if stop.is_set() or (cancel is not None and cancel.cancelled): note_call(status="skipped"); return # Stopped by a critical error in another worker or by the user
+        prompt_content = prompts[filename]
+        report(f"Generating {filename}...")
+        print(f"DEBUG: Worker - Generating {filename} using {mdl}")
+        path = os.path.join(folder, filename); streamed = False; started = time.perf_counter()
+        try:
+            if filename == ".cursorrules":
+                text = prompt_content; note_call(status="local")
+                try: json.loads(text)
+                except json.JSONDecodeError as json_e:
+                    with lock: errors.append(f"Internal JSON Error .cursorrules: {json_e}")
+                    text = '{"error": "Internal JSON failed"}'
+            elif on_chunk and not (compose and filename in compose): # Merged documents are only written once complete
+                text = _stream_into_file(svc, key, mdl, prompt_content, path, temperature, lambda chunk: on_chunk(filename, chunk), cancel); streamed = True
+            else:
+                text = svc.generate_text(key, mdl, prompt_content, temperature=temperature).strip()
+            note_call(generation=round(time.perf_counter() - started, 4))
+            if cancel is not None and not streamed: cancel.raise_if_cancelled() # A cancelled run writes nothing more
+            merged = compose is not None and filename in compose
+            if merged: text = compose[filename](text) # Skeleton output + module sections
+            try:
+                write_started = time.perf_counter()
+                if not streamed or merged: atomic_write_text(path, text)
+                note_call(write=round(time.perf_counter() - write_started, 4))
+                if on_chunk and not streamed: on_chunk(filename, text)
+                with lock: results[filename] = text
+                if on_written: on_written(filename, text)
+                print(f"DEBUG: Worker - Wrote {filename}")
+            except IOError as write_e:
+                note_call(status="write failed")
+                with lock: errors.append(f"Write fail {filename}: {write_e}")
+        except GenerationCancelled:
+            note_call(status="cancelled"); log.debug(f"Worker - Cancelled {filename}"); return
+        except (ValueError, ConnectionError, ImportError, RuntimeError) as e:
+            note_call(status="failed")
+            with lock: errors.append(f"Gen fail {filename}: {e}")
+            print(f"ERROR: Worker - Gen fail {filename}: {e}")
+            if _is_critical_gen_error(e):
+                print("DEBUG: Worker - Critical error, cancelling remaining files.")
+                stop.set()
+        except OSError as write_e: # Streamed file could not be written
+            note_call(status="write failed")
+            with lock: errors.append(f"Write fail {filename}: {write_e}")
+        except Exception as e:
+            note_call(status="failed")
+            with lock: errors.append(f"Unexpected gen fail {filename}: {e}")
+            print(f"ERROR: Worker - Unexpected gen fail {filename}: {e}", flush=True)
+        with lock: done[0] += 1; finished = done[0]
+        report(f"Finished {filename} ({finished}/{total})")
+
+    _run_bounded(prompts, gen_one, max_workers, stop, cancel)
+    with lock: return dict(results), list(errors), stop.is_set()
+
+def init_git_repo(folder: str) -> bool:
+    """Runs `git init` in folder. Returns True if a repo was created, False if one already existed; raises on failure."""
+    flags = subprocess.CREATE_NO_WINDOW if os.name == 'nt' else 0
+    subprocess.run(['git', '--version'], check=True, capture_output=True, text=True, creationflags=flags)
+    if os.path.isdir(os.path.join(folder, '.git')): return False
+    subprocess.run(['git', 'init'], cwd=folder, check=True, capture_output=True, text=True, creationflags=flags); return True
+
+def run_blueprint(config_data: dict, folder: str, svc: AIService, prov: str, key: str, mdl: str, cache: ResponseCache | None = None, read_cache: bool = True, on_progress=None, prompts: dict[str, str] | None = None, on_chunk=None, scheduler: RequestScheduler | None = REQUEST_SCHEDULER, resume: bool = False, cancel: CancelToken | None = None, metrics: RunMetrics | None = None, backup: tuple[AIService, str, str, str] | None = None) -> dict:
+    """Runs one whole blueprint generation (prompts, cache, changed-only filter, checkpoint, files, manifest, git init) without
+    touching any UI. With resume=True, files finished by an interrupted run are restored from its checkpoint instead of regenerated.
+    Cancelling cancel ends the run early with the files finished so far; the checkpoint is kept so it can be resumed.
+    Files that have a local template (.gitignore) are written without an LLM call.
+    Phase timings and per-file metrics go to metrics (a fresh RunMetrics if None) and are saved as a run report in folder.
+    backup = (service, provider, api_key, model) enables hedging: calls slower than config_data['hedge_percentile'] (default
+    HEDGE_PERCENTILE) of recent latencies, or config_data['hedge_delay'] seconds (default HEDGE_DEFAULT_DELAY) while the model has
+    too few recorded samples, are raced against the backup. Backup answers are not cached and are flagged in the manifest.
+    Outputs cut off at the token limit are continued up to config_data['max_continuations'] (default DEFAULT_MAX_CONTINUATIONS) times.
+    Returns a dict with results, errors, critical, cancelled, git_ok, unchanged, restored, local, cache_hits and metrics."""
+    report = on_progress or (lambda msg: None)
+    metrics = metrics or RunMetrics(); metrics.provider, metrics.model = prov, mdl
+    if prompts is None:
+        with metrics.phase("prompts"): prompts = prepare_prompts(config_data, mdl)
+        log.debug(f"Prompts prepared for: {list(prompts.keys())}"); report(prompt_size_summary(config_data, prompts, mdl))
+    unchanged = {}; chunked = bool(config_data.get('chunked_docs'))
+    if config_data.get('changed_only'):
+        with metrics.phase("changed_only"): prompts, unchanged = split_unchanged_prompts(prompts, folder, prov, mdl, chunked)
+        log.debug(f"Changed-only mode -> regenerate {list(prompts.keys())}, unchanged {list(unchanged.keys())}")
+        report(f"Skipping {len(unchanged)} unchanged file(s)...")
+    all_prompts = prompts; checkpoint = GenerationCheckpoint(folder, resume=resume); restored = {}
+    if resume:
+        with metrics.phase("resume"): prompts, restored = checkpoint.restore(prompts, prov, mdl, chunked)
+        log.debug(f"Resume -> restored {list(restored.keys())}, remaining {list(prompts.keys())}")
+        report(f"Resuming: {len(restored)} file(s) restored from checkpoint...")
+    local, errors = {}, []
+    for filename, text in render_local_files(config_data, prompts).items(): # Template-built files skip the LLM entirely
+        with metrics.phase("local_files"), metrics.track(filename):
+            note_call(status="local")
+            try:
+                atomic_write_text(os.path.join(folder, filename), text); local[filename] = text
+                checkpoint.record(filename, prompt_fingerprint(filename, all_prompts[filename], prov, mdl, chunked), text)
+                if on_chunk: on_chunk(filename, text)
+            except OSError as e: note_call(status="write failed"); errors.append(f"Write fail {filename}: {e}")
+    if local: prompts = {f: p for f, p in prompts.items() if f not in local}; log.debug(f"Local templates -> {list(local.keys())}")
+    if scheduler is not None: svc = ScheduledAIService(svc, prov, scheduler, cancel) # Cache hits below never touch the budgets
+    if backup is not None:
+        backup_svc, backup_prov, backup_key, backup_mdl = backup
+        if scheduler is not None: backup_svc = ScheduledAIService(backup_svc, backup_prov, scheduler, cancel)
+        svc = hedged = HedgedAIService(svc, prov, backup_svc, backup_prov, backup_key, backup_mdl, percentile=config_data.get('hedge_percentile') or HEDGE_PERCENTILE, cancel=cancel, default_delay=config_data.get('hedge_delay') or HEDGE_DEFAULT_DELAY)
+        log.debug(f"Hedging {prov}/{mdl} with {backup_prov}/{backup_mdl}")
+    max_continuations = config_data.get('max_continuations', DEFAULT_MAX_CONTINUATIONS)
+    if max_continuations: svc = ContinuingAIService(svc, max_continuations) # Inside the cache, so only completed outputs are cached
+    if cache is not None: svc = CachedAIService(svc, prov, cache, read_cache=read_cache)
+    workers = config_data.get('gen_concurrency', DEFAULT_GEN_CONCURRENCY); gen_prompts, compose, critical = prompts, {}, False
+    if chunked:
+        with metrics.phase("chunked_sections"): gen_prompts, compose, chunk_errors, critical = expand_chunked_prompts(prompts, config_data, svc, key, mdl, workers, on_progress=report, cancel=cancel, metrics=metrics)
+        errors += chunk_errors; log.debug(f"Chunked docs -> merged files {list(compose.keys())}, errors {len(chunk_errors)}")
+    on_written = lambda filename, text: checkpoint.record(filename, prompt_fingerprint(filename, all_prompts[filename], prov, mdl, chunked), text)
+    with metrics.phase("generation"): results, file_errors, file_critical = generate_files(svc, key, mdl, gen_prompts, folder, max_workers=workers, on_progress=report, on_chunk=on_chunk, compose=compose, on_written=on_written, cancel=cancel, metrics=metrics)
+    errors += file_errors; critical = critical or file_critical; results = {**restored, **local, **results}; cancelled = cancel is not None and cancel.cancelled
+    backup_answered = {name.split("#", 1)[0]: f"{backup[1]}/{backup[3]}" for name, rec in list(metrics.files.items()) if rec.get("hedge_winner") == "backup"} if backup is not None else {} # Sections count for their document
+    with metrics.phase("manifest"): record_manifest(folder, all_prompts, results, prov, mdl, backup_answered, chunked) # Fingerprints use the full (unchunked) prompts plus the chunked setting
+    if not errors and not cancelled and set(results) >= set(all_prompts): checkpoint.clear() # Complete run: nothing left to resume
+    git_ok = None
+    if config_data.get('git_init') and not critical and not cancelled:
+        report("Git init...")
+        with metrics.phase("git_init"):
+            try: git_ok = init_git_repo(folder)
+            except Exception as ge: errors.append(f"Git fail:{ge}")
+        log.debug(f"Git init: ok={git_ok}")
+    if backup is not None: log.debug(f"Hedge - {hedged.hedged} backup request(s), {hedged.backup_wins} won by the backup"); hedged.tracker.save()
+    try: run_report = metrics.write_report(folder)
+    except OSError as e: run_report = metrics.to_dict(); print(f"Warn: Run report write failed: {e}")
+    return {"results": {**unchanged, **results}, "errors": errors, "critical": critical, "cancelled": cancelled, "git_ok": git_ok, "unchanged": sorted(unchanged), "restored": sorted(restored), "local": sorted(local), "cache_hits": getattr(svc, "hits", 0), "metrics": run_report}
+
+
+# --- Generation Jobs ---
+GUI_PARALLEL_JOBS = 2 # Projects the GUI generates at once; each job still runs its files on its own bounded pool
+
+class GenerationJob:
+    """One queued blueprint run: a snapshot of the form data, target folder and prepared prompts, plus its live state.
+    status moves queued -> running -> done / errors / failed / cancelled; progress holds the latest progress message."""
+    _ids = itertools.count(1)
+    def __init__(self, config_data: dict, folder: str, svc: AIService, prov: str, key: str, mdl: str, prompts: dict[str, str], metrics: RunMetrics | None = None, backup=None, resume: bool = False, read_cache: bool = True):
+        self.id = next(self._ids); self.config = copy.deepcopy(config_data); self.name = self.config.get("name") or "Untitled"
+        self.folder, self.svc, self.provider, self.key, self.model, self.prompts = folder, svc, prov, key, mdl, dict(prompts)
+        self.metrics = metrics or RunMetrics(); self.backup, self.resume, self.read_cache = backup, resume, read_cache
+        self.cancel = CancelToken(); self.future = None; self.outcome: dict | None = None
+        self.status = "queued"; self.progress = "Queued"; self.submitted = time.time(); self.started = self.finished = None
+    @property
+    def active(self) -> bool: return self.status in ("queued", "running")
+    def run(self, cache: ResponseCache | None = None, on_progress=None, on_chunk=None) -> dict:
+        """Runs the job on the calling (worker) thread. Never raises; the outcome has the same keys as run_blueprint's."""
+        if self.cancel.cancelled: return self.finish_cancelled()
+        self.status = "running"; self.started = time.time(); log.debug(f"Job {self.id} started ({self.name} -> {self.folder})")
+        def progress(msg):
+            self.progress = msg
+            if on_progress: on_progress(msg)
+        progress("Started")
+        try: outcome = run_blueprint(self.config, self.folder, self.svc, self.provider, self.key, self.model, cache=cache, read_cache=self.read_cache, on_progress=progress, prompts=self.prompts, on_chunk=on_chunk, resume=self.resume, cancel=self.cancel, metrics=self.metrics, backup=self.backup)
+        except Exception as e:
+            print(f"ERROR: Job {self.id} - Generation failed: {e}")
+            outcome = {"results": {}, "errors": [f"Generation failed: {e}"], "cancelled": self.cancel.cancelled, "git_ok": None, "cache_hits": 0, "metrics": self.metrics.to_dict()}
+        return self._finish(outcome)
+    def finish_cancelled(self) -> dict:
+        """Ends a job that was cancelled before it started."""
+        return self._finish({"results": {}, "errors": [], "cancelled": True, "git_ok": None, "cache_hits": 0, "metrics": None})
+    def _finish(self, outcome: dict) -> dict:
+        self.outcome = outcome; self.finished = time.time()
+        self.status = "cancelled" if outcome["cancelled"] else ("failed" if not outcome["results"] else "errors") if outcome["errors"] else "done"
+        self.progress = {"cancelled": "Cancelled", "failed": "Failed", "errors": "Done with errors", "done": "Done"}[self.status]
+        log.debug(f"Job {self.id} {self.status}. Errs:{len(outcome['errors'])}, Res:{len(outcome['results'])}, Cache hits:{outcome['cache_hits']}")
+        return outcome
+
+
+# --- UI Update Bus ---
+UI_TICK_MS = 50 # Fixed drain interval of the UI update bus (~20 redraws per second)
+UI_APPEND_CHARS_PER_TICK = 200_000 # Text inserted per tick; the rest waits for the next tick so one huge append cannot stall a frame
+
+class UIUpdateBus:
+    """Thread-safe channel from worker threads to the Tk loop, drained by one root.after tick every tick_ms.
+    post(key, fn, *args) keeps only the latest update per key (status line, job rows); append(target, text) batches text
+    per target and hands it to the append sink as one string; call(fn, *args) runs every call, in order, after the batched
+    updates of its tick (completions, dialogs). Callbacks run on the Tk thread; failures are logged, never raised."""
+    def __init__(self, root, tick_ms: int = UI_TICK_MS, append_chars_per_tick: int = UI_APPEND_CHARS_PER_TICK):
+        self.root, self.tick_ms, self.append_chars_per_tick = root, tick_ms, append_chars_per_tick
+        self._lock = threading.Lock(); self._latest: dict = {}; self._appends: dict = {}; self._calls: deque = deque()
+        self._append_sink = None; self._running = False
+    def set_append_sink(self, fn): self._append_sink = fn # fn(target, text)
+    def post(self, key, fn, *args):
+        with self._lock: self._latest[key] = (fn, args) # Replacing a pending value keeps its place in the order
+    def append(self, target, text: str):
+        if not text: return
+        with self._lock: self._appends.setdefault(target, []).append(text)
+    def call(self, fn, *args):
+        with self._lock: self._calls.append((fn, args))
+    def discard_appends(self):
+        with self._lock: self._appends.clear()
+    def start(self):
+        if not self._running: self._running = True; self.root.after(self.tick_ms, self._tick)
+    def stop(self): self._running = False
+    def _take_appends(self) -> list[tuple]:
+        """Pops up to append_chars_per_tick characters of pending text (under the lock); the remainder stays queued in order."""
+        taken, budget = [], self.append_chars_per_tick
+        while self._appends and budget > 0:
+            target = next(iter(self._appends)); text = "".join(self._appends.pop(target))
+            if len(text) > budget: self._appends = {target: [text[budget:]], **self._appends}; text = text[:budget]
+            taken.append((target, text)); budget -= len(text)
+        return taken
+    def drain(self):
+        """Runs everything pending. Called by the tick; safe to call directly from the Tk thread."""
+        with self._lock:
+            latest, self._latest = self._latest, {}; appends = self._take_appends()
+            calls = list(self._calls); self._calls.clear()
+        for fn, args in [*latest.values(), *(((self._append_sink, (t, text)) for t, text in appends) if self._append_sink else ()), *calls]:
+            try: fn(*args)
+            except Exception as e: print(f"Warn: UI update {getattr(fn, '__name__', fn)} failed: {e}")
+    def _tick(self):
+        if not self._running: return
+        self.drain()
+        if self._running: self.root.after(self.tick_ms, self._tick) # Rescheduled after draining, so a slow frame is never stacked
 
 
 # --- Main Application Class ---
+TREE_PLACEHOLDER = "::placeholder" # Suffix of the dummy child that gives unexpanded nodes their expand arrow
+MODULE_FILTER_DELAY_MS = 150 # Type-ahead debounce of the module tree filter
+MODULE_FILTER_LIMIT = 500 # Matches shown by the module tree filter
+PARENT_CHOICES_LIMIT = 300 # Entries in the parent picker's drop-down; type in it to search the rest
+RUN_SUMMARY_COLUMNS = ("file", "status", "queue_wait", "ttft", "generation", "write", "prompt_tokens", "completion_tokens") # Columns of the Last Run panel
+JOB_COLUMNS = ("job", "project", "status", "progress", "files", "errors", "folder") # Columns of the Jobs panel
+
 class BlueprintGeneratorApp:
     def __init__(self, root_window):
         # ... (Inisialisasi variabel state lain sama) ...
         self.root = root_window
         self.root.title("Cursor Blueprint Generator 1.5")
         self.root.geometry("1250x850")
-        self.modul_list = []
+        self.modul_tree = ModuleTree() # Indexed module hierarchy (saved as the flat 'modules' list)
+        self._project_archive: ProjectArchive | None = None # Open .bpgz whose descriptions the tree still fetches lazily
         self._next_module_id = 1
         self.treeview_iid_to_module_id = {}
+        self._tree_loaded = set() # Module ids (None = top level) whose children are inserted in the Treeview
+        self.module_filter = tk.StringVar(value=""); self._module_filter_job = None # Type-ahead query of the module tree
         self.tests_enabled = tk.BooleanVar(value=False)
         self.generate_readme = tk.BooleanVar(value=True)
         self.generate_gitignore = tk.BooleanVar(value=True)
         self.git_init_enabled = tk.BooleanVar(value=False)
+        self.gen_concurrency = tk.IntVar(value=DEFAULT_GEN_CONCURRENCY) # Parallel file generations
+        self.changed_only = tk.BooleanVar(value=False) # Skip files whose prompt inputs match the folder manifest
+        self.chunked_docs = tk.BooleanVar(value=False) # Map-reduce architecture.md / project_plan.md per top-level module
+        self.hedge_backup = tk.StringVar(value="") # "Provider:model" raced against slow calls; empty = no hedging
+        self.max_continuations = tk.IntVar(value=DEFAULT_MAX_CONTINUATIONS) # Follow-up calls for outputs cut off at the token limit
+        self.bypass_cache = tk.BooleanVar(value=False) # Skip cached responses (fresh output still refreshes the cache)
+        self.response_cache = ResponseCache()
+        self.model_list_cache = ModelListCache() # Loaded from disk at startup
+        # Worker threads never touch widgets: they post to this bus, which the Tk loop drains on a fixed tick
+        self.ui_bus = UIUpdateBus(self.root); self.ui_bus.set_append_sink(self._append_preview); self.ui_bus.start()
+        self._stream_marks = {} # Streamed preview section -> Text mark where its next chunk goes
+        # Generate queues a GenerationJob; jobs run on a shared bounded pool so the form stays editable meanwhile
+        self.jobs: dict[int, GenerationJob] = {}; self.job_pool = ThreadPoolExecutor(max_workers=GUI_PARALLEL_JOBS, thread_name_prefix="bpg-job")
         # --- NEW: Deployment Target Variable ---
         self.deployment_target = tk.StringVar(value="Simple Web Server (Apache/Nginx/Local)") # Default
         # --------------------------------------
         self.selected_ai_provider = tk.StringVar(value="OpenAI")
-        self.ai_services: dict[str, AIService] = {}
-        if openai_available: self.ai_services["OpenAI"] = OpenAIService()
-        if gemini_available: self.ai_services["Gemini"] = GeminiService()
+        self.ai_services: dict[str, AIService] = create_ai_services()
         if not self.ai_services: messagebox.showerror("AI Error", "No AI libs. Exiting."); self.root.quit(); return
-        self._create_widgets()
+        started = time.perf_counter(); self._create_widgets(); STARTUP_TIMINGS["create_widgets"] = time.perf_counter() - started
+        started = time.perf_counter()
         self._update_language_list(); self._update_dynamic_combos(); self._update_api_key_entry()
-        self._update_parent_module_combo()
+        self._update_parent_module_combo(); STARTUP_TIMINGS["initial_form_state"] = time.perf_counter() - started
+        self.root.protocol("WM_DELETE_WINDOW", self._on_close)
         self.update_status("Ready")
 
     def _create_widgets(self):
@@ -217,20 +1633,30 @@ class BlueprintGeneratorApp:
         self.checkbox_readme = ttk.Checkbutton(gen_options_frame, text="Gen README.md", variable=self.generate_readme); self.checkbox_readme.grid(row=0, column=1, sticky="w", padx=5, pady=2)
         self.checkbox_gitignore = ttk.Checkbutton(gen_options_frame, text="Gen .gitignore", variable=self.generate_gitignore); self.checkbox_gitignore.grid(row=1, column=0, sticky="w", padx=5, pady=2)
         self.checkbox_git_init = ttk.Checkbutton(gen_options_frame, text="Init Git Repo", variable=self.git_init_enabled); self.checkbox_git_init.grid(row=1, column=1, sticky="w", padx=5, pady=2)
+        ttk.Label(gen_options_frame, text="Parallel files:").grid(row=2, column=0, sticky="w", padx=5, pady=2); self.spin_concurrency = ttk.Spinbox(gen_options_frame, from_=1, to=MAX_GEN_CONCURRENCY, textvariable=self.gen_concurrency, width=5, state="readonly"); self.spin_concurrency.grid(row=2, column=1, sticky="w", padx=5, pady=2)
+        self.checkbox_bypass_cache = ttk.Checkbutton(gen_options_frame, text="Bypass cache", variable=self.bypass_cache); self.checkbox_bypass_cache.grid(row=3, column=0, sticky="w", padx=5, pady=2)
+        self.checkbox_changed_only = ttk.Checkbutton(gen_options_frame, text="Regenerate changed only", variable=self.changed_only); self.checkbox_changed_only.grid(row=3, column=1, sticky="w", padx=5, pady=2)
+        self.checkbox_chunked = ttk.Checkbutton(gen_options_frame, text="Chunk large docs by module", variable=self.chunked_docs); self.checkbox_chunked.grid(row=4, column=0, columnspan=2, sticky="w", padx=5, pady=2)
+        ttk.Label(gen_options_frame, text="Hedge slow calls with\n(Provider:model):").grid(row=5, column=0, sticky="w", padx=5, pady=2); self.entry_hedge = ttk.Entry(gen_options_frame, textvariable=self.hedge_backup, width=22); self.entry_hedge.grid(row=5, column=1, sticky="w", padx=5, pady=2)
+        ttk.Label(gen_options_frame, text="Max continuations\n(truncated output):").grid(row=6, column=0, sticky="w", padx=5, pady=2); self.spin_continuations = ttk.Spinbox(gen_options_frame, from_=0, to=10, textvariable=self.max_continuations, width=5, state="readonly"); self.spin_continuations.grid(row=6, column=1, sticky="w", padx=5, pady=2)
 
         # --- Tab 2: Modules (Treeview) ---
         # ... (Kode Tab 2 sama) ...
         tab_modul = ttk.Frame(self.notebook, padding=10); self.notebook.add(tab_modul, text="2. Modules")
         modul_entry_frame = ttk.LabelFrame(tab_modul, text="Add/Edit Module", padding=10); modul_entry_frame.pack(fill="x", pady=5, anchor='n'); modul_entry_frame.columnconfigure(1, weight=1)
-        ttk.Label(modul_entry_frame, text="Parent Module:").grid(row=0, column=0, sticky="w", padx=5, pady=3); self.combo_parent_module = ttk.Combobox(modul_entry_frame, values=["(Top Level)"], width=38, state="readonly"); self.combo_parent_module.grid(row=0, column=1, sticky="ew", padx=5, pady=3); self.combo_parent_module.set("(Top Level)")
+        ttk.Label(modul_entry_frame, text="Parent Module:").grid(row=0, column=0, sticky="w", padx=5, pady=3); self.combo_parent_module = ttk.Combobox(modul_entry_frame, values=["(Top Level)"], width=38); self.combo_parent_module.grid(row=0, column=1, sticky="ew", padx=5, pady=3); self.combo_parent_module.set("(Top Level)"); self.combo_parent_module.bind("<KeyRelease>", self._on_parent_combo_typed) # Typing searches the drop-down
         ttk.Label(modul_entry_frame, text="Module Name:").grid(row=1, column=0, sticky="w", padx=5, pady=3); self.entry_modul_nama = ttk.Entry(modul_entry_frame, width=40); self.entry_modul_nama.grid(row=1, column=1, sticky="ew", padx=5, pady=3)
         ttk.Label(modul_entry_frame, text="Description:").grid(row=2, column=0, sticky="nw", padx=5, pady=3); self.entry_modul_deskripsi = tk.Text(modul_entry_frame, height=4, width=50, wrap=tk.WORD); self.entry_modul_deskripsi.grid(row=2, column=1, sticky="ew", padx=5, pady=3)
         ttk.Button(modul_entry_frame, text="+ Add Module", command=self.tambah_modul).grid(row=3, column=1, sticky="e", pady=5, padx=5)
-        modul_list_frame = ttk.LabelFrame(tab_modul, text="Module Hierarchy", padding=10); modul_list_frame.pack(fill="both", expand=True, pady=5); modul_list_frame.rowconfigure(0, weight=1); modul_list_frame.columnconfigure(0, weight=1)
-        self.module_tree = ttk.Treeview(modul_list_frame, columns=("Description",), selectmode="browse")
+        modul_list_frame = ttk.LabelFrame(tab_modul, text="Module Hierarchy", padding=10); modul_list_frame.pack(fill="both", expand=True, pady=5); modul_list_frame.rowconfigure(1, weight=1); modul_list_frame.columnconfigure(0, weight=1)
+        filter_frame = ttk.Frame(modul_list_frame); filter_frame.grid(row=0, column=0, columnspan=2, sticky="ew", pady=(0, 5)); ttk.Label(filter_frame, text="Search:").pack(side=tk.LEFT, padx=(0, 5))
+        ttk.Entry(filter_frame, textvariable=self.module_filter).pack(side=tk.LEFT, fill="x", expand=True); ttk.Button(filter_frame, text="Clear", command=lambda: self.module_filter.set("")).pack(side=tk.LEFT, padx=(5, 0))
+        self.module_filter.trace_add("write", self._schedule_module_filter)
+        self.module_tree = ttk.Treeview(modul_list_frame, columns=("Description",), selectmode="browse"); self.module_tree.bind("<<TreeviewOpen>>", self._on_module_tree_open)
         self.module_tree.heading("#0", text="Module Name"); self.module_tree.heading("Description", text="Description"); self.module_tree.column("#0", width=250, stretch=tk.YES); self.module_tree.column("Description", width=400, stretch=tk.YES)
         tree_scrollbar_y = ttk.Scrollbar(modul_list_frame, orient="vertical", command=self.module_tree.yview); tree_scrollbar_x = ttk.Scrollbar(modul_list_frame, orient="horizontal", command=self.module_tree.xview)
-        self.module_tree.configure(yscrollcommand=tree_scrollbar_y.set, xscrollcommand=tree_scrollbar_x.set); self.module_tree.grid(row=0, column=0, sticky="nsew"); tree_scrollbar_y.grid(row=0, column=1, sticky="ns"); tree_scrollbar_x.grid(row=1, column=0, sticky="ew")
+        self.module_tree.configure(yscrollcommand=tree_scrollbar_y.set, xscrollcommand=tree_scrollbar_x.set); self.module_tree.grid(row=1, column=0, sticky="nsew"); tree_scrollbar_y.grid(row=1, column=1, sticky="ns"); tree_scrollbar_x.grid(row=2, column=0, sticky="ew")
+        self.module_tree.tag_configure("match", background="#fff3b0")
         tree_button_frame = ttk.Frame(tab_modul); tree_button_frame.pack(fill="x", pady=5)
         btn_delete_modul = ttk.Button(tree_button_frame, text="- Remove Selected (and children)", command=self.hapus_modul); btn_delete_modul.pack(side=tk.RIGHT, padx=10)
 
@@ -239,11 +1665,25 @@ class BlueprintGeneratorApp:
         tab_preview = ttk.Frame(self.notebook, padding=10); self.notebook.add(tab_preview, text="3. Preview & Generate")
         action_frame = ttk.Frame(tab_preview); action_frame.pack(pady=(0, 10), fill="x")
         self.btn_generate = ttk.Button(action_frame, text="Generate Files", command=self.generate_blueprint, style="Accent.TButton"); self.btn_generate.pack(side=tk.LEFT, padx=5)
+        self.btn_resume = ttk.Button(action_frame, text="Resume", command=self.resume_blueprint); self.btn_resume.pack(side=tk.LEFT, padx=5)
+        self.btn_cancel = ttk.Button(action_frame, text="Cancel Job(s)", command=self.cancel_generation, state=tk.DISABLED); self.btn_cancel.pack(side=tk.LEFT, padx=5)
+        self.label_prompt_size = ttk.Label(action_frame, text="", foreground="gray"); self.label_prompt_size.pack(side=tk.LEFT, padx=10)
         self.btn_save = ttk.Button(action_frame, text="Save Config", command=self.simpan_project); self.btn_save.pack(side=tk.LEFT, padx=5)
         self.btn_open = ttk.Button(action_frame, text="Load Config", command=self.buka_project); self.btn_open.pack(side=tk.LEFT, padx=5)
         self.btn_clear = ttk.Button(action_frame, text="Clear Form", command=self.clear_form); self.btn_clear.pack(side=tk.RIGHT, padx=5)
+        jobs_frame = ttk.LabelFrame(tab_preview, text="Jobs", padding=5); jobs_frame.pack(fill="x", pady=(0, 5))
+        self.job_tree = ttk.Treeview(jobs_frame, columns=JOB_COLUMNS, show="headings", height=4); self.job_tree.bind("<Double-1>", lambda e: self.show_job_details())
+        for col in JOB_COLUMNS: self.job_tree.heading(col, text=col.title()); self.job_tree.column(col, width={"job": 40, "files": 50, "errors": 50, "status": 80}.get(col, 180), stretch=col in ("progress", "folder"), anchor=tk.E if col in ("job", "files", "errors") else tk.W)
+        self.job_tree.pack(side=tk.LEFT, fill="x", expand=True)
+        job_button_frame = ttk.Frame(jobs_frame); job_button_frame.pack(side=tk.LEFT, fill="y", padx=(5, 0))
+        ttk.Button(job_button_frame, text="Details", command=self.show_job_details).pack(fill="x", pady=1); ttk.Button(job_button_frame, text="Clear Finished", command=self.clear_finished_jobs).pack(fill="x", pady=1)
         preview_frame = ttk.LabelFrame(tab_preview, text="Preview", padding=10); preview_frame.pack(fill="both", expand=True)
         self.preview_output = scrolledtext.ScrolledText(preview_frame, height=30, width=100, wrap=tk.WORD, state=tk.DISABLED); self.preview_output.pack(fill="both", expand=True)
+        summary_frame = ttk.LabelFrame(tab_preview, text="Last Run", padding=5); summary_frame.pack(fill="x", pady=(5, 0))
+        self.label_run_summary = ttk.Label(summary_frame, text="No run yet.", anchor=tk.W, justify=tk.LEFT); self.label_run_summary.pack(fill="x")
+        self.run_summary_tree = ttk.Treeview(summary_frame, columns=RUN_SUMMARY_COLUMNS, show="headings", height=5)
+        for col in RUN_SUMMARY_COLUMNS: self.run_summary_tree.heading(col, text=col.replace("_", " ").title()); self.run_summary_tree.column(col, width=150 if col == "file" else 80, stretch=col == "file", anchor=tk.W if col in ("file", "status") else tk.E)
+        self.run_summary_tree.pack(fill="x")
 
         # --- Status Bar ---
         self.status_label = ttk.Label(self.root, text="Ready", relief=tk.SUNKEN, anchor=tk.W); self.status_label.pack(side=tk.BOTTOM, fill=tk.X, padx=5, pady=2)
@@ -254,58 +1694,86 @@ class BlueprintGeneratorApp:
 
     # --- METHODS ---
     # ... (Implementasi semua metode lainnya dari versi terakhir) ...
-    def _get_module_by_id(self, module_id: int) -> dict | None: return next((mod for mod in self.modul_list if mod['id'] == module_id), None)
-    def _get_module_children_ids(self, parent_id: int | None) -> list[int]: return [m['id'] for m in self.modul_list if m['parent_id'] == parent_id]
-    def _get_all_descendant_ids(self, module_id: int) -> list[int]: desc = []; children = self._get_module_children_ids(module_id); [ (desc.append(c), desc.extend(self._get_all_descendant_ids(c))) for c in children ]; return desc
-    def _get_module_display_name(self, module_id: int, include_parents=True) -> str: mod = self._get_module_by_id(module_id); return "Unknown" if not mod else mod['nama'] if not include_parents or mod['parent_id'] is None else f"{self._get_module_display_name(mod['parent_id'], True)} :: {mod['nama']}"
+    def _get_module_by_id(self, module_id: int) -> dict | None: return self.modul_tree.get(module_id)
+    def _get_module_children_ids(self, parent_id: int | None) -> list[int]: return self.modul_tree.children_ids(parent_id)
+    def _get_all_descendant_ids(self, module_id: int) -> list[int]: return self.modul_tree.descendant_ids(module_id)
+    def _get_module_display_name(self, module_id: int, include_parents=True) -> str: mod = self.modul_tree.get(module_id); return "Unknown" if not mod else self.modul_tree.display_path(module_id) if include_parents else mod['nama']
+    def _parent_choices(self, query: str = "") -> list[str]:
+        """Display paths for the parent picker: search matches for query, else the first PARENT_CHOICES_LIMIT modules in tree order."""
+        if query: return [self.modul_tree.display_path(i) for i in self.modul_tree.search(query, PARENT_CHOICES_LIMIT)]
+        paths = []; stack = list(reversed(self.modul_tree.sorted_children_ids(None)))
+        while stack and len(paths) < PARENT_CHOICES_LIMIT: # Pre-order walk, children sorted by name; display paths come from the tree's cache
+            mod_id = stack.pop(); paths.append(self.modul_tree.display_path(mod_id)); stack.extend(reversed(self.modul_tree.sorted_children_ids(mod_id)))
+        return paths
     def _update_parent_module_combo(self):
         try: current = self.combo_parent_module.get()
         except tk.TclError: current = "(Top Level)"
-        parents = ["(Top Level)"]; processed = set()
-        def get_name_safe(mod_id): mod = self._get_module_by_id(mod_id); return mod['nama'] if mod else ""
-        def add_rec(mod_id, indent=0):
-            mod = self._get_module_by_id(mod_id)
-            if not mod or mod_id in processed: return
-            processed.add(mod_id); parents.append(self._get_module_display_name(mod_id))
-            children = self._get_module_children_ids(mod_id)
-            try: sorted_children = sorted(children, key=get_name_safe)
-            except Exception as e: print(f"Warn: Sort fail children of {mod_id}: {e}"); sorted_children = children
-            for child_id in sorted_children: add_rec(child_id, indent + 1)
-        top_ids = self._get_module_children_ids(None)
-        try: sorted_top = sorted(top_ids, key=get_name_safe)
-        except Exception as e: print(f"Warn: Sort fail top level: {e}"); sorted_top = top_ids
-        for top_id in sorted_top: add_rec(top_id)
-        try: self.combo_parent_module['values'] = parents; self.combo_parent_module.set(current if current in parents else "(Top Level)")
+        if self.modul_tree.id_for_path(current) is None: current = "(Top Level)"
+        try: self.combo_parent_module['values'] = ["(Top Level)"] + self._parent_choices(); self.combo_parent_module.set(current)
         except tk.TclError as e: print(f"Warn: TclError set parent combo: {e}")
+    def _on_parent_combo_typed(self, event=None):
+        if event is not None and event.keysym in ("Up", "Down", "Return", "Escape", "Tab"): return
+        text = self.combo_parent_module.get().strip()
+        if text == "(Top Level)" or self.modul_tree.id_for_path(text) is not None: return # A picked entry, not a query
+        self.combo_parent_module['values'] = ["(Top Level)"] + self._parent_choices(text)
+    def _schedule_module_filter(self, *args):
+        if self._module_filter_job is not None: self.root.after_cancel(self._module_filter_job)
+        self._module_filter_job = self.root.after(MODULE_FILTER_DELAY_MS, self._populate_module_treeview)
     def _populate_module_treeview(self):
-        [self.module_tree.delete(i) for i in self.module_tree.get_children()]; self.treeview_iid_to_module_id.clear()
-        mods_by_id = {mod['id']: mod for mod in self.modul_list}; created = {}
-        def add_rec(parent_id=None):
-            tree_parent = created.get(parent_id, '')
-            if parent_id and not self.module_tree.exists(tree_parent) and str(parent_id) != '': print(f"ERR: Tree parent '{tree_parent}'({parent_id}) not found!"); return
-            children = sorted(self._get_module_children_ids(parent_id), key=lambda x: mods_by_id.get(x, {}).get('nama', ''))
-            for child_id in children:
-                mod = mods_by_id.get(child_id); child_iid = str(child_id) # Use module id as iid
-                if mod and child_iid not in created:
-                    try: new_iid=self.module_tree.insert(tree_parent, tk.END, iid=child_iid, text=mod['nama'], values=(mod['deskripsi'],)); created[child_id]=new_iid; self.treeview_iid_to_module_id[new_iid]=child_id; add_rec(child_id)
-                    except tk.TclError as e: print(f"ERR tree insert {child_id}: {e}")
-        add_rec(None)
+        """Resets the Treeview to the top level only; deeper levels are inserted when their parent is expanded.
+        With a search query, shows the matches (highlighted) under their ancestors instead, all expanded."""
+        if self._module_filter_job is not None: self.root.after_cancel(self._module_filter_job); self._module_filter_job = None
+        self.module_tree.delete(*self.module_tree.get_children()); self.treeview_iid_to_module_id.clear(); self._tree_loaded.clear()
+        query = self.module_filter.get().strip()
+        if not query: self._load_tree_children(None); return
+        started = time.perf_counter(); matches = self.modul_tree.search(query); self._tree_loaded.add(None)
+        for mod_id in matches[:MODULE_FILTER_LIMIT]: # Path order, so ancestors come before their descendants
+            for node_id in self.modul_tree.ancestor_ids(mod_id) + [mod_id]:
+                if self.module_tree.exists(str(node_id)): continue
+                mod = self.modul_tree.get(node_id); parent_id = mod.get('parent_id')
+                self._insert_tree_item('' if parent_id is None else str(parent_id), mod, placeholder=False); self.module_tree.item(str(node_id), open=True); self._tree_loaded.add(node_id)
+            self.module_tree.item(str(mod_id), tags=("match",))
+        shown = f" (showing {MODULE_FILTER_LIMIT})" if len(matches) > MODULE_FILTER_LIMIT else ""
+        self.update_status(f"{len(matches)} module(s) match '{query}'{shown} in {(time.perf_counter() - started) * 1000:.0f} ms.")
+    def _insert_tree_item(self, parent_iid: str, mod: dict, placeholder: bool = True) -> str:
+        iid = self.module_tree.insert(parent_iid, tk.END, iid=str(mod['id']), text=mod['nama'], values=(self.modul_tree.description(mod['id']),)); self.treeview_iid_to_module_id[iid] = mod['id'] # Use module id as iid
+        if placeholder and self.modul_tree.children_ids(mod['id']): self.module_tree.insert(iid, tk.END, iid=iid + TREE_PLACEHOLDER, text="...")
+        return iid
+    def _load_tree_children(self, module_id: int | None):
+        """Inserts the children of a node the first time it is expanded."""
+        if module_id in self._tree_loaded: return
+        parent_iid = '' if module_id is None else str(module_id)
+        if parent_iid and not self.module_tree.exists(parent_iid): return
+        self._tree_loaded.add(module_id)
+        if self.module_tree.exists(parent_iid + TREE_PLACEHOLDER): self.module_tree.delete(parent_iid + TREE_PLACEHOLDER)
+        for child_id in self.modul_tree.sorted_children_ids(module_id):
+            try: self._insert_tree_item(parent_iid, self.modul_tree.get(child_id))
+            except tk.TclError as e: print(f"ERR tree insert {child_id}: {e}")
+    def _on_module_tree_open(self, event=None):
+        mod_id = self.treeview_iid_to_module_id.get(self.module_tree.focus())
+        if mod_id is not None: self._load_tree_children(mod_id)
+    def _reveal_module(self, module_id: int):
+        """Loads and opens the ancestors of a module so its Treeview item exists, then scrolls to it."""
+        for anc_id in [None] + self.modul_tree.ancestor_ids(module_id):
+            self._load_tree_children(anc_id)
+            if anc_id is not None and self.module_tree.exists(str(anc_id)): self.module_tree.item(str(anc_id), open=True)
+        if self.module_tree.exists(str(module_id)): self.module_tree.see(str(module_id))
     def tambah_modul(self):
         nama=self.entry_modul_nama.get().strip(); desc=self.entry_modul_deskripsi.get("1.0", tk.END).strip(); parent_disp=self.combo_parent_module.get()
         if not nama or not desc: messagebox.showwarning("Input Missing", "Enter name & desc."); return
         p_id = None;
-        if parent_disp != "(Top Level)":
-            found = False;
-            for mid in [m['id'] for m in self.modul_list]: # Find parent ID from display name
-                if self._get_module_display_name(mid) == parent_disp: p_id = mid; found = True; break
-            if not found: messagebox.showerror("Error", f"Parent '{parent_disp}' not found."); return
-        if any(m['nama'].lower() == nama.lower() for m in self.modul_list if m['parent_id'] == p_id): p_name = parent_disp if p_id else "Top"; messagebox.showwarning("Duplicate", f"'{nama}' exists under '{p_name}'."); return
-        new_id = self._next_module_id; self._next_module_id += 1; new_mod = {'id': new_id, 'parent_id': p_id, 'nama': nama, 'deskripsi': desc}; self.modul_list.append(new_mod)
-        p_tree_iid = next((tv_iid for tv_iid, mod_id in self.treeview_iid_to_module_id.items() if mod_id == p_id), '') # Find parent's treeview iid
-        try: new_tree_iid = self.module_tree.insert(p_tree_iid, tk.END, iid=str(new_id), text=nama, values=(desc,)); self.treeview_iid_to_module_id[new_tree_iid] = new_id
-        except tk.TclError as e: print(f"ERR tree insert: {e}"); self.modul_list.pop(); messagebox.showerror("Tree Error", "Failed add."); return
+        if parent_disp.strip() not in ("(Top Level)", ""):
+            p_id = self.modul_tree.id_for_path(parent_disp) # Find parent ID from display name
+            if p_id is None: matches = self.modul_tree.search(parent_disp, 2); p_id = matches[0] if len(matches) == 1 else None # A typed query naming exactly one module
+            if p_id is None: messagebox.showerror("Error", f"Parent '{parent_disp}' not found. Type part of its name and pick it from the list."); return
+        if self.modul_tree.has_child_named(p_id, nama): p_name = parent_disp if p_id else "Top"; messagebox.showwarning("Duplicate", f"'{nama}' exists under '{p_name}'."); return
+        new_id = self._next_module_id; self._next_module_id += 1; new_mod = {'id': new_id, 'parent_id': p_id, 'nama': nama, 'deskripsi': desc}; self.modul_tree.add(new_mod)
+        try: # Only touch the Treeview if the parent's children are already inserted; otherwise lazy loading picks it up
+            if self.module_filter.get().strip(): self._populate_module_treeview() # Filtered view: shows the new module only if it matches
+            elif p_id in self._tree_loaded: self._insert_tree_item('' if p_id is None else str(p_id), new_mod)
+            self._reveal_module(new_id)
+        except tk.TclError as e: print(f"ERR tree insert: {e}"); self.modul_tree.remove_subtree(new_id); messagebox.showerror("Tree Error", "Failed add."); return
         self.entry_modul_nama.delete(0, tk.END); self.entry_modul_deskripsi.delete("1.0", tk.END); self._update_parent_module_combo(); self.update_status(f"Module '{nama}' added.");
-        if p_tree_iid: self.module_tree.item(p_tree_iid, open=True)
     def hapus_modul(self):
         """Removes the selected module and all its descendants."""
         selected_iids = self.module_tree.selection()
@@ -346,32 +1814,19 @@ class BlueprintGeneratorApp:
         # --- Perform Deletion ---
         ids_to_delete = [module_id_to_remove] + descendant_ids
 
-        # 1. Remove from Treeview (using module IDs to find correct iids)
-        # FIX: Iterate through ids_to_delete and find corresponding iid
-        iids_to_delete_in_tree = []
-        temp_mapping_copy = self.treeview_iid_to_module_id.copy() # Avoid modifying dict while iterating
-        for iid, mod_id in temp_mapping_copy.items():
-            if mod_id in ids_to_delete:
-                iids_to_delete_in_tree.append(iid)
-
-        for item_iid in iids_to_delete_in_tree:
-             if self.module_tree.exists(item_iid):
-                  try:
-                       self.module_tree.delete(item_iid)
-                  except tk.TclError as e:
-                      print(f"Warning: TclError deleting item {item_iid} from tree: {e}")
-             # Remove from mapping after deletion from tree
-             if item_iid in self.treeview_iid_to_module_id:
-                  del self.treeview_iid_to_module_id[item_iid]
-
+        # 1. Remove from Treeview (deleting an item also deletes its children)
+        if self.module_tree.exists(selected_iid):
+            try: self.module_tree.delete(selected_iid)
+            except tk.TclError as e: print(f"Warning: TclError deleting item {selected_iid} from tree: {e}")
+        for mod_id in ids_to_delete: self.treeview_iid_to_module_id.pop(str(mod_id), None); self._tree_loaded.discard(mod_id)
 
-        # 2. Remove from self.modul_list
-        self.modul_list = [mod for mod in self.modul_list if mod['id'] not in ids_to_delete]
+        # 2. Remove from the module tree model
+        self.modul_tree.remove_subtree(module_id_to_remove)
 
         # 3. Update parent combo
         self._update_parent_module_combo()
         self.update_status(f"Module '{module_to_remove['nama']}' and descendants removed.")
-    def _format_modules_hierarchical(self, parent_id=None, indent=0) -> str: md = ""; children = sorted(self._get_module_children_ids(parent_id), key=lambda x: self._get_module_by_id(x)['nama']); indent_s = "    " * indent; [(mod := self._get_module_by_id(mod_id)) and (md := md + f"{indent_s}- **{mod['nama']}:** {mod['deskripsi']}\n" + self._format_modules_hierarchical(mod_id, indent + 1)) for mod_id in children]; return md
+    def _format_modules_hierarchical(self) -> str: return format_modules_hierarchical(self.modul_tree.to_list())
     def _on_app_type_or_language_change(self, event=None): self._update_language_list(); self._update_dynamic_combos()
     def _update_language_list(self):
         app_type = self.combo_type.get(); langs = LANGUAGE_MAP.get(app_type, LANGUAGE_MAP["__fallback__"]); old_sel = {self.listbox_language.get(i) for i in self.listbox_language.curselection()}
@@ -387,38 +1842,57 @@ class BlueprintGeneratorApp:
         update_combo(self.combo_web_framework, WEB_FRAMEWORKS); update_combo(self.combo_ui_lib, UI_LIBS)
         state_opts={"None"}; cur_ui=self.combo_ui_lib.get().lower(); [state_opts.update(STATE_MANAGEMENT.get(l, [])) for l in langs if any(ul.lower()==cur_ui for ul in UI_LIBS.get(l, [])) or cur_ui=="none" or not langs]; valid_s=sorted(list(state_opts)); cur_s=self.combo_state_mgmt.get()
         self.combo_state_mgmt['values']=valid_s; self.combo_state_mgmt.set(cur_s if cur_s in valid_s else ("None" if "None" in valid_s else (valid_s[0] if valid_s else ""))); self.combo_state_mgmt.config(state="readonly" if valid_s else tk.DISABLED)
-    def update_status(self, message): self.status_label.config(text=message); self.root.update_idletasks()
+    def update_status(self, message, flush=False):
+        """Sets the status bar. flush=True repaints right away, for use just before blocking work on the Tk thread."""
+        self.status_label.config(text=message)
+        if flush: self.root.update_idletasks()
     def _update_api_key_entry(self, event=None):
         provider=self.selected_ai_provider.get(); self.combo_model.set(''); self.combo_model['values']=[]; self.combo_model.config(state=tk.DISABLED); key_o=self.entry_openai_apikey.get(); key_g=self.entry_gemini_apikey.get()
         self.openai_api_key_frame.pack_forget(); self.gemini_api_key_frame.pack_forget(); cur_key=""
         if provider=="OpenAI": self.openai_api_key_frame.pack(fill=tk.X, expand=True); self.entry_openai_apikey.delete(0, tk.END); self.entry_openai_apikey.insert(0, key_o); cur_key=key_o.strip()
         elif provider=="Gemini": self.gemini_api_key_frame.pack(fill=tk.X, expand=True); self.entry_gemini_apikey.delete(0, tk.END); self.entry_gemini_apikey.insert(0, key_g); cur_key=key_g.strip()
-        if cur_key: self.fetch_models()
+        if cur_key: self._load_models_cached(provider, cur_key)
         else: self.combo_model.set("Enter API Key & Fetch")
+    def _load_models_cached(self, provider, key):
+        """Fills the model combo from the on-disk cache; only stale or missing lists go to the network."""
+        cached = self.model_list_cache.get(provider, key)
+        if not cached: self.fetch_models(); return
+        models, fresh = cached; self._update_model_combo(models)
+        if fresh: self.update_status(f"{provider} models (cached).")
+        else: self.fetch_models(background=True)
     def _get_selected_ai_service(self): provider=self.selected_ai_provider.get(); service=self.ai_services.get(provider); key=""; key = self.entry_openai_apikey.get().strip() if provider=="OpenAI" else (self.entry_gemini_apikey.get().strip() if provider=="Gemini" else ""); return service, key
-    def fetch_models(self):
+    def fetch_models(self, background=False):
+        """Fetches the model list from the provider. A background refresh keeps the UI enabled and the cached list on failure."""
         service, key = self._get_selected_ai_service(); provider=self.selected_ai_provider.get()
         if not service or not key: messagebox.showerror("Error", f"Select Provider & Enter Key for {provider}."); return
+        if background:
+            self.update_status(f"Refreshing {provider} models...")
+            def refresh():
+                try: models = service.list_models(key)
+                except Exception as e: print(f"Warn: Background model refresh failed: {e}"); self.ui_bus.post("status", self.update_status, f"{provider} models (cached, refresh failed)."); return
+                if models: self.model_list_cache.put(provider, key, models)
+                self.ui_bus.call(lambda: (self._update_model_combo(models, keep=self.combo_model.get()), self.update_status("Models OK.")) if models and self.selected_ai_provider.get() == provider else None)
+            threading.Thread(target=refresh, daemon=True).start(); return
         self.update_status(f"Fetching {provider} models..."); self._disable_ui_during_action(fetching=True)
         def load():
             models, err = [], None
-            try: models = service.list_models(key)
+            try: models = service.list_models(key); (self.model_list_cache.put(provider, key, models) if models else None)
             except Exception as e: err=f"Error: {e}"
-            finally: self.root.after(0, lambda: (self._enable_ui_after_action(fetching=True), (messagebox.showerror(f"Fetch Error", err), self.combo_model.set('Fail'), self.combo_model.config(state=tk.DISABLED), self.update_status(f"Fetch fail.")) if err else ((messagebox.showwarning(f"No Models", "No models found."), self.combo_model.set('None'), self.combo_model.config(state=tk.DISABLED), self.update_status("No models.")) if not models else (self._update_model_combo(models), self.update_status("Models OK."))) ) )
+            finally: self.ui_bus.call(lambda: (self._enable_ui_after_action(fetching=True), (messagebox.showerror(f"Fetch Error", err), self.combo_model.set('Fail'), self.combo_model.config(state=tk.DISABLED), self.update_status(f"Fetch fail.")) if err else ((messagebox.showwarning(f"No Models", "No models found."), self.combo_model.set('None'), self.combo_model.config(state=tk.DISABLED), self.update_status("No models.")) if not models else (self._update_model_combo(models), self.update_status("Models OK."))) ) )
         threading.Thread(target=load, daemon=True).start()
-    def _update_model_combo(self, models): self.combo_model["values"] = models; self.combo_model.set(models[0] if models else ""); self.combo_model.config(state="readonly" if models else tk.DISABLED)
+    def _update_model_combo(self, models, keep=None): self.combo_model["values"] = models; self.combo_model.set(keep if keep in models else (models[0] if models else "")); self.combo_model.config(state="readonly" if models else tk.DISABLED)
     def clear_form(self):
         if not messagebox.askyesno("Confirm", "Clear all inputs?"): return
         for w in [self.entry_name, self.entry_openai_apikey, self.entry_gemini_apikey, self.entry_modul_nama]: w.delete(0, tk.END)
         for w in [self.text_purpose, self.text_target_users, self.text_main_workflow, self.text_data_entities, self.text_features, self.text_key_libs, self.text_design_principles, self.text_nfrs, self.text_notes, self.entry_modul_deskripsi]: w.delete("1.0", tk.END)
         self.preview_output.config(state=tk.NORMAL); self.preview_output.delete("1.0", tk.END); self.preview_output.config(state=tk.DISABLED)
         app_type = "Web" if "Web" in self.combo_type['values'] else (self.combo_type['values'][0] if self.combo_type['values'] else ""); self.combo_type.set(app_type)
-        self._update_language_list(); self.listbox_language.selection_clear(0, tk.END); self._update_dynamic_combos(); self.combo_database.set("None"); self.selected_ai_provider.set("OpenAI"); self.combo_model.set(""); self.combo_model['values'] = []; self.modul_list.clear(); self._next_module_id = 1; self.treeview_iid_to_module_id.clear(); [self.module_tree.delete(i) for i in self.module_tree.get_children()]; self._update_parent_module_combo()
-        self.tests_enabled.set(False); self.generate_readme.set(True); self.generate_gitignore.set(True); self.git_init_enabled.set(False); self.update_status("Form cleared.")
+        self._update_language_list(); self.listbox_language.selection_clear(0, tk.END); self._update_dynamic_combos(); self.combo_database.set("None"); self.selected_ai_provider.set("OpenAI"); self.combo_model.set(""); self.combo_model['values'] = []; self.modul_tree.clear(); self._close_project_archive(); self._next_module_id = 1; self.module_filter.set(""); self._populate_module_treeview(); self._update_parent_module_combo()
+        self.tests_enabled.set(False); self.generate_readme.set(True); self.generate_gitignore.set(True); self.git_init_enabled.set(False); self.gen_concurrency.set(DEFAULT_GEN_CONCURRENCY); self.changed_only.set(False); self.chunked_docs.set(False); self.hedge_backup.set(""); self.max_continuations.set(DEFAULT_MAX_CONTINUATIONS); self.update_status("Form cleared.")
     def ambil_input_data(self): # FIX: Removed 'data: dict' parameter, it's not used here
         pd = {}; pd["name"]=self.entry_name.get().strip(); pd["purpose"]=self.text_purpose.get("1.0", tk.END).strip(); pd["target_users"]=self.text_target_users.get("1.0", tk.END).strip(); pd["main_workflow"]=self.text_main_workflow.get("1.0", tk.END).strip(); pd["data_entities"]=self.text_data_entities.get("1.0", tk.END).strip(); pd["features_manual"]=self.text_features.get("1.0", tk.END).strip();
-        pd["modules"]=self.modul_list; # Save the hierarchical list
-        pd["project_type"]=self.combo_type.get(); lang_idx=self.listbox_language.curselection(); pd["language_list"]=[self.listbox_language.get(i) for i in lang_idx]; pd["language"]=", ".join(pd["language_list"]); pd["web_framework"]=self.combo_web_framework.get(); pd["ui_lib"]=self.combo_ui_lib.get(); pd["state_mgmt"]=self.combo_state_mgmt.get(); pd["database"]=self.combo_database.get(); pd["key_libs"]=self.text_key_libs.get("1.0", tk.END).strip(); pd["design_principles"]=self.text_design_principles.get("1.0", tk.END).strip(); pd["nfrs"]=self.text_nfrs.get("1.0", tk.END).strip(); pd["notes"]=self.text_notes.get("1.0", tk.END).strip(); pd["tests_enabled"]=self.tests_enabled.get(); pd["gen_readme"]=self.generate_readme.get(); pd["gen_gitignore"]=self.generate_gitignore.get(); pd["git_init"]=self.git_init_enabled.get()
+        pd["modules"]=self.modul_tree.to_list(); # Save the hierarchical list
+        pd["project_type"]=self.combo_type.get(); lang_idx=self.listbox_language.curselection(); pd["language_list"]=[self.listbox_language.get(i) for i in lang_idx]; pd["language"]=", ".join(pd["language_list"]); pd["web_framework"]=self.combo_web_framework.get(); pd["ui_lib"]=self.combo_ui_lib.get(); pd["state_mgmt"]=self.combo_state_mgmt.get(); pd["database"]=self.combo_database.get(); pd["key_libs"]=self.text_key_libs.get("1.0", tk.END).strip(); pd["design_principles"]=self.text_design_principles.get("1.0", tk.END).strip(); pd["nfrs"]=self.text_nfrs.get("1.0", tk.END).strip(); pd["notes"]=self.text_notes.get("1.0", tk.END).strip(); pd["tests_enabled"]=self.tests_enabled.get(); pd["gen_readme"]=self.generate_readme.get(); pd["gen_gitignore"]=self.generate_gitignore.get(); pd["git_init"]=self.git_init_enabled.get(); pd["gen_concurrency"]=self.gen_concurrency.get(); pd["changed_only"]=self.changed_only.get(); pd["chunked_docs"]=self.chunked_docs.get(); pd["hedge_backup"]=self.hedge_backup.get().strip(); pd["max_continuations"]=self.max_continuations.get()
         pd["deployment_target"] = self.deployment_target.get() # Ensure this line exists
         provider=self.selected_ai_provider.get(); _, key_val = self._get_selected_ai_service()
         if not pd["features_manual"] and not pd["modules"]: messagebox.showerror("Missing", "Need Features or Modules."); return None
@@ -426,12 +1900,12 @@ class BlueprintGeneratorApp:
         if miss: messagebox.showerror("Missing", f"Required:\n- {', '.join(miss)}"); return None
         for k in ["web_framework", "ui_lib", "state_mgmt", "database"]: pd[k] = "" if pd[k].lower() == "none" else pd[k]
         pd["_next_module_id"] = self._next_module_id; return pd # Ensure _next_module_id is saved
-    def isi_form_data(self, data: dict):
+    def isi_form_data(self, data: dict, describe=None):
         self.clear_form(); self.entry_name.insert(0, data.get("name", "")); self.text_purpose.insert("1.0", data.get("purpose", "")); self.text_target_users.insert("1.0", data.get("target_users", "")); self.text_main_workflow.insert("1.0", data.get("main_workflow", "")); self.text_data_entities.insert("1.0", data.get("data_entities", "")); self.text_features.insert("1.0", data.get("features_manual", ""));
         app_type=data.get("project_type", "Web"); default=next((v for v in [app_type, "Web"] if v in self.combo_type['values']), self.combo_type['values'][0] if self.combo_type['values'] else ""); self.combo_type.set(default)
         self.deployment_target.set(data.get("deployment_target", "Simple Web Server (Apache/Nginx/Local)")) # Ensure this matches the default value
         # --- FIX: Load Modules data FIRST and correctly ---
-        self.modul_list = data.get("modules", []) # Load module data
+        self.modul_tree.load(data.get("modules", []), describe) # Load module data and rebuild the indexes
         self._next_module_id = data.get("_next_module_id", 1) # Restore counter
         self._populate_module_treeview() # Build tree from loaded data
         self._update_parent_module_combo() # Update choices based on loaded tree
@@ -444,47 +1918,42 @@ class BlueprintGeneratorApp:
             combo.set(val if val and val in combo['values'] else "None")
         self.text_key_libs.insert("1.0", data.get("key_libs", "")); self.text_design_principles.insert("1.0", data.get("design_principles", "")); self.text_nfrs.insert("1.0", data.get("nfrs", "")); self.text_notes.insert("1.0", data.get("notes", "")); self.entry_openai_apikey.insert(0, data.get("openai_api_key", "")); self.entry_gemini_apikey.insert(0, data.get("gemini_api_key", ""))
         provider=data.get("ai_provider", "OpenAI"); self.selected_ai_provider.set(provider if provider in self.ai_services else (list(self.ai_services.keys())[0] if self.ai_services else "")); self.root.after(500, lambda: self.combo_model.set(data.get("model", "")))
-        self.tests_enabled.set(data.get("tests_enabled", False)); self.generate_readme.set(data.get("gen_readme", True)); self.generate_gitignore.set(data.get("gen_gitignore", True)); self.git_init_enabled.set(data.get("git_init", False)); self.update_status("Project loaded."); self.notebook.select(0)
+        self.tests_enabled.set(data.get("tests_enabled", False)); self.generate_readme.set(data.get("gen_readme", True)); self.generate_gitignore.set(data.get("gen_gitignore", True)); self.git_init_enabled.set(data.get("git_init", False)); self.gen_concurrency.set(data.get("gen_concurrency", DEFAULT_GEN_CONCURRENCY)); self.changed_only.set(data.get("changed_only", False)); self.chunked_docs.set(data.get("chunked_docs", False)); self.hedge_backup.set(data.get("hedge_backup", "")); self.max_continuations.set(data.get("max_continuations", DEFAULT_MAX_CONTINUATIONS)); self.update_status("Project loaded."); self.notebook.select(0)
     def simpan_project(self):
         # --- FIX: Use the clearer implementation ---
         data = self.ambil_input_data()
         if not data: return
+        self._close_project_archive() # Every description is in data now; an open archive would also block replacing it on Windows
         data['ai_provider'] = self.selected_ai_provider.get(); data['model'] = self.combo_model.get()
         data['openai_api_key'] = self.entry_openai_apikey.get(); data['gemini_api_key'] = self.entry_gemini_apikey.get()
-        fp = filedialog.asksaveasfilename(defaultextension=".bpgproj",filetypes=[("BPG","*.bpgproj"),("JSON","*.json")],title="Save")
+        fp = filedialog.asksaveasfilename(defaultextension=".bpgproj",filetypes=PROJECT_FILE_TYPES,title="Save")
         if fp:
-            try: open(fp,'w',encoding='utf-8').write(json.dumps(data,indent=2,ensure_ascii=False)); self.update_status(f"Saved: {os.path.basename(fp)}"); messagebox.showinfo("Save OK","Saved.")
+            try: save_project_file(fp, data); self.update_status(f"Saved: {os.path.basename(fp)}"); messagebox.showinfo("Save OK","Saved.")
             except Exception as e: messagebox.showerror("Save Error", f"Could not save:\n{e}"); self.update_status("Save error.")
         else: self.update_status("Save cancelled.")
     def buka_project(self):
-        fp=filedialog.askopenfilename(filetypes=[("BPG","*.bpgproj"),("JSON","*.json")],title="Load");
+        fp=filedialog.askopenfilename(filetypes=[("Projects", f"*.bpgproj *{PROJECT_ARCHIVE_EXT}")] + PROJECT_FILE_TYPES,title="Load");
         if fp:
-            try: data = json.load(open(fp,'r',encoding='utf-8')); self.isi_form_data(data); self.update_status(f"Loaded: {os.path.basename(fp)}")
+            try: self._load_project(fp); self.update_status(f"Loaded: {os.path.basename(fp)}")
             except Exception as e: messagebox.showerror("Load Error", f"Failed to load:\n{e}"); self.update_status("Load error.") # Keep it simple
-    def _prepare_prompts(self, d: dict):
-        prompts = {}; mods = self._format_modules_hierarchical(); feats = d.get('features_manual',''); combined = feats + (f"\n\n## Modules:\n{mods}" if mods else "");
-        test_ctx, test_md, test_rules = ("\n- Testing: Include `tests/`.", "**Testing:** Incl tests.", "MUST have tests.") if d['tests_enabled'] else ("\n- Testing: Disabled.", "**Testing:** Disabled.", "NO tests.")
-        safety = """Before generating, modifying, deleting, or replacing any code, file, or folder, you MUST FIRST perform a full scan and complete understanding of the ENTIRE codebase. This includes reading all source files, project structure, file contents, configurations, and previously generated outputs. You must never operate on a partial view or act based on assumptions. You are required to detect what parts of the application are already implemented, working as expected, and approved by the user. Do NOT alter any working or finalized component unless explicitly requested. Any modification must be aligned with the existing working structure. When in doubt, stop and ask. Violating this rule will result in corruption of the entire application. This is a MANDATORY FINAL STEP CHECK before every action you perform in this development environment."""
-        tech = f"- Langs: {d['language']}"+(f"\n- WebFw: {d['web_framework']}" if d.get('web_framework') else "")+(f"\n- UI Lib: {d['ui_lib']}" if d.get('ui_lib') else "")+(f"\n- State: {d['state_mgmt']}" if d.get('state_mgmt') else "")+(f"\n- DB: {d['database']}" if d.get('database') else "")+(f"\n- Libs: {d['key_libs']}" if d.get('key_libs') else "")
-        # --- FIX: Include deployment_target in tech summary ---
-        if d.get('deployment_target'): tech += f"\n- **Deployment:** {d['deployment_target']}"
-        # --- FIX: Include deployment_target in system prompt ---
-        sys_p = f"AI architect for '{d['name']}'. Goal:{d['purpose']}. Users:{d['target_users'] or 'N/A'}. WF:{d['main_workflow'] or 'N/A'}. Data:{d['data_entities'] or 'N/A'}. Type:{d['project_type']}. Stack:\n{tech}\nDeployment Target: {d.get('deployment_target', 'Not specified')}. Principles:{d['design_principles'] or 'N/A'}. NFRs:{d['nfrs'] or 'N/A'}. Notes:{d['notes'] or 'N/A'}{test_ctx}\nStrictly adhere to docs/rules. Clean, modular code."
-        rules = [safety.strip(), test_rules, f"Langs:{d['language']}.", f"Type:'{d['project_type']}'.",]+([f"Use '{d[k]}'." for k in ['web_framework','ui_lib','state_mgmt','database'] if d.get(k)])+([f"Apply:{d['design_principles']}."] if d.get('design_principles') else [])
-        prompts[".cursorrules"] = json.dumps({"system": sys_p, "rules": rules}, indent=2)
-        # --- FIX: Include deployment target instruction in architecture.md prompt ---
-        prompts["architecture.md"] = f"Create `arch.md` for '{d['name']}'. Context:\nGoal:{d['purpose']}\nType:{d['project_type']}\nStack:{tech}\nFeatures:{combined}\nUsers:{d['target_users'] or 'N/A'}\nWF:{d['main_workflow'] or 'N/A'}\nData:{d['data_entities'] or 'N/A'}\nPrinciples:{d['design_principles'] or 'N/A'}\nNFRs:{d['nfrs'] or 'N/A'}\nNotes:{d['notes'] or 'N/A'}.\n\nTASK:Detail: 1.Arch Style. 2.Components. 3.Folders(explain,configs). 4.Responsibilities(hierarchical). 5.Data Model. 6.API Contract. 7.Tech Justification. 8.{test_md} 9.Deployment Strategy(Conceptual): **Describe strategy suitable for '{d.get('deployment_target', 'Not specified')}'. Avoid complex setups if 'Simple Web Server' chosen.**"
-        # --- FIX: Include deployment target instruction in project_plan.md prompt ---
-        prompts["project_plan.md"] = f"Create `plan.md` for '{d['name']}'. Context:\nGoal:{d['purpose']}\nType:{d['project_type']}\nStack:{tech}\nFeatures:{combined}\nUsers:{d['target_users'] or 'N/A'}\nWF:{d['main_workflow'] or 'N/A'}\nData:{d['data_entities'] or 'N/A'}\nNFRs:{d['nfrs'] or 'N/A'}\nNotes:{d['notes'] or 'N/A'}.\n\nTASK:Gen plan: 1.Summary. 2.Scope. 3.Phases. 4.Checklist (`- [ ]`) per phase (realistic, scope, order, incl **setup relevant to '{d.get('deployment_target', 'Not specified')}'**, link tasks to modules, {test_md}). 5.Tech Summary."
-        # --- FIX: Include deployment target instruction in README.md prompt ---
-        if d['gen_readme']: prompts["README.md"] = f"Create `README.md` for '# {d['name']}'.\n\n## Desc\n{d['purpose']}. Users:{d['target_users'] or 'N/A'}.\n\n## Features\n(List based on:\n{combined})\n\n## Stack\n{tech}\n\n## Setup\n(Provide setup steps **appropriate for '{d.get('deployment_target', 'simple server')}'** and {d['language']}/{d.get('web_framework','')}...).\n\n## Running\n(Basic run command **appropriate for '{d.get('deployment_target', 'simple server')}'**...)."
-        if d['gen_gitignore']: prompts[".gitignore"] = f"Gen `.gitignore` for: {d['language']},{d.get('web_framework','')},{d.get('ui_lib','')}. Incl OS,IDE,deps,env,logs. RAW ONLY."
-        return prompts
-    def generate_blueprint(self):
-        """Handles the main blueprint generation process."""
+    def _load_project(self, fp: str):
+        """Archives stay open while loaded: the tree is built from the header index and each description is inflated
+        when its row is shown, or all of them when searching, saving or generating."""
+        if not is_project_archive(fp): self.isi_form_data(read_project_file(fp)); self._close_project_archive(); return
+        archive = ProjectArchive(fp)
+        try: self.isi_form_data({**archive.project, "modules": [{'id': e['id'], 'parent_id': e.get('parent_id'), 'nama': e['nama']} for e in archive.index]}, archive.description)
+        except BaseException: archive.close(); raise
+        self._close_project_archive(); self._project_archive = archive
+    def _close_project_archive(self):
+        if self._project_archive is not None: self._project_archive.close(); self._project_archive = None
+    def _prepare_prompts(self, d: dict, model: str | None = None): return prepare_prompts(d, model)
+    def resume_blueprint(self): self.generate_blueprint(resume=True)
+    def generate_blueprint(self, resume=False):
+        """Handles the main blueprint generation process. resume=True reuses files checkpointed by an interrupted run."""
         print("--- DEBUG: generate_blueprint called ---")
 
-        config_data = self.ambil_input_data()
+        metrics = RunMetrics()
+        with metrics.phase("input"): config_data = self.ambil_input_data()
         if not config_data:
             print("DEBUG: generate_blueprint exited - ambil_input_data failed")
             return
@@ -524,103 +1993,586 @@ class BlueprintGeneratorApp:
             print(f"DEBUG: generate_blueprint exited - AI model '{mdl}' invalid or not selected for provider '{prov}'")
             return
 
-        print(f"DEBUG: Pre-generation checks passed. Provider: {prov}, Model: {mdl}")
+        backup = None
+        if config_data.get("hedge_backup"):
+            target = parse_hedge_target(config_data["hedge_backup"]); backup_svc = self.ai_services.get(target[0]) if target else None
+            backup_key = (self.entry_openai_apikey.get().strip() if target[0] == "OpenAI" else self.entry_gemini_apikey.get().strip()) if backup_svc else ""
+            if not backup_svc or not backup_key:
+                messagebox.showerror("Configuration Error", f"Hedge target '{config_data['hedge_backup']}' must be 'Provider:model' with an available provider and its API key (e.g. 'Gemini:gemini-1.5-flash-latest').")
+                return
+            backup = (backup_svc, target[0], backup_key, target[1])
 
-        folder = filedialog.askdirectory(title="Select Folder to Save Blueprint Files")
+        print(f"DEBUG: Pre-generation checks passed. Provider: {prov}, Model: {mdl}, Hedge: {config_data.get('hedge_backup') or 'off'}")
+
+        folder = filedialog.askdirectory(title="Select Folder of the Interrupted Blueprint" if resume else "Select Folder to Save Blueprint Files")
         if not folder:
             print("DEBUG: generate_blueprint exited - Folder selection cancelled")
             self.update_status("Generation cancelled.")
             return
 
-        # --- Disable UI, Prepare Prompts, Start Thread ---
-        self.update_status("Starting blueprint generation...")
-        self._disable_ui_during_action()
-        self.preview_output.config(state=tk.NORMAL); self.preview_output.delete("1.0", tk.END); self.preview_output.config(state=tk.DISABLED)
+        folder = os.path.abspath(folder)
+        busy = next((j for j in self.jobs.values() if j.active and j.folder == folder), None)
+        if busy: # Two runs in one folder would fight over its checkpoint and manifest
+            messagebox.showerror("Folder Busy", f"Job {busy.id} ({busy.name}) is still generating into:\n{folder}")
+            return
 
+        # --- Prepare Prompts, Queue Job ---
+        self.update_status("Preparing prompts...", flush=True)
         try:
             print("DEBUG: Preparing prompts...")
-            prompts_to_generate = self._prepare_prompts(config_data)
+            with metrics.phase("prompts"): prompts_to_generate = self._prepare_prompts(config_data, mdl)
             print(f"DEBUG: Prompts prepared for: {list(prompts_to_generate.keys())}")
+            size_note = prompt_size_summary(config_data, prompts_to_generate, mdl); log.debug(size_note)
+            self.label_prompt_size.config(text=size_note)
         except Exception as e:
             messagebox.showerror("Prompt Preparation Error", f"Failed to prepare AI prompts: {e}")
             print(f"ERROR: Prompt preparation failed: {e}")
-            self._enable_ui_after_action()
             return
 
-        print("DEBUG: Starting generation thread...")
-        # --- Threaded Generation (do_generate function) ---
-        def do_generate():
-            # ... (Isi do_generate tetap sama seperti versi sebelumnya, pastikan menggunakan 'svc', 'key', 'mdl' yang diteruskan dari scope luar) ...
-            print("DEBUG: Thread do_generate started")
-            results = {}
-            errors = []
-            files_to_generate = list(prompts_to_generate.keys())
-
-            for index, filename in enumerate(files_to_generate):
-                prompt_content = prompts_to_generate[filename]
-                progress_msg = f"Generating {filename} ({index + 1}/{len(files_to_generate)})..."
-                self.root.after(0, self.update_status, progress_msg)
-                print(f"DEBUG: Thread - Generating {filename} using {mdl}")
-
-                try:
-                    if filename == ".cursorrules":
-                        text = prompt_content
-                        try: json.loads(text)
-                        except json.JSONDecodeError as json_e: errors.append(f"Internal JSON Error .cursorrules: {json_e}"); text = '{"error": "Internal JSON failed"}'
-                    else:
-                        # Gunakan svc, key, mdl dari scope luar (generate_blueprint)
-                        text = svc.generate_text(key, mdl, prompt_content, temperature=0.35)
-
-                    results[filename] = text
-                    try:
-                        filepath = os.path.join(folder, filename)
-                        with open(filepath, "w", encoding="utf-8") as f: f.write(text)
-                        print(f"DEBUG: Thread - Wrote {filename}")
-                    except IOError as write_e:
-                        errors.append(f"Write fail {filename}: {write_e}")
-                        if filename in results: del results[filename]
-
-                except (ValueError, ConnectionError, ImportError, RuntimeError) as e:
-                    errors.append(f"Gen fail {filename}: {e}")
-                    print(f"ERROR: Thread - Gen fail {filename}: {e}")
-                    if isinstance(e, (ValueError, ConnectionError, ImportError)) or "quota" in str(e).lower():
-                         print("DEBUG: Thread - Critical error, stopping.")
-                         break
-                except Exception as e:
-                    errors.append(f"Unexpected gen fail {filename}: {e}")
-                    print(f"ERROR: Thread - Unexpected gen fail {filename}: {e}", flush=True)
-
-            print("DEBUG: Thread - Loop done. Git init check.")
-            git_ok, git_err = None, None
-            if config_data['git_init'] and not any(isinstance(e,(ValueError,ConnectionError,ImportError)) for e in errors):
-                self.root.after(0, self.update_status, "Git init...");
-                try: subprocess.run(['git','--version'],check=True,capture_output=True,text=True,creationflags=subprocess.CREATE_NO_WINDOW if os.name=='nt' else 0); git_ok = False if os.path.isdir(os.path.join(folder,'.git')) else (subprocess.run(['git','init'],cwd=folder,check=True,capture_output=True,text=True,creationflags=subprocess.CREATE_NO_WINDOW if os.name=='nt' else 0), True)[1]
-                except Exception as ge: git_err=f"Git fail:{ge}"; errors.append(git_err)
-                print(f"DEBUG: Thread - Git init: ok={git_ok}, err={git_err}")
-
-            print(f"DEBUG: Thread - Calling complete. Errs:{len(errors)}, Res:{len(results)}")
-            self.root.after(0, self._generation_complete, results, errors, folder, git_ok)
-            print("DEBUG: Thread finished")
-
-        threading.Thread(target=do_generate, daemon=True).start()
-    def _disable_ui_during_action(self, fetching=False): widgets=[self.btn_generate,self.btn_save,self.btn_open,self.btn_clear]; widgets.extend([self.btn_fetch_models, self.combo_provider, self.entry_openai_apikey, self.entry_gemini_apikey, self.combo_model] if fetching else [self.btn_fetch_models]); [w.config(state=tk.DISABLED) for w in widgets if w.winfo_exists()]
-    def _enable_ui_after_action(self, fetching=False): widgets=[self.btn_generate,self.btn_save,self.btn_open,self.btn_clear,self.btn_fetch_models, self.combo_provider, self.entry_openai_apikey, self.entry_gemini_apikey]; [w.config(state="readonly" if isinstance(w,ttk.Combobox) and w!=self.combo_model else tk.NORMAL) for w in widgets if w.winfo_exists() and w!=self.combo_model]; self.combo_model.config(state="readonly" if self.combo_model.winfo_exists() and self.combo_model['values'] else tk.DISABLED)
-    def _generation_complete(self, results, errors, folder, git_ok):
-        print("DEBUG: _generation_complete called"); print(f"DEBUG: Errors: {errors}"); self._enable_ui_after_action(); preview=""; success=sorted(list(results.keys())); req=[".cursorrules","architecture.md","project_plan.md"]+["README.md"]*self.generate_readme.get()+[".gitignore"]*self.generate_gitignore.get(); failed=sorted([f for f in req if f not in success])
-        if results: [preview := preview+f"=== {fname} ===\n{results[fname]}\n\n" for fname in success]; self.preview_output.config(state=tk.NORMAL); self.preview_output.delete("1.0",tk.END); self.preview_output.insert("1.0", preview); self.preview_output.config(state=tk.DISABLED)
+        if not any(j.active for j in self.jobs.values()): # Start a fresh streamed preview unless other jobs are still writing to it
+            self.preview_output.config(state=tk.NORMAL); self.preview_output.delete("1.0", tk.END); self.preview_output.config(state=tk.DISABLED)
+            self.ui_bus.discard_appends(); self._stream_marks.clear()
+        job = GenerationJob(config_data, folder, svc, prov, key, mdl, prompts_to_generate, metrics=metrics, backup=backup, resume=resume, read_cache=not self.bypass_cache.get())
+        self.jobs[job.id] = job; self._refresh_job_row(job); self.btn_cancel.config(state=tk.NORMAL)
+        # Progress goes through the UI bus (latest message per job wins); streamed sections are labelled with the job number
+        job.future = self.job_pool.submit(job.run, self.response_cache, lambda msg: self._post_job_progress(job, msg), lambda fname, chunk: self._on_stream_chunk(f"[{job.id}] {fname}", chunk))
+        job.future.add_done_callback(lambda future: self.ui_bus.call(self._generation_complete, job))
+        self.update_status(f"Job {job.id} queued: {job.name} ({size_note})")
+    def _refresh_job_row(self, job: GenerationJob):
+        if job.id not in self.jobs: return # Cleared while this update was queued; don't bring the row back
+        o = job.outcome or {}; files = len(o.get("results", {})) if o else len(job.prompts)
+        values = (job.id, job.name, job.status, job.progress, files, len(o.get("errors", [])), job.folder)
+        if self.job_tree.exists(str(job.id)): self.job_tree.item(str(job.id), values=values)
+        else: self.job_tree.insert("", tk.END, iid=str(job.id), values=values)
+    def _post_job_progress(self, job: GenerationJob, msg: str):
+        """Called from worker threads. Only the latest row update per job and the latest status line survive until the next tick."""
+        self.ui_bus.post(("job", job.id), self._refresh_job_row, job); self.ui_bus.post("status", self.update_status, f"[{job.id}] {msg}")
+    def _selected_jobs(self) -> list[GenerationJob]: return [self.jobs[int(iid)] for iid in self.job_tree.selection() if int(iid) in self.jobs]
+    def cancel_generation(self):
+        """Cancels the jobs selected in the Jobs panel (every unfinished job if none is selected). Queued jobs are dropped;
+        running ones drop their queued files and close open response streams right away."""
+        targets = [j for j in (self._selected_jobs() or list(self.jobs.values())) if j.active and not j.cancel.cancelled]
+        for job in targets:
+            log.debug(f"Cancel requested for job {job.id}"); job.cancel.cancel()
+            if job.future is not None and job.future.cancel(): job.finish_cancelled() # Never started; its done callback still fires
+            else: job.progress = "Cancelling..."
+            self._refresh_job_row(job)
+        if targets: self.update_status(f"Cancelling {len(targets)} job(s)...")
+    def clear_finished_jobs(self):
+        for job in [j for j in self.jobs.values() if not j.active]: del self.jobs[job.id]; self.job_tree.delete(str(job.id))
+    def _on_close(self):
+        """Cancels unfinished jobs (their checkpoints are kept for Resume) before closing the window."""
+        active = [j for j in self.jobs.values() if j.active]
+        if active and not messagebox.askyesno("Jobs Running", f"{len(active)} job(s) are still queued or running. Cancel them and quit?"): return
+        for job in active: job.cancel.cancel()
+        self.ui_bus.stop(); self.job_pool.shutdown(wait=False, cancel_futures=True); self.root.destroy()
+    def _show_run_summary(self, report: dict):
+        """Fills the Last Run panel from a RunMetrics report (phases, totals and one row per file)."""
+        t = report["totals"]; phases = ", ".join(f"{k} {v:.2f}s" for k, v in report["phases"].items())
+        tokens = f"tokens in/out {t['prompt_tokens']:,}/{t['completion_tokens']:,}" if t["prompt_tokens"] or t["completion_tokens"] else f"~{t['estimated_prompt_tokens']:,} input tokens (estimated)"
+        self.label_run_summary.config(text=f"{report['provider']} / {report['model']}: {t['wall_seconds']:.1f}s, {t['files']} file(s), {t['cached']} cached, {tokens}\nPhases: {phases or '-'}")
+        self.run_summary_tree.delete(*self.run_summary_tree.get_children())
+        for f in report["files"]: self.run_summary_tree.insert("", tk.END, values=[f.get(c, "") if not isinstance(f.get(c), float) else f"{f[c]:.2f}" for c in RUN_SUMMARY_COLUMNS])
+    def _on_stream_chunk(self, filename, chunk):
+        """Called from worker threads; the UI bus batches the chunks of each file until its next tick."""
+        self.ui_bus.append(filename, chunk)
+    def _append_preview(self, target, text: str):
+        """UI bus append sink. target None appends plain text at the end; otherwise text joins the streamed section of that name."""
+        out = self.preview_output; out.config(state=tk.NORMAL)
+        if target is None: out.insert(tk.END, text)
+        else:
+            mark = self._stream_marks.get(target)
+            if mark is None: # First chunk of this file: add its section and a right-gravity mark before the trailing blank line
+                mark = self._stream_marks[target] = f"stream{len(self._stream_marks)}"
+                out.insert(tk.END, f"=== {target} ===\n\n\n"); out.mark_set(mark, "end-3c"); out.mark_gravity(mark, tk.RIGHT)
+            out.insert(mark, text); out.see(tk.END) # Follow the stream; the final preview stays scrolled to the top
+        out.config(state=tk.DISABLED)
+    def _disable_ui_during_action(self, fetching=False): widgets=[self.btn_generate,self.btn_resume,self.btn_save,self.btn_open,self.btn_clear]; widgets.extend([self.btn_fetch_models, self.combo_provider, self.entry_openai_apikey, self.entry_gemini_apikey, self.combo_model] if fetching else [self.btn_fetch_models]); [w.config(state=tk.DISABLED) for w in widgets if w.winfo_exists()]
+    def _enable_ui_after_action(self, fetching=False): widgets=[self.btn_generate,self.btn_resume,self.btn_save,self.btn_open,self.btn_clear,self.btn_fetch_models, self.combo_provider, self.entry_openai_apikey, self.entry_gemini_apikey]; [w.config(state="readonly" if isinstance(w,ttk.Combobox) and w!=self.combo_model else tk.NORMAL) for w in widgets if w.winfo_exists() and w!=self.combo_model]; self.combo_model.config(state="readonly" if self.combo_model.winfo_exists() and self.combo_model['values'] else tk.DISABLED)
+    def _generation_complete(self, job: GenerationJob):
+        """Called on the Tk loop when a job ends. Updates its row and the Last Run panel; when no other job is still
+        running, the preview shows this job's files and its summary pops up (otherwise use Details)."""
+        if job.outcome is None: job.finish_cancelled()
+        others = any(j.active for j in self.jobs.values()); self.btn_cancel.config(state=tk.NORMAL if others else tk.DISABLED)
+        if job.id not in self.jobs: return # Cleared from the list before this callback ran
+        self._refresh_job_row(job); self.update_status(f"Job {job.id} {job.progress.lower()}: {job.name}")
+        if job.outcome["metrics"]: self._show_run_summary(job.outcome["metrics"])
+        if not others: self.show_job_details(job)
+    def show_job_details(self, job: GenerationJob | None = None):
+        """Shows a finished job's files in the preview and its summary (Details button / double-click on a job)."""
+        job = job or next(iter(self._selected_jobs()), None)
+        if job is None: messagebox.showinfo("Jobs", "Select a job first."); return
+        if job.outcome is None: messagebox.showinfo(f"Job {job.id}", f"{job.name}: {job.progress}\nFolder:{job.folder}"); return
+        results, errors, folder, git_ok, cancelled = job.outcome["results"], job.outcome["errors"], job.folder, job.outcome["git_ok"], job.outcome["cancelled"]
+        self.ui_bus.discard_appends(); self._stream_marks.clear() # The final preview below replaces the streamed one
+        print("DEBUG: show_job_details called"); print(f"DEBUG: Errors: {errors}"); success=sorted(list(results.keys())); req=[".cursorrules","architecture.md","project_plan.md"]+["README.md"]*bool(job.config.get("gen_readme"))+[".gitignore"]*bool(job.config.get("gen_gitignore")); failed=sorted([f for f in req if f not in success])
+        if results: # Queued on the bus, so a large preview is inserted over several ticks instead of freezing one frame
+            self.preview_output.config(state=tk.NORMAL); self.preview_output.delete("1.0",tk.END); self.preview_output.config(state=tk.DISABLED)
+            for fname in success: self.ui_bus.append(None, f"=== {fname} ===\n{results[fname]}\n\n")
         msg,mtype,stat="","info","OK."; err_sum='\n- '.join(errors) if errors else "None.";
         if not results and errors: msg,mtype,stat=f"Failed.\nFolder:{folder}\nErrors:\n- {err_sum}","error","Failed."
         elif errors: msg,mtype,stat=f"Done w/ errors.\nFolder:{folder}\n"+(f"OK:{','.join(success)}\n"if success else "")+(f"Fail:{','.join(failed)}\n"if failed else "")+f"Errors:\n- {err_sum}","warning","Done w/ errors."
         else: msg,mtype,stat=f"OK!\nFolder:{folder}\nFiles:{','.join(success)}"+("\nGit init OK."if git_ok else("\n(Already Git repo)."if git_ok is False else"")),"info","OK."
         if failed and results: msg+=f"\n\nFailed:{','.join(failed)}"; mtype="warning" if mtype=="info" else mtype
-        title="Complete" if mtype=="info" else("Warnings" if mtype=="warning" else "Failed"); box=messagebox.showinfo if mtype=="info" else(messagebox.showwarning if mtype=="warning" else messagebox.showerror); box(title,msg); self.update_status(stat)
+        if cancelled: msg,mtype,stat=f"Cancelled.\nFolder:{folder}\n"+(f"Finished before cancel:{','.join(success)}\n" if success else "No files were finished.\n")+("Use Resume to continue." if not errors else f"Errors:\n- {err_sum}"),"warning","Cancelled."
+        title="Cancelled" if cancelled else "Complete" if mtype=="info" else("Warnings" if mtype=="warning" else "Failed"); box=messagebox.showinfo if mtype=="info" else(messagebox.showwarning if mtype=="warning" else messagebox.showerror); box(f"Job {job.id}: {title}",msg); self.update_status(f"Job {job.id}: {stat}")
         if results and messagebox.askyesno("Open?",f"Open folder?\n{folder}"):
             try: os.startfile(folder) if os.name=='nt' else subprocess.run(['open' if os.uname().sysname=='Darwin' else 'xdg-open',folder],check=True)
             except Exception as e: messagebox.showerror("Error",f"Cannot open:{e}")
     def run(self): self.root.mainloop()
 
+# --- Offline Fake Service & Benchmark ---
+LOREM = "lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod tempor incididunt ut labore et dolore magna aliqua "
+
+class FakeAIService(AIService):
+    """Offline AIService for benchmarks and dry runs. Each call waits latency (+/- jitter) plus the time to 'produce'
+    output_chars at chars_per_sec, streams in chunk_chars pieces, and fails with probability error_rate (RuntimeError)
+    or rate_limit_rate (RateLimitError with retry_after). With truncate_chars, no call returns more than that many characters
+    and OutputTruncated is raised instead; a continuation prompt picks up right after the quoted tail, so continued outputs
+    can be compared with expected_output(). Usage is reported from local token estimates."""
+    def __init__(self, latency: float = 0.05, jitter: float = 0.0, chars_per_sec: float = 20_000, output_chars: int = 2000, chunk_chars: int = 64, error_rate: float = 0.0, rate_limit_rate: float = 0.0, retry_after: float = 0.05, seed: int | None = None, models: list[str] | None = None, truncate_chars: int = 0):
+        self.latency, self.jitter, self.chars_per_sec, self.output_chars, self.chunk_chars = latency, jitter, chars_per_sec, output_chars, max(1, chunk_chars)
+        self.error_rate, self.rate_limit_rate, self.retry_after, self.models = error_rate, rate_limit_rate, retry_after, models or ["fake-fast", "fake-slow"]
+        self.truncate_chars = max(0, truncate_chars); self._random = random.Random(seed); self._lock = threading.Lock(); self.calls = 0
+    def _begin(self, prompt: str) -> float:
+        """Counts the call, raises the configured failures and returns the time to the first token."""
+        with self._lock: self.calls += 1; roll = self._random.random(); delay = max(0.0, self.latency + self._random.uniform(-self.jitter, self.jitter))
+        if roll < self.rate_limit_rate: time.sleep(delay / 4); raise RateLimitError("Fake rate limit.", self.retry_after)
+        if roll < self.rate_limit_rate + self.error_rate: time.sleep(delay / 4); raise RuntimeError("Fake generation error.")
+        return delay
+    def expected_output(self, prompt: str) -> str:
+        """The complete answer to prompt. Numbered lines keep it from repeating, so an overlap check cannot mistake new text for old."""
+        head = f"# Output for prompt {hashlib.sha256(prompt.encode('utf-8')).hexdigest()[:12]}\n\n"
+        body = "".join(f"{i}. {LOREM}\n\n" for i in range(1, self.output_chars // len(LOREM) + 2))
+        return (head + body)[:max(len(head), self.output_chars)]
+    def _output(self, prompt: str) -> tuple[str, bool]:
+        """(text of this call, truncated). A continuation prompt resumes the original answer after the quoted tail."""
+        lead, trail = CONTINUATION_PROMPT.split("{prompt}", 1)[1].split("{tail}", 1)
+        original, sep, tail = prompt.partition(lead); full = self.expected_output(original); start = 0
+        if sep and tail.endswith(trail):
+            tail = tail[:-len(trail)]; at = full.find(tail); start = at + len(tail) if at >= 0 else len(full)
+        text = full[start:]
+        if self.truncate_chars and len(text) > self.truncate_chars: return text[:self.truncate_chars], True
+        return text, False
+    def list_models(self, api_key: str) -> list[str]: return list(self.models)
+    def generate_text(self, api_key: str, model: str, prompt: str, temperature: float = 0.3) -> str:
+        delay = self._begin(prompt); text, truncated = self._output(prompt); time.sleep(delay + len(text) / self.chars_per_sec)
+        add_call(prompt_tokens=estimate_tokens(prompt), completion_tokens=estimate_tokens(text))
+        if truncated: raise OutputTruncated("Fake output hit the token limit.", partial=text)
+        return text
+    def generate_text_stream(self, api_key: str, model: str, prompt: str, temperature: float = 0.3, cancel: CancelToken | None = None):
+        delay = self._begin(prompt); text, truncated = self._output(prompt); wait = cancel.sleep if cancel is not None else time.sleep
+        wait(delay)
+        for i in range(0, len(text), self.chunk_chars):
+            chunk = text[i:i + self.chunk_chars]; wait(len(chunk) / self.chars_per_sec); yield chunk
+        add_call(prompt_tokens=estimate_tokens(prompt), completion_tokens=estimate_tokens(text))
+        if truncated: raise OutputTruncated("Fake output hit the token limit.")
+
+def synthetic_project(modules: int, text_chars: int = 400, fanout: int = 8, seed: int = 0) -> dict:
+    """Project dict with a module tree of the given size (fanout children per node, breadth first) and long text fields."""
+    rnd = random.Random(seed); text = lambda n: (LOREM * (n // len(LOREM) + 1))[:n]
+    mods = [{"id": i + 1, "parent_id": (i - 1) // fanout + 1 if i >= fanout else None, "nama": f"Module {i + 1:05d}", "deskripsi": text(rnd.randint(text_chars // 2, text_chars))} for i in range(modules)]
+    return normalize_project_data({"name": f"Bench {modules}", "purpose": text(text_chars), "target_users": text(text_chars // 4), "main_workflow": text(text_chars), "data_entities": text(text_chars // 2),
+                                   "features_manual": text(text_chars * 4), "modules": mods, "language_list": ["Python", "TypeScript"], "web_framework": "FastAPI", "ui_lib": "React",
+                                   "design_principles": text(text_chars // 2), "nfrs": text(text_chars // 2), "notes": text(text_chars), "_next_module_id": modules + 1})
+
+def run_benchmark(sizes: list[int], svc: FakeAIService, model: str = "fake-fast", concurrency: int = DEFAULT_GEN_CONCURRENCY, text_chars: int = 400, stream: bool = False, chunked: bool = False, limits: dict | None = None, on_progress=None) -> list[dict]:
+    """Runs the full pipeline (module tree, prompts, scheduler, generation, writes) once per project size against svc in a
+    temp folder and returns one result per size: stage timings, throughput, p50/p99 call latency and peak traced memory.
+    When svc truncates its outputs, every continued file is also compared with svc.expected_output() ('mismatches')."""
+    import tracemalloc
+    report = on_progress or (lambda msg: None); results = []
+    for size in sizes:
+        report(f"Benchmark: {size} modules...")
+        d = synthetic_project(size, text_chars); d.update(gen_concurrency=concurrency, chunked_docs=chunked)
+        if svc.truncate_chars: d["max_continuations"] = svc.output_chars // svc.truncate_chars + 1 # Enough to finish every output
+        scheduler = RequestScheduler({"Fake": {"rpm": 1_000_000, "tpm": 10**9, "max_in_flight": MAX_GEN_CONCURRENCY, **(limits or {})}}, base_delay=0.01, max_delay=0.5)
+        calls_before = svc.calls; tracemalloc.start()
+        try:
+            started = time.perf_counter(); tree = ModuleTree(d["modules"]); [tree.display_path(i) for i in tree.descendant_ids(None)]; tree_s = time.perf_counter() - started
+            started = time.perf_counter(); prompts = prepare_prompts(d, model); prompts_s = time.perf_counter() - started
+            with tempfile.TemporaryDirectory(prefix="bpg-bench-") as folder:
+                started = time.perf_counter()
+                outcome = run_blueprint(d, folder, svc, "Fake", "fake-key", model, prompts=prompts, scheduler=scheduler, on_chunk=(lambda f, c: None) if stream else None)
+                run_s = time.perf_counter() - started
+            _, peak = tracemalloc.get_traced_memory()
+        finally: tracemalloc.stop()
+        calls = [f["total"] for f in outcome["metrics"]["files"] if f.get("status") == "ok"]; files = len(outcome["results"])
+        checked = [f for f in prompts if f not in outcome["local"] and f != ".cursorrules" and not (chunked and f in CHUNKED_FILES)] if svc.truncate_chars else [] # Merged documents are not one answer
+        mismatches = [f for f in checked if outcome["results"].get(f) != svc.expected_output(prompts[f]).strip()]
+        results.append({"modules": size, "prompt_chars": sum(len(p) for p in prompts.values()), "tree_seconds": round(tree_s, 4), "prompts_seconds": round(prompts_s, 4), "run_seconds": round(run_s, 4),
+                        "files": files, "calls": svc.calls - calls_before, "retries": scheduler.retries, "errors": len(outcome["errors"]), "files_per_second": round(files / run_s, 2) if run_s else 0.0,
+                        "p50_latency": round(_percentile(calls, 50), 4), "p99_latency": round(_percentile(calls, 99), 4), "peak_memory_mb": round(peak / 1024 / 1024, 2), "mismatches": mismatches})
+    return results
+
+
+# --- Headless CLI / Batch Mode ---
+API_KEY_ENV_VARS = {"OpenAI": "OPENAI_API_KEY", "Gemini": "GEMINI_API_KEY"}
+PROJECT_DEFAULTS = {"name": "", "purpose": "", "target_users": "", "main_workflow": "", "data_entities": "", "features_manual": "", "modules": [], "project_type": "Web", "language_list": [], "web_framework": "", "ui_lib": "", "state_mgmt": "", "database": "", "key_libs": "", "design_principles": "", "nfrs": "", "notes": "", "tests_enabled": False, "gen_readme": True, "gen_gitignore": True, "git_init": False, "deployment_target": "Simple Web Server (Apache/Nginx/Local)", "gen_concurrency": DEFAULT_GEN_CONCURRENCY, "changed_only": False, "chunked_docs": False, "hedge_backup": "", "max_continuations": DEFAULT_MAX_CONTINUATIONS}
+
+def normalize_project_data(data: dict) -> dict:
+    """Fills keys older .bpgproj files may lack and maps 'None' combo values to '' (same shape ambil_input_data returns)."""
+    d = {**PROJECT_DEFAULTS, **data}
+    if not d.get("language"): d["language"] = ", ".join(d["language_list"])
+    for k in ["web_framework", "ui_lib", "state_mgmt", "database"]: d[k] = "" if (d[k] or "").lower() == "none" else (d[k] or "")
+    return d
+
+def validate_project_data(d: dict) -> list[str]:
+    problems = [f"Missing {n}" for n, k in [("Name", "name"), ("Purpose", "purpose"), ("Type", "project_type"), ("Lang", "language")] if not d.get(k)]
+    if not d.get("features_manual") and not d.get("modules"): problems.append("Need Features or Modules")
+    return problems
+
+def load_project_file(path: str) -> dict: return normalize_project_data(read_project_file(path))
+
+def resolve_project_target(data: dict, services: dict[str, AIService], provider: str | None = None, model: str | None = None, api_key: str | None = None):
+    """Provider, model and API key of a project: overrides first, then the project file, then $OPENAI_API_KEY / $GEMINI_API_KEY.
+    Returns (provider, model, api_key, problems); problems also covers validate_project_data."""
+    prov = provider or data.get("ai_provider") or "OpenAI"; mdl = model or data.get("model") or ""
+    key = api_key or data.get("openai_api_key" if prov == "OpenAI" else "gemini_api_key") or os.environ.get(API_KEY_ENV_VARS.get(prov, ""), "")
+    problems = validate_project_data(data)
+    if prov not in services: problems.append(f"Provider '{prov}' not available")
+    if not key: problems.append(f"API Key for {prov} missing (project file or ${API_KEY_ENV_VARS.get(prov, '')})")
+    if not mdl: problems.append("Model missing (project file or --model)")
+    return prov, mdl, key, problems
+
+def generate_project_headless(path: str, out_root: str, services: dict[str, AIService], provider: str | None = None, model: str | None = None, api_key: str | None = None, concurrency: int | None = None, changed_only: bool = False, cache: ResponseCache | None = None, read_cache: bool = True, chunked: bool | None = None, resume: bool = False, cancel: CancelToken | None = None, prompt_budget: int | None = None, hedge: str | None = None, hedge_percentile: float | None = None, max_continuations: int | None = None, hedge_delay: float | None = None) -> dict:
+    """Generates one .bpgproj into out_root/<file stem>. Never raises; failures are reported in the returned summary entry."""
+    started = time.time(); folder = os.path.join(out_root, os.path.splitext(os.path.basename(path))[0])
+    entry = {"project": path, "output": folder, "provider": None, "model": None, "ok": False, "files": [], "unchanged": [], "restored": [], "errors": [], "cancelled": False, "git_ok": None, "cache_hits": 0}
+    try:
+        if cancel is not None and cancel.cancelled: entry.update(cancelled=True, errors=["Cancelled before start"]); return entry
+        metrics = RunMetrics()
+        with metrics.phase("input"): data = load_project_file(path)
+        prov, mdl, key, problems = resolve_project_target(data, services, provider, model, api_key); entry.update(provider=prov, model=mdl)
+        backup = None; hedge = hedge or data.get("hedge_backup")
+        if hedge:
+            target = parse_hedge_target(hedge); backup_key = (data.get("openai_api_key" if target[0] == "OpenAI" else "gemini_api_key") or os.environ.get(API_KEY_ENV_VARS.get(target[0], ""), "")) if target else ""
+            if not target or target[0] not in services or not backup_key: problems.append(f"Hedge target '{hedge}' needs 'Provider:model' with an available provider and API key")
+            else: backup = (services[target[0]], target[0], backup_key, target[1])
+        if problems: entry["errors"] = problems; return entry
+        if concurrency: data["gen_concurrency"] = concurrency
+        if changed_only: data["changed_only"] = True
+        if chunked is not None: data["chunked_docs"] = chunked # None keeps the project setting
+        if prompt_budget: data["prompt_budget"] = prompt_budget
+        if hedge_percentile: data["hedge_percentile"] = hedge_percentile
+        if hedge_delay: data["hedge_delay"] = hedge_delay
+        if max_continuations is not None: data["max_continuations"] = max_continuations
+        os.makedirs(folder, exist_ok=True)
+        outcome = run_blueprint(data, folder, services[prov], prov, key, mdl, cache=cache, read_cache=read_cache, resume=resume, cancel=cancel, metrics=metrics, backup=backup, on_progress=lambda msg: print(f"[{os.path.basename(path)}] {msg}"))
+        entry.update(files=sorted(outcome["results"]), unchanged=outcome["unchanged"], restored=outcome["restored"], errors=outcome["errors"], cancelled=outcome["cancelled"], git_ok=outcome["git_ok"], cache_hits=outcome["cache_hits"], metrics={"phases": outcome["metrics"]["phases"], "totals": outcome["metrics"]["totals"]}, ok=not outcome["errors"] and not outcome["cancelled"] and bool(outcome["results"]))
+    except Exception as e: entry["errors"].append(f"{type(e).__name__}: {e}")
+    finally: entry["seconds"] = round(time.time() - started, 3)
+    return entry
+
+
+# --- Batch Submission ---
+BATCH_STATE_FILENAME = ".blueprint_batches.json"
+BATCH_POLL_SECONDS = 30.0
+BATCH_TERMINAL = ("completed", "failed", "expired", "cancelled")
+
+class BatchBackend(ABC):
+    """A provider's asynchronous batch API: upload a JSONL file of requests, poll it, download the answers.
+    Request lines use the OpenAI batch format; custom_id is the response-cache key of the prompt."""
+    @staticmethod
+    def request_line(custom_id: str, model: str, prompt: str, temperature: float) -> dict:
+        return {"custom_id": custom_id, "method": "POST", "url": "/v1/chat/completions", "body": {"model": model, "messages": [{"role": "user", "content": prompt}], "temperature": temperature}}
+    @abstractmethod
+    def submit(self, api_key: str, requests_path: str) -> str: pass # Returns the batch id
+    @abstractmethod
+    def poll(self, api_key: str, batch_id: str) -> str: pass # Provider status; finished once in BATCH_TERMINAL
+    @abstractmethod
+    def results(self, api_key: str, batch_id: str) -> dict[str, tuple[str | None, str | None]]: pass # custom_id -> (text, error)
+
+def parse_batch_output(lines) -> dict[str, tuple[str | None, str | None]]:
+    """Reads OpenAI batch output/error JSONL lines. Outputs cut off at the token limit count as errors."""
+    out = {}
+    for line in lines:
+        if not line.strip(): continue
+        try: item = json.loads(line); cid = item["custom_id"]
+        except (ValueError, KeyError, TypeError): continue
+        response = item.get("response") or {}; body = response.get("body") or {}
+        try:
+            if item.get("error") or response.get("status_code") != 200: raise RuntimeError((item.get("error") or body.get("error") or {}).get("message") or f"HTTP {response.get('status_code')}")
+            choice = body["choices"][0]
+            if choice.get("finish_reason") == "length": raise RuntimeError("output hit the token limit")
+            out[cid] = (choice["message"]["content"] or "", None)
+        except (RuntimeError, KeyError, IndexError, TypeError, AttributeError) as e: out[cid] = (None, str(e) or type(e).__name__)
+    return out
+
+class OpenAIBatchBackend(BatchBackend):
+    """OpenAI Batch API (/v1/batches, 24h completion window), using the OpenAIService's per-key clients."""
+    def __init__(self, service: OpenAIService): self.service = service
+    def _client(self, api_key: str):
+        if not openai_available: raise ImportError("OpenAI package not installed.")
+        _load_openai(); return self.service._client(api_key)
+    def submit(self, api_key: str, requests_path: str) -> str:
+        client = self._client(api_key)
+        with open(requests_path, "rb") as f: uploaded = client.files.create(file=f, purpose="batch")
+        return client.batches.create(input_file_id=uploaded.id, endpoint="/v1/chat/completions", completion_window="24h").id
+    def poll(self, api_key: str, batch_id: str) -> str: return self._client(api_key).batches.retrieve(batch_id).status
+    def results(self, api_key: str, batch_id: str) -> dict[str, tuple[str | None, str | None]]:
+        client = self._client(api_key); batch = client.batches.retrieve(batch_id); out = {}
+        for file_id in (batch.error_file_id, batch.output_file_id): # Output last, so an answer wins over an error for the same id
+            if file_id: out.update(parse_batch_output(client.files.content(file_id).text.splitlines()))
+        return out
+
+class FakeBatchBackend(BatchBackend):
+    """Offline stand-in for a batch API. Batches are kept under directory (so they survive restarts like real ones),
+    report 'in_progress' for latency seconds and are then answered line by line by svc (e.g. a FakeAIService)."""
+    def __init__(self, svc: AIService, directory: str, latency: float = 0.0):
+        self.svc, self.directory, self.latency = svc, directory, latency
+    def _path(self, batch_id: str) -> str: return os.path.join(self.directory, f"{batch_id}.json")
+    def submit(self, api_key: str, requests_path: str) -> str:
+        os.makedirs(self.directory, exist_ok=True); batch_id = f"fakebatch_{hashlib.sha256(f'{requests_path}{time.time()}'.encode()).hexdigest()[:16]}"
+        with open(requests_path, "r", encoding="utf-8") as f: lines = [line for line in f if line.strip()]
+        atomic_write_text(self._path(batch_id), json.dumps({"submitted": time.time(), "requests": lines})); return batch_id
+    def _load(self, batch_id: str) -> dict:
+        with open(self._path(batch_id), "r", encoding="utf-8") as f: return json.load(f)
+    def poll(self, api_key: str, batch_id: str) -> str:
+        return "completed" if time.time() - self._load(batch_id)["submitted"] >= self.latency else "in_progress"
+    def results(self, api_key: str, batch_id: str) -> dict[str, tuple[str | None, str | None]]:
+        out = {}
+        for line in self._load(batch_id)["requests"]:
+            req = json.loads(line); body = req["body"]
+            try: out[req["custom_id"]] = (self.svc.generate_text(api_key, body["model"], body["messages"][0]["content"], temperature=body.get("temperature", GEN_TEMPERATURE)), None)
+            except Exception as e: out[req["custom_id"]] = (None, f"{type(e).__name__}: {e}")
+        return out
+
+class BatchState:
+    """Submitted batches of an output root, saved to BATCH_STATE_FILENAME right after each submit, so an interrupted
+    `batch` run picks up its pending batches instead of paying for them twice."""
+    def __init__(self, out_root: str):
+        self.path = os.path.join(out_root, BATCH_STATE_FILENAME)
+        try:
+            with open(self.path, "r", encoding="utf-8") as f: self.batches: dict[str, dict] = json.load(f).get("batches", {})
+        except (OSError, ValueError, AttributeError): self.batches = {}
+    def save(self): atomic_write_text(self.path, json.dumps({"version": 1, "batches": self.batches}, indent=2))
+    def find_pending(self, provider: str, model: str, custom_ids: set[str]) -> str | None:
+        """An uncollected batch for provider/model that already covers every custom id."""
+        return next((bid for bid, b in self.batches.items() if not b.get("collected") and b["provider"] == provider and b["model"] == model and custom_ids <= set(b["custom_ids"])), None)
+    def add(self, batch_id: str, provider: str, model: str, requests_path: str, custom_ids: list[str]):
+        self.batches[batch_id] = {"provider": provider, "model": model, "requests": requests_path, "custom_ids": custom_ids, "status": "submitted", "submitted": time.time(), "collected": False}; self.save()
+    def update(self, batch_id: str, **values): self.batches[batch_id].update(values); self.save()
+
+def run_batch(paths: list[str], out_root: str, services: dict[str, AIService], backends: dict[str, BatchBackend], provider: str | None = None, model: str | None = None, api_key: str | None = None, cache: ResponseCache | None = None, poll_interval: float = BATCH_POLL_SECONDS, wait: bool = True, concurrency: int | None = None, jobs: int = 2, on_progress=print) -> dict:
+    """Generates many projects through provider batch APIs:
+    1. every LLM prompt of every project that is not in the response cache goes into one JSONL file per provider/model
+       (identical prompts are sent once; chunked docs are turned off because their section prompts depend on earlier answers);
+    2. the file is submitted (or a pending batch covering it is resumed from BATCH_STATE_FILENAME) and polled until done;
+    3. the answers are stored in the response cache and every project is generated as in `generate`, now from cache hits.
+    Failed or truncated batch items are generated live during step 3. With wait=False the run stops after submitting;
+    run it again later to collect. A provider/model whose batch cannot be submitted, polled or downloaded is reported in
+    summary['errors'] (and on its batch in BATCH_STATE_FILENAME) and its projects fail without live calls; an uncollected
+    batch is resumed by the next run. Returns a summary with the batches and one generate_project_headless entry per project."""
+    cache = cache or ResponseCache(); os.makedirs(out_root, exist_ok=True); state = BatchState(out_root)
+    summary = {"ok": False, "pending": False, "errors": [], "batches": [], "projects": []}; groups, ready, broken = {}, [], {}
+    for path in paths:
+        folder = os.path.join(out_root, os.path.splitext(os.path.basename(path))[0])
+        try:
+            data = load_project_file(path); data["chunked_docs"] = False
+            prov, mdl, key, problems = resolve_project_target(data, services, provider, model, api_key)
+            if prov not in backends: problems.append(f"Batch mode is not available for {prov}")
+            if problems: summary["projects"].append({"project": path, "output": folder, "ok": False, "errors": problems}); continue
+            prompts = prepare_prompts(data, mdl); local = render_local_files(data, prompts)
+            prompts = {f: p for f, p in prompts.items() if f != ".cursorrules" and f not in local}
+            if data.get("changed_only"): prompts, _ = split_unchanged_prompts(prompts, folder, prov, mdl)
+        except Exception as e: summary["projects"].append({"project": path, "output": folder, "ok": False, "errors": [f"{type(e).__name__}: {e}"]}); continue
+        group = groups.setdefault((prov, mdl), {"key": key, "requests": {}})
+        for prompt in prompts.values():
+            cid = ResponseCache.make_key(prov, mdl, GEN_TEMPERATURE, prompt)
+            if cid not in group["requests"] and cache.get(cid) is None: group["requests"][cid] = prompt
+        ready.append((path, folder, (prov, mdl)))
+    def fail(prov, mdl, step, e, batch_id=None):
+        msg = f"{prov}/{mdl}: batch {step} failed: {type(e).__name__}: {e}"; broken[(prov, mdl)] = msg; summary["errors"].append(msg); on_progress(f"ERROR: {msg}")
+        if batch_id:
+            with contextlib.suppress(OSError): state.update(batch_id, error=msg, error_at=time.time()) # Left uncollected, so the next run retries it
+    pending = []
+    for (prov, mdl), group in groups.items():
+        if not group["requests"]: on_progress(f"{prov}/{mdl}: every prompt is cached, nothing to submit"); continue
+        batch_id = state.find_pending(prov, mdl, set(group["requests"]))
+        if batch_id: on_progress(f"{prov}/{mdl}: resuming batch {batch_id}")
+        else:
+            requests_path = os.path.join(out_root, f".blueprint_batch_{time.strftime('%Y%m%d-%H%M%S')}_{prov}_{hashlib.sha256(mdl.encode()).hexdigest()[:6]}.jsonl")
+            try:
+                with atomic_open(requests_path) as f: # Streamed line by line; the file can hold thousands of prompts
+                    for cid, prompt in group["requests"].items(): f.write(json.dumps(BatchBackend.request_line(cid, mdl, prompt, GEN_TEMPERATURE), ensure_ascii=False) + "\n")
+                batch_id = backends[prov].submit(group["key"], requests_path); state.add(batch_id, prov, mdl, requests_path, list(group["requests"]))
+            except Exception as e: fail(prov, mdl, "submit", e); continue
+            on_progress(f"{prov}/{mdl}: submitted batch {batch_id} with {len(group['requests'])} request(s)")
+        pending.append((batch_id, prov, mdl, group["key"]))
+    while pending:
+        for batch_id, prov, mdl, key in list(pending):
+            try:
+                status = backends[prov].poll(key, batch_id); state.update(batch_id, status=status)
+                if status not in BATCH_TERMINAL: continue
+                answers = backends[prov].results(key, batch_id) if status != "failed" else {} # Expired/cancelled batches keep what finished
+            except Exception as e: fail(prov, mdl, "poll/download", e, batch_id); pending.remove((batch_id, prov, mdl, key)); continue
+            if status == "failed": on_progress(f"Warn: {prov}/{mdl}: batch {batch_id} failed on the provider side; its prompts are generated live")
+            for cid, (text, _) in answers.items():
+                if text is not None: cache.put(cid, text.strip(), provider=prov, model=mdl, temperature=GEN_TEMPERATURE)
+            failed = {cid: err for cid, (text, err) in answers.items() if text is None}
+            try: state.update(batch_id, collected=True, answered=len(answers) - len(failed), failed=failed, collected_at=time.time())
+            except OSError as e: summary["errors"].append(f"Could not record batch {batch_id} as collected: {e}") # Answers are cached already
+            on_progress(f"{prov}/{mdl}: batch {batch_id} {status}, {len(answers) - len(failed)} answer(s), {len(failed)} failed"); pending.remove((batch_id, prov, mdl, key))
+        if pending and not wait: summary["pending"] = True; on_progress(f"{len(pending)} batch(es) still running; run the same command again to collect them"); break
+        if pending: on_progress(f"Waiting for {len(pending)} batch(es)..."); time.sleep(poll_interval)
+    summary["batches"] = [{"id": bid, **{k: v for k, v in b.items() if k != "custom_ids"}, "requests_count": len(b["custom_ids"])} for bid, b in state.batches.items()]
+    if summary["pending"]: return summary
+    summary["projects"] += [{"project": path, "output": folder, "ok": False, "errors": [broken[group]]} for path, folder, group in ready if group in broken]
+    on_progress("Writing project files from batch results...")
+    with ThreadPoolExecutor(max_workers=max(1, jobs), thread_name_prefix="bpg-project") as pool:
+        summary["projects"] += list(pool.map(lambda path: generate_project_headless(path, out_root, services, provider, model, api_key, concurrency, cache=cache, chunked=False), [path for path, _, group in ready if group not in broken]))
+    summary["ok"] = bool(summary["projects"]) and all(e["ok"] for e in summary["projects"]) and not broken; return summary
+
+def build_cli_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="blueprint_generator", description="Cursor Blueprint Generator. Run without arguments to open the GUI.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    gen = sub.add_parser("generate", help="Generate blueprints from .bpgproj files without the GUI.")
+    gen.add_argument("projects", nargs="+", help=".bpgproj / .bpgz files to generate.")
+    gen.add_argument("-o", "--output", required=True, help="Output root; each project is written to a sub-folder named after its file.")
+    gen.add_argument("--provider", choices=["OpenAI", "Gemini"], help="Override the provider stored in each project.")
+    gen.add_argument("--model", help="Override the model stored in each project.")
+    gen.add_argument("--api-key", help="API key (default: project file, then $OPENAI_API_KEY / $GEMINI_API_KEY).")
+    gen.add_argument("-j", "--jobs", type=int, default=2, help="Projects generated in parallel (default: 2).")
+    gen.add_argument("-c", "--concurrency", type=int, help="Files generated in parallel per project (default: project setting).")
+    gen.add_argument("--changed-only", action="store_true", help="Skip files whose inputs are unchanged since the last run.")
+    gen.add_argument("--no-cache", action="store_true", help="Bypass the response cache (fresh output still refreshes it).")
+    gen.add_argument("--resume", action="store_true", help="Restore files checkpointed by an interrupted run and generate only the rest.")
+    gen.add_argument("--chunked", action="store_true", help="Generate architecture.md / project_plan.md per top-level module, then merge.")
+    gen.add_argument("--prompt-budget", type=int, help="Max estimated input tokens per prompt (default: per-model budget); the shared context is trimmed to fit.")
+    gen.add_argument("--hedge", metavar="PROVIDER:MODEL", help="Race a backup provider/model against calls slower than --hedge-percentile (default: project setting).")
+    gen.add_argument("--hedge-percentile", type=float, help=f"Latency percentile after which a backup request is sent (default: {HEDGE_PERCENTILE}).")
+    gen.add_argument("--hedge-delay", type=float, help=f"Seconds to wait before hedging while a model has fewer than {HEDGE_MIN_SAMPLES} recorded latencies (default: {HEDGE_DEFAULT_DELAY:g}).")
+    gen.add_argument("--max-continuations", type=int, help=f"Continuation requests per output cut off at the model's token limit; 0 = fail it (default: project setting, else {DEFAULT_MAX_CONTINUATIONS}).")
+    gen.add_argument("--rpm", type=int, help="Requests per minute allowed per provider (shared by all jobs).")
+    gen.add_argument("--tpm", type=int, help="Estimated tokens per minute allowed per provider (shared by all jobs).")
+    gen.add_argument("--summary-file", help="Also write the JSON summary to this file.")
+    batch = sub.add_parser("batch", help="Generate many projects through the provider's batch API (cheaper, slower; OpenAI only).")
+    batch.add_argument("projects", nargs="+", help=".bpgproj / .bpgz files to generate.")
+    batch.add_argument("-o", "--output", required=True, help=f"Output root (as for generate); also holds the request files and {BATCH_STATE_FILENAME}.")
+    batch.add_argument("--provider", choices=["OpenAI"], help="Override the provider stored in each project.")
+    batch.add_argument("--model", help="Override the model stored in each project.")
+    batch.add_argument("--api-key", help="API key (default: project file, then $OPENAI_API_KEY).")
+    batch.add_argument("--poll-interval", type=float, default=BATCH_POLL_SECONDS, help=f"Seconds between status checks (default: {BATCH_POLL_SECONDS:g}).")
+    batch.add_argument("--no-wait", action="store_true", help="Submit and exit; run the same command again later to collect the results.")
+    batch.add_argument("-j", "--jobs", type=int, default=2, help="Projects written in parallel once the results are in (default: 2).")
+    batch.add_argument("-c", "--concurrency", type=int, help="Files written in parallel per project (default: project setting).")
+    batch.add_argument("--fake", action="store_true", help="Use the offline fake service and batch backend (no network or API key).")
+    batch.add_argument("--fake-latency", type=float, default=0.0, help="Seconds a fake batch stays in progress (default: 0).")
+    batch.add_argument("--summary-file", help="Also write the JSON summary to this file.")
+    conv = sub.add_parser("convert", help="Convert a project between plain JSON (.bpgproj) and the compressed format (.bpgz).")
+    conv.add_argument("source", help="Project file to read (either format).")
+    conv.add_argument("target", help="File to write; the format follows its extension (.bpgz = compressed).")
+    info = sub.add_parser("info", help="Print a project's fields and module index without loading module descriptions.")
+    info.add_argument("projects", nargs="+", help=".bpgproj / .bpgz files.")
+    sub.add_parser("profile-startup", help="Report where startup time goes: module import, Tk, _create_widgets and (lazily loaded) AI SDK imports.")
+    bench = sub.add_parser("bench", help="Benchmark the generation pipeline offline against a fake AI service (no network or API key).")
+    bench.add_argument("--modules", default="10,100,1000,10000", help="Comma-separated module counts of the synthetic projects (default: 10,100,1000,10000).")
+    bench.add_argument("--text-chars", type=int, default=400, help="Length of the long text fields and module descriptions (default: 400).")
+    bench.add_argument("-c", "--concurrency", type=int, default=DEFAULT_GEN_CONCURRENCY, help=f"Files generated in parallel (default: {DEFAULT_GEN_CONCURRENCY}).")
+    bench.add_argument("--latency", type=float, default=0.05, help="Fake time to first token in seconds (default: 0.05).")
+    bench.add_argument("--jitter", type=float, default=0.0, help="Random +/- seconds added to the latency.")
+    bench.add_argument("--chars-per-sec", type=float, default=20_000, help="Fake output throughput (default: 20000).")
+    bench.add_argument("--output-chars", type=int, default=2000, help="Length of each fake completion (default: 2000).")
+    bench.add_argument("--chunk-chars", type=int, default=64, help="Characters per streamed chunk (default: 64).")
+    bench.add_argument("--error-rate", type=float, default=0.0, help="Probability of a failed call.")
+    bench.add_argument("--rate-limit-rate", type=float, default=0.0, help="Probability of a 429 response (retried by the scheduler).")
+    bench.add_argument("--truncate-chars", type=int, default=0, help="Cut every fake completion off after this many characters so it has to be continued, and check that the continued files come out whole (exit code 1 if not).")
+    bench.add_argument("--rpm", type=int, help="Requests per minute allowed for the fake provider (default: unlimited).")
+    bench.add_argument("--stream", action="store_true", help="Stream files to disk as the GUI does.")
+    bench.add_argument("--chunked", action="store_true", help="Generate architecture.md / project_plan.md per top-level module.")
+    bench.add_argument("--seed", type=int, default=0, help="Seed for fake latencies and failures (default: 0).")
+    bench.add_argument("--summary-file", help="Also write the JSON results to this file.")
+    return parser
+
+def main_cli(argv: list[str]) -> int:
+    args = build_cli_parser().parse_args(argv)
+    if args.command == "generate":
+        services = create_ai_services(); cache = ResponseCache(); started = time.time()
+        if not services: print("ERROR: Install 'openai' and/or 'google-generativeai'.", file=sys.stderr); return 1
+        for prov in ([args.provider] if args.provider else list(services)): REQUEST_SCHEDULER.configure(prov, rpm=args.rpm, tpm=args.tpm)
+        cancel = CancelToken()
+        # Progress and DEBUG output go to stderr so stdout carries only the JSON summary
+        with contextlib.redirect_stdout(sys.stderr), ThreadPoolExecutor(max_workers=max(1, args.jobs), thread_name_prefix="bpg-project") as pool:
+            futures = [pool.submit(generate_project_headless, path, args.output, services, args.provider, args.model, args.api_key, args.concurrency, args.changed_only, cache, not args.no_cache, args.chunked or None, args.resume, cancel, args.prompt_budget, args.hedge, args.hedge_percentile, args.max_continuations, args.hedge_delay) for path in args.projects]
+            try: entries = [f.result() for f in futures]
+            except KeyboardInterrupt: # Ctrl+C stops every job; checkpoints are kept for --resume
+                print("Cancelling..."); cancel.cancel(); entries = [f.result() for f in futures]
+        summary = {"ok": all(e["ok"] for e in entries), "succeeded": sum(e["ok"] for e in entries), "failed": sum(not e["ok"] for e in entries), "cancelled": cancel.cancelled, "seconds": round(time.time() - started, 3), "projects": entries}
+        text = json.dumps(summary, indent=2, ensure_ascii=False); print(text)
+        if args.summary_file:
+            with open(args.summary_file, "w", encoding="utf-8") as f: f.write(text)
+        return 130 if cancel.cancelled else 0 if summary["ok"] else 1
+    if args.command == "batch":
+        if args.fake:
+            services = {"OpenAI": FakeAIService(latency=0.0, chars_per_sec=1e9)}; backends = {"OpenAI": FakeBatchBackend(services["OpenAI"], os.path.join(args.output, ".fake_batches"), latency=args.fake_latency)}
+            args.provider, args.model, args.api_key = "OpenAI", args.model or "fake-fast", args.api_key or "fake-key"; cache = ResponseCache(os.path.join(args.output, ".fake_cache")) # Keep fake answers out of the real cache
+        else:
+            services = create_ai_services(); backends = {prov: OpenAIBatchBackend(svc) for prov, svc in services.items() if isinstance(svc, OpenAIService)}; cache = ResponseCache()
+            if not backends: print("ERROR: Batch mode needs the 'openai' package (the Gemini SDK in use has no batch API).", file=sys.stderr); return 1
+        with contextlib.redirect_stdout(sys.stderr):
+            try: summary = run_batch(args.projects, args.output, services, backends, args.provider, args.model, args.api_key, cache=cache, poll_interval=args.poll_interval, wait=not args.no_wait, concurrency=args.concurrency, jobs=args.jobs)
+            except KeyboardInterrupt: print(f"Interrupted; submitted batches are tracked in {os.path.join(args.output, BATCH_STATE_FILENAME)}. Run the same command again to collect them."); return 130
+            except OSError as e: print(f"ERROR: Batch run failed: {e}", file=sys.stderr); return 1
+        text = json.dumps(summary, indent=2, ensure_ascii=False); print(text)
+        if args.summary_file:
+            with open(args.summary_file, "w", encoding="utf-8") as f: f.write(text)
+        return 0 if summary["ok"] or (summary["pending"] and not summary["errors"]) else 1
+    if args.command == "convert":
+        try: save_project_file(args.target, read_project_file(args.source))
+        except (OSError, ValueError, KeyError, TypeError, zipfile.BadZipFile) as e: print(f"ERROR: Cannot convert {args.source}: {e}", file=sys.stderr); return 1
+        print(f"{args.source} ({os.path.getsize(args.source)} bytes) -> {args.target} ({os.path.getsize(args.target)} bytes)"); return 0
+    if args.command == "info":
+        entries = []; failed = False
+        for path in args.projects:
+            try:
+                header = read_project_header(path); mods = header.pop("modules")
+                for k in ("openai_api_key", "gemini_api_key"): header.pop(k, None) # Never echo secrets
+                entries.append({"project": path, "format": "bpgz" if is_project_archive(path) else "json", "bytes": os.path.getsize(path), "module_count": len(mods), "description_chars": sum(m["chars"] for m in mods), "fields": header, "modules": mods})
+            except (OSError, ValueError, KeyError, TypeError, zipfile.BadZipFile) as e: print(f"ERROR: Cannot read {path}: {e}", file=sys.stderr); failed = True # Other projects are still listed
+        print(json.dumps(entries, indent=2, ensure_ascii=False)); return 1 if failed else 0
+    if args.command == "profile-startup":
+        print(json.dumps(profile_startup(), indent=2)); return 0
+    if args.command == "bench":
+        sizes = [int(n) for n in args.modules.split(",") if n.strip()]
+        svc = FakeAIService(latency=args.latency, jitter=args.jitter, chars_per_sec=args.chars_per_sec, output_chars=args.output_chars, chunk_chars=args.chunk_chars, error_rate=args.error_rate, rate_limit_rate=args.rate_limit_rate, seed=args.seed, truncate_chars=args.truncate_chars)
+        with contextlib.redirect_stdout(sys.stderr):
+            results = run_benchmark(sizes, svc, concurrency=args.concurrency, text_chars=args.text_chars, stream=args.stream, chunked=args.chunked, limits={"rpm": args.rpm} if args.rpm else None, on_progress=print)
+            cols = ("modules", "tree_seconds", "prompts_seconds", "run_seconds", "files_per_second", "p50_latency", "p99_latency", "retries", "errors", "peak_memory_mb")
+            print("  ".join(f"{c:>16}" for c in cols)); [print("  ".join(f"{r[c]:>16}" for c in cols)) for r in results]
+            mismatched = [f"{r['modules']} modules: {', '.join(r['mismatches'])}" for r in results if r["mismatches"]]
+            if mismatched: print("ERROR: Continued outputs differ from the fake service's full answers:\n- " + "\n- ".join(mismatched))
+        text = json.dumps({"settings": {k: v for k, v in vars(args).items() if k not in ("command", "summary_file")}, "results": results}, indent=2); print(text)
+        if args.summary_file:
+            with open(args.summary_file, "w", encoding="utf-8") as f: f.write(text)
+        return 1 if mismatched else 0
+    return 2
+
+
+def profile_startup() -> dict:
+    """Times the GUI start-up steps in this process (seconds). Tk and the widgets are skipped without a display; the SDK
+    imports, which no longer happen at start-up, are timed separately to show what lazy loading saves."""
+    timings = {k: round(v, 4) for k, v in STARTUP_TIMINGS.items()}; notes = []
+    try:
+        started = time.perf_counter(); root = tk.Tk(); timings["tk_init"] = round(time.perf_counter() - started, 4)
+        try:
+            root.withdraw(); started = time.perf_counter(); BlueprintGeneratorApp(root); timings["app_init"] = round(time.perf_counter() - started, 4)
+            timings.update({k: round(STARTUP_TIMINGS[k], 4) for k in ("create_widgets", "initial_form_state") if k in STARTUP_TIMINGS})
+        finally: root.destroy()
+    except tk.TclError as e: notes.append(f"GUI not timed: {e}")
+    for name, available, load in (("openai_sdk_import", openai_available, _load_openai), ("gemini_sdk_import", gemini_available, _load_gemini)):
+        if not available: notes.append(f"{name}: SDK not installed"); continue
+        try: load(); timings[name] = round(STARTUP_TIMINGS[name], 4)
+        except ImportError as e: notes.append(f"{name}: {e}")
+    return {"seconds": timings, "notes": notes}
+
+STARTUP_TIMINGS["module_import"] = time.perf_counter() - _IMPORT_STARTED
+
+
 # --- Entry Point ---
 if __name__ == "__main__":
+    if os.environ.get("BLUEPRINT_DEBUG"): logging.basicConfig(level=logging.DEBUG, format="DEBUG: %(message)s")
+    if len(sys.argv) > 1: sys.exit(main_cli(sys.argv[1:]))
     if not openai_available and not gemini_available: print("ERROR: Install 'openai' and/or 'google-generativeai'.")
     else:
         if not openai_available: print("Warn: 'openai' not found.")